@@ -20,7 +20,8 @@ setuptools.setup(
     long_description=long_description,
     long_description_content_type="text/markdown",
     packages=["topy", "topy.data"],
-    install_requires=['typing', 'pathlib', 'matplotlib', 'sympy', 'numpy<=1.14', 'pyvtk', 'pysparse'],
+    entry_points={"console_scripts": ["topy = topy.__main__:main"]},
+    install_requires=['typing', 'pathlib', 'matplotlib', 'sympy', 'numpy<=1.14', 'scipy', 'pysparse'],
     classifiers=[
         "Programming Language :: Python :: 2",
         "License :: OSI Approved :: MIT License",
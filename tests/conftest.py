@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+"""Shared fixtures: problems from the examples folder, set up and optimised
+with some of their parameters overridden."""
+
+# Import required modules:
+from __future__ import print_function
+from os import path
+
+import pytest
+
+import topy
+from topy.parser import tpd_file2config
+
+EXAMPLES = path.join(path.dirname(path.dirname(path.abspath(__file__))), \
+    "examples")
+BEAM = "mbb_beam/beam_2d_reci.tpd"
+
+
+@pytest.fixture(scope="session")
+def example():
+    # type: () -> callable
+    """example(filename) returns the path of `filename` in the examples
+    folder, independent of the working directory."""
+    def example(filename):
+        return path.join(EXAMPLES, filename)
+    return example
+
+
+@pytest.fixture(scope="session")
+def config(example):
+    # type: (callable) -> callable
+    """config(filename=BEAM, **params) returns the config dictionary of the
+    example at `filename`, with the parameters overridden by `params` (and
+    removed if None)."""
+    def config(filename=BEAM, **params):
+        c = tpd_file2config(example(filename))
+        c.update(params)
+        for key in [key for key in params if params[key] is None]:
+            del c[key]
+        return c
+    return config
+
+
+@pytest.fixture(scope="session")
+def topology(config):
+    # type: (callable) -> callable
+    """topology(filename=BEAM, **params) returns the set up Topology of
+    config(filename, **params)."""
+    def topology(filename=BEAM, **params):
+        t = topy.Topology(config=config(filename, **params))
+        t.set_top_params()
+        return t
+    return topology
+
+
+@pytest.fixture(scope="session")
+def optimise(topology):
+    # type: (callable) -> callable
+    """optimise(filename=BEAM, resume=None, checkpoint=None, **params)
+    optimises topology(filename, **params), resumed from the checkpoint
+    `resume` if given, without saving any output. Return the Topology."""
+    def optimise(filename=BEAM, resume=None, checkpoint=None, **params):
+        t = topology(filename, **params)
+        if resume:
+            t.resume(resume)
+        topy.optimise(t, save=False, background=False, checkpoint=checkpoint)
+        return t
+    return optimise
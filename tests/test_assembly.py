@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+"""Test the assembly of the global stiffness matrix and operator."""
+
+# Import required modules:
+from __future__ import print_function
+
+import numpy as np
+import pytest
+
+from topy.assembly import ElementOperator, StiffnessMatrix, element_dofs
+
+# A small 3D (H8) beam of 2 x 3 x 4 elements, fixed at two corners of
+# the first layer, loaded at the last node:
+BEAM_3D = dict(NUM_ELEM_X=2, NUM_ELEM_Y=3, NUM_ELEM_Z=4, FXTR_NODE_X="1|12",
+               FXTR_NODE_Y="1|12", FXTR_NODE_Z="1|12", LOAD_NODE_Y=60,
+               LOAD_VALU_Y=-1)
+
+
+def reference(t, scale):
+    # type: (object, np.ndarray) -> np.ndarray
+    """The dense constrained stiffness matrix of `t`, assembled element by
+    element like the former (loop) implementation, with the springs if
+    any."""
+    nelz = max(t.nelz, 1)
+    scale = np.reshape(scale, (nelz, t.nely, t.nelx))
+    K = np.zeros((t.alldof.size, t.alldof.size))
+    for elz in range(nelz):
+        for elx in range(t.nelx):
+            for ely in range(t.nely):
+                e2sdofmap = t.e2sdofmapi + t.dofpn * (ely + elx * \
+                    (t.nely + 1) + elz * (t.nelx + 1) * (t.nely + 1))
+                K[np.ix_(e2sdofmap, e2sdofmap)] += scale[elz, ely, elx] * \
+                    t.Ke
+    if t._springs is not None:
+        np.add.at(K, (t._springs[1], t._springs[2]), t._springs[0])
+    return K[np.ix_(t.freedof, t.freedof)]
+
+
+@pytest.mark.parametrize(
+    "filename, params",
+    (
+        ("mbb_beam/beam_2d_reci.tpd", {}), #  Q4
+        ("mbb_beam/beam_3d_exp_gsf.tpd", BEAM_3D), #  H8
+        ("inverter/inverter_2d_eta03.tpd", {}), #  With springs
+    ),
+)
+def test_stiffness_matrix(filename, params, topology):
+    # type: (str, dict, callable) -> None
+    """The connectivity and the matrix assembled with the cached sparsity
+    pattern are those of the element by element assembly, also when the
+    matrix is updated again (the data array is rewritten, not added to)."""
+    t = topology(filename, **params)
+    nel = t.desvars.size
+    edof = np.array([t.e2sdofmapi + t.dofpn * (ely + elx * (t.nely + 1) + \
+        elz * (t.nelx + 1) * (t.nely + 1)) for elz in range(max(t.nelz, 1)) \
+        for ely in range(t.nely) for elx in range(t.nelx)])
+    assert np.array_equal(element_dofs(t.e2sdofmapi, t.dofpn, t.nelx, \
+        t.nely, t.nelz), edof)
+    assert np.array_equal(t.edof, edof)
+    K = StiffnessMatrix(t.edof, t.Ke, t.freedof, t.alldof.size, t._springs)
+    np.random.seed(0)
+    for scale in (0.001 + np.random.rand(nel), np.full(nel, 0.5)):
+        Kref = reference(t, scale)
+        assert np.abs(K.update(scale).toarray() - Kref).max() < \
+            1e-13 * np.abs(Kref).max()
+
+
+@pytest.mark.parametrize(
+    "filename",
+    (
+        "mbb_beam/beam_2d_reci.tpd",
+        "inverter/inverter_2d_eta03.tpd", #  With springs
+        "heat/heat_2d_reci.tpd",
+    ),
+)
+def test_operator(filename, topology):
+    # type: (str, callable) -> None
+    """The matrix-free operator multiplies like the assembled matrix and has
+    the same diagonal."""
+    t = topology(filename)
+    np.random.seed(0)
+    scale = 0.001 + np.random.rand(t.desvars.size)
+    args = (t.edof, t.Ke, t.freedof, t.alldof.size, t._springs)
+    K = StiffnessMatrix(*args).update(scale)
+    op = ElementOperator(*args).update(scale)
+    x = np.random.rand(K.shape[0], 3)
+    tol = 1e-13 * abs(K).dot(abs(x)).max()
+    assert np.abs(op.dot(x[:, 0]) - K.dot(x[:, 0])).max() < tol
+    assert np.abs(op.dot(x) - K.dot(x)).max() < tol
+    assert np.abs(op.diagonal() - K.diagonal()).max() < tol
+
+
+def test_matfree(optimise):
+    # type: (callable) -> None
+    """The matrix-free solver optimises the MBB beam like the direct
+    solver."""
+    designs = []
+    for solver in ("splu", "matfree"):
+        t = optimise(NUM_ITER=20, SOLVER=solver)
+        designs.append((t.objfval, t.desvars))
+    assert designs[1][0] == pytest.approx(designs[0][0], rel=1e-6)
+    assert np.abs(designs[1][1] - designs[0][1]).max() < 1e-5
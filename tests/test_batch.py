@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+"""Test the batch runner (topy batch)."""
+
+# Import required modules:
+from __future__ import print_function
+
+import os
+
+from topy import batch
+
+
+def write_beam(fname, example, nelx, nely, num_iter):
+    # type: (str, callable, int, int, int) -> str
+    """Write the MBB beam with nelx x nely elements, optimised for
+    `num_iter` iterations, to the TPD file `fname`."""
+    nodes = (nelx + 1) * (nely + 1)
+    params = {"NUM_ELEM_X": nelx, "NUM_ELEM_Y": nely, "NUM_ITER": num_iter,
+              "FXTR_NODE_X": "1|%d" % (nely + 1), "FXTR_NODE_Y": nodes}
+    with open(example("mbb_beam/beam_2d_reci.tpd")) as f:
+        lines = f.read().splitlines()
+    for k, line in enumerate(lines):
+        key = line.split(":")[0].strip()
+        if key in params:
+            lines[k] = "%s: %s" % (key, params[key])
+    if not os.path.exists(os.path.dirname(fname)):
+        os.makedirs(os.path.dirname(fname))
+    with open(fname, "w") as f:
+        f.write("\n".join(lines) + "\n")
+    return fname
+
+
+def test_run_batch(tmpdir, example, monkeypatch):
+    # type: (..., callable, ...) -> None
+    """The problems are scheduled the most expensive first and their results
+    returned in the order of the files, with errors captured per problem.
+    Files of the same name get output directories of their own, a summary is
+    written and the environment of the caller is left as it was."""
+    fnames = [write_beam(str(tmpdir.join("small", "beam.tpd")), example, 30,
+                         10, 3),
+              write_beam(str(tmpdir.join("large", "beam.tpd")), example, 60,
+                         20, 4),
+              str(tmpdir.join("bad.tpd"))]
+    tmpdir.join("bad.tpd").write("Not a TPD file\n")
+    outdir = str(tmpdir.join("out"))
+    jobs = batch._jobs(fnames, outdir, {})
+    assert [job[0] for job in jobs] == [1, 0, 2]
+    assert [job[2] for job in jobs] == [os.path.join(outdir, name) \
+        for name in ("beam_", "beam", "bad")]
+
+    monkeypatch.setenv("OMP_NUM_THREADS", "3")
+    monkeypatch.delenv("MKL_NUM_THREADS", raising=False)
+    environ = dict(os.environ)
+    results = batch.run_batch(fnames, workers=2, outdir=outdir, save=False)
+    assert dict(os.environ) == environ
+    assert [r["fname"] for r in results] == fnames
+    assert [r["status"] for r in results[:2]] == ["ok", "ok"]
+    assert results[2]["status"].startswith("error")
+    assert [r["iterations"] for r in results] == [3, 4, 0]
+    assert [r["dofs"] for r in results] == [2 * 31 * 11, 2 * 61 * 21, 0]
+    for name in ("beam", "beam_", "bad"):
+        assert os.path.exists(os.path.join(outdir, name, name + ".log"))
+    with open(os.path.join(outdir, batch.SUMMARY)) as f:
+        summary = f.read()
+    assert all(fname in summary for fname in fnames)
+    assert "3 problems (1 failed)" in summary
@@ -0,0 +1,30 @@
+#!/usr/bin/env python
+"""Test checkpointing and resuming optimisations."""
+
+# Import required modules:
+from __future__ import print_function
+
+import numpy as np
+import pytest
+
+
+@pytest.mark.parametrize(
+    "params",
+    (
+        {},
+        {"SOLVER": "mgcg", "PRECON_REUSE": 3, "WARM_START": "extrap"},
+    ),
+)
+def test_resume(params, tmpdir, optimise):
+    # type: (dict, ..., callable) -> None
+    """An optimisation resumed at iteration 15 of 30 ends with exactly the
+    design of the uninterrupted one."""
+    fname = str(tmpdir.join("beam.ckpt.npz"))
+    full = optimise(NUM_ITER=30, **params)
+    optimise(NUM_ITER=15, checkpoint=fname, **params)
+    t = optimise(NUM_ITER=30, resume=fname, **params)
+    assert t.itercount == full.itercount == 30
+    assert np.array_equal(t.desvars, full.desvars)
+    assert t.objfval == full.objfval
+    assert t.solver.stats["total_iterations"] == \
+        full.solver.stats["total_iterations"]
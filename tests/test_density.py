@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+"""Test the density filter and Heaviside projection (FILTER: density)."""
+
+# Import required modules:
+from __future__ import print_function
+
+import numpy as np
+import pytest
+
+import topy
+
+# A small (12 x 4) MBB beam with the density filter:
+SMALL = {"NUM_ELEM_X": "12", "NUM_ELEM_Y": "4", "FXTR_NODE_X": "1|5",
+         "FXTR_NODE_Y": "65", "FILTER": "density", "SOLVER": "splu"}
+
+
+def evaluate(t, x):
+    # type: (topy.Topology, np.ndarray) -> tuple
+    """Return the compliance and the volume (sum of the physical densities)
+    of the design variables x."""
+    t.desvars = x
+    t.xphys = t._physical(x)
+    t.fea()
+    t.sens_analysis()
+    return t.objfval, t.xphys.sum()
+
+
+@pytest.mark.parametrize("params", ({}, {"HEAVISIDE": "4"}))
+def test_sensitivities(params, topology):
+    # type: (dict, callable) -> None
+    """The sensitivities of the compliance and the volume with respect to
+    the design variables equal central finite differences."""
+    t = topology(**dict(SMALL, **params))
+    np.random.seed(0)
+    x = 0.2 + 0.7 * np.random.rand(*t.desvars.shape)
+    evaluate(t, x)
+    t.filter_sens_density()
+    df, dv = t.df.copy(), t.dv.copy()
+    h = 1e-4
+    for e in ((0, 0), (1, 5), (3, 11)):
+        xp, xm = x.copy(), x.copy()
+        xp[e] += h
+        xm[e] -= h
+        (fp, vp), (fm, vm) = evaluate(t, xp), evaluate(t, xm)
+        assert (fp - fm) / (2 * h) == pytest.approx(df[e], rel=1e-6)
+        assert (vp - vm) / (2 * h) == pytest.approx(dv[e], rel=1e-6)
+
+
+def test_physical(topology):
+    # type: (callable) -> None
+    """Without projection, the physical densities are the weighted means of
+    the design variables."""
+    t = topology(**SMALL)
+    np.random.seed(0)
+    x = np.random.rand(*t.desvars.shape)
+    filt = topy.filters.get_filter(12, 4, 0, t.filtrad, "matrix")
+    Hx = filt.H.dot(x.ravel()) / filt.H.sum(axis=1).A.ravel()
+    assert np.abs(t._physical(x) - Hx.reshape(x.shape)).max() < 1e-14
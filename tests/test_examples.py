@@ -16,7 +16,9 @@ import topy
     group="param:filename", max_time=10, min_rounds=1,
 )
 @pytest.mark.parametrize(
-    "filename", (str(filename) for filename in Path("examples").rglob("*.tpd"))
+    "filename",
+    (str(filename) for filename in \
+        (Path(__file__).parent.parent / "examples").rglob("*.tpd")),
 )
 def test_optimise(filename, benchmark):
     # type: (str) -> None
@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+"""Test the sensitivity filters."""
+
+# Import required modules:
+from __future__ import print_function
+
+import numpy as np
+import pytest
+
+from topy import filters
+
+
+def test_cache_bounded():
+    # type: () -> None
+    """The filter cache keeps the CACHE_SIZE most recently used filters."""
+    first = filters.get_filter(20, 10, 0, 1.5)
+    for i in range(filters.CACHE_SIZE + 2):
+        filters.get_filter(20, 10, 0, 1.6 + 0.1 * i)
+        filters.get_filter(20, 10, 0, 1.5) #  Used again, so kept
+    assert len(filters._CACHE) <= filters.CACHE_SIZE
+    assert filters.get_filter(20, 10, 0, 1.5) is first
+    assert (20, 10, 0, 1.6, 'matrix') not in filters._CACHE
+
+
+def reference(v, filtrad):
+    # type: (np.ndarray, float) -> np.ndarray
+    """The weighted sums of v by the definition of the filter: the weights
+    of all pairs of elements closer than `filtrad` (a loop over pairs)."""
+    idx = np.argwhere(np.ones(v.shape))
+    Hv = np.zeros(v.shape)
+    for e in idx:
+        dist = np.sqrt(((idx - e) ** 2).sum(axis=1))
+        Hv[tuple(e)] = (np.maximum(0, filtrad - dist) * v.ravel()).sum()
+    return Hv
+
+
+@pytest.mark.parametrize("shape", ((0, 9, 13), (5, 6, 7)))
+@pytest.mark.parametrize("filtrad", (1.5, 2.6))
+def test_methods(shape, filtrad):
+    # type: (tuple, float) -> None
+    """All filter methods compute the weighted sums of the definition, to
+    round-off (1e-14 relative)."""
+    nelz, nely, nelx = shape
+    np.random.seed(0)
+    v = np.random.rand(*(shape[1:] if nelz == 0 else shape))
+    Hv = reference(v, filtrad)
+    for method in sorted(filters.FILTERS):
+        filt = filters.FILTERS[method](nelx, nely, nelz, filtrad)
+        assert np.abs(filt.apply(v) - Hv).max() < 1e-14 * Hv.max()
+        assert np.abs(filt.Hs - reference(np.ones(v.shape), filtrad)).max() \
+            < 1e-14 * Hv.max()
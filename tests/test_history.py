@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+"""Test the optimisation history."""
+
+# Import required modules:
+from __future__ import print_function
+
+import numpy as np
+import pytest
+
+import topy
+from topy import history as history_module
+from topy.history import BACKENDS, History, load_history
+
+h5py = history_module.h5py
+
+
+@pytest.fixture(params=BACKENDS)
+def backend(request, monkeypatch):
+    # type: (...) -> str
+    """The history backend: 'hdf5', or 'npz' as if h5py isn't installed."""
+    if request.param == "hdf5" and h5py is None:
+        pytest.skip("h5py is not installed")
+    if request.param == "npz":
+        monkeypatch.setattr(history_module, "h5py", None)
+    return request.param
+
+
+def run(t, fname, resume=None):
+    # type: (topy.Topology, str, str) -> topy.Topology
+    """Optimise `t`, resumed from the checkpoint `resume` if given, with its
+    history written to `fname`, and return it."""
+    if resume:
+        t.resume(resume)
+    topy.optimise(t, save=False, background=False, history=fname, \
+        checkpoint=None if resume else fname + ".ckpt.npz")
+    return t
+
+
+def test_round_trip(backend, tmpdir, topology):
+    # type: (str, ..., callable) -> None
+    """The history of an optimisation is read back with load_history, also
+    if it was written to npz files because h5py isn't installed."""
+    fname = str(tmpdir.join("beam.h5"))
+    t = run(topology(NUM_ITER=4), fname)
+    if backend == "npz": #  The directory beam, without the extension
+        assert tmpdir.join("beam").check(dir=1)
+        assert not tmpdir.join("beam.h5").check()
+    with load_history(fname) as history:
+        assert history.backend == backend
+        assert len(history) == 4
+        last = history[-1]
+        assert set(t.iteration_stats()) | {"desvars", "df"} == set(last)
+        assert np.array_equal(last["desvars"], t.desvars)
+        assert np.array_equal(last["df"], t.df)
+        assert last["objfval"] == t.objfval
+        assert history[-4]["iteration"] == history[0]["iteration"] == 1
+        for i in (4, -5):
+            with pytest.raises(IndexError):
+                history[i]
+        assert list(history.stats["iteration"]) == [1, 2, 3, 4]
+        assert [r["iteration"] for r in history] == [1, 2, 3, 4]
+
+
+def test_resume(backend, tmpdir, topology):
+    # type: (str, ..., callable) -> None
+    """A resumed optimisation keeps the records up to the iteration of its
+    checkpoint and replaces the later ones with its own."""
+    fname = str(tmpdir.join("beam.h5"))
+    run(topology(NUM_ITER=4), fname)
+    with load_history(fname) as history:
+        first = [r["desvars"] for r in history]
+    run(topology(NUM_ITER=6), fname, resume=fname + ".ckpt.npz")
+    with load_history(fname) as history:
+        assert len(history) == 6
+    t = run(topology(NUM_ITER=5), fname, resume=fname + ".ckpt.npz")
+    with load_history(fname) as history:
+        assert list(history.stats["iteration"]) == [1, 2, 3, 4, 5]
+        for i in range(4):
+            assert np.array_equal(history[i]["desvars"], first[i])
+        assert np.array_equal(history[-1]["desvars"], t.desvars)
+
+
+@pytest.mark.skipif(h5py is None, reason="h5py is not installed")
+def test_hdf5_stats_float64(tmpdir, optimise):
+    # type: (..., callable) -> None
+    """The statistics are stored as float64, also if their first value is
+    an integer, and the design variables in their own type."""
+    t = optimise(NUM_ITER=2)
+    fname = str(tmpdir.join("beam.h5"))
+    with History(fname, backend="hdf5") as history:
+        t.p, t.stats = 3, {}
+        history.append(t)
+        t.p, t.stats = 3.5, {}
+        history.append(t)
+    with h5py.File(fname, "r") as f:
+        assert f["p"].dtype == np.float64
+        assert f["iteration"].dtype == np.float64
+        assert f["desvars"].dtype == t.desvars.dtype
+    assert list(load_history(fname).stats["p"]) == [3, 3.5]
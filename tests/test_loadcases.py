@@ -0,0 +1,48 @@
+#!/usr/bin/env python
+"""Test multiple load cases, solved as a block of right hand sides."""
+
+# Import required modules:
+from __future__ import print_function
+
+import numpy as np
+import pytest
+
+from topy.solvers import get_solver
+
+
+@pytest.mark.parametrize("solver", ("splu", "cg", "mgcg", "minres"))
+@pytest.mark.parametrize("ncases", (2, 3))
+def test_block_solve(solver, ncases, topology):
+    # type: (str, int, callable) -> None
+    """A block of right hand sides is solved like its columns one at a
+    time."""
+    t = topology()
+    np.random.seed(0)
+    K = t._Kfree.update(0.001 + np.random.rand(t.desvars.size))
+    b = np.random.rand(K.shape[0], ncases)
+    s = get_solver(solver)
+    s.set_grid(t.nelx, t.nely, t.nelz, t.dofpn, t.freedof)
+    s.setup(K)
+    x = np.zeros_like(b)
+    s.solve(b, x)
+    for k in range(ncases):
+        xk = np.zeros(K.shape[0])
+        s.solve(b[:, k].copy(), xk)
+        assert np.abs(x[:, k] - xk).max() < 1e-10 * np.abs(xk).max()
+
+
+def test_objective(topology):
+    # type: (callable) -> None
+    """The objective and sensitivities of two load cases are the weighted
+    sums of those of the load cases on their own."""
+    case2 = {"LOAD_NODE_Y": "631", "LOAD_VALU_Y": "-2"}
+    t = topology(LOAD_NODE_Y_2=case2["LOAD_NODE_Y"],
+                 LOAD_VALU_Y_2=case2["LOAD_VALU_Y"], LOAD_WEIGHT="1; 0.5")
+    singles = [topology(), topology(**case2)]
+    for s in [t] + singles:
+        s.fea()
+        s.sens_analysis()
+    objfval = singles[0].objfval + 0.5 * singles[1].objfval
+    df = singles[0].df + 0.5 * singles[1].df
+    assert t.objfval == pytest.approx(objfval, rel=1e-10)
+    assert np.abs(t.df - df).max() < 1e-10 * np.abs(df).max()
@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+"""Test the Method of Moving Asymptotes (OPTIMIZER: mma)."""
+
+# Import required modules:
+from __future__ import print_function
+
+import numpy as np
+import pytest
+
+from topy.mma import MMA
+
+C = np.array([1.0, 2.0, 3.0, 4.0])
+
+
+def minimise(A, b, num_iter=40):
+    # type: (np.ndarray, np.ndarray, int) -> tuple
+    """Minimise sum(C / x) such that A x <= b and 0.01 <= x <= 1 with MMA,
+    the constraints scaled to A x / b - 1 <= 0. Return the optimiser and x."""
+    opt = MMA(C.size, b.size, 0.01, 1.0)
+    x = np.full(C.size, 0.5)
+    for _ in range(num_iter):
+        x = opt.update(x, - C / x ** 2, A.dot(x) / b - 1, A / b[:, None])
+    return opt, x
+
+
+def test_analytic():
+    # type: () -> None
+    """With one (volume) constraint, MMA finds the analytic optimum, x
+    proportional to sqrt(C)."""
+    opt, x = minimise(np.ones((1, C.size)), np.array([2.0]))
+    assert np.abs(x - 2 * np.sqrt(C) / np.sqrt(C).sum()).max() < 1e-8
+
+
+def test_constraints():
+    # type: () -> None
+    """With two active constraints, MMA satisfies the KKT conditions."""
+    A = np.array([[1.0, 1.0, 1.0, 1.0], [0.0, 0.0, 1.0, 1.0]])
+    b = np.array([2.0, 0.9])
+    opt, x = minimise(A, b)
+    g = A.dot(x) / b - 1
+    assert (g < 1e-8).all()
+    assert (opt.lam > 0).all()
+    assert np.abs(opt.lam * g).max() < 1e-8
+    grad = - C / x ** 2 + (A / b[:, None]).T.dot(opt.lam)
+    assert np.abs(grad).max() < 1e-6 * np.abs(C / x ** 2).max()
+
+
+def test_beam(optimise):
+    # type: (callable) -> None
+    """With the density filter, MMA meets the volume constraint and ends at
+    a lower compliance than OC after 60 iterations."""
+    mma, oc = [optimise(NUM_ITER=60, FILTER="density", OPTIMIZER=optimizer)
+               for optimizer in ("mma", "oc")]
+    assert mma.xphys.mean() <= mma.volfrac + 1e-6
+    assert mma.objfval < oc.objfval
+
+
+def test_chg_stop(topology):
+    # type: (callable) -> None
+    """MMA with the sensitivity filter needs NUM_ITER: its change may not
+    settle below CHG_STOP."""
+    with pytest.raises(ValueError):
+        topology(NUM_ITER=None, CHG_STOP="0.01", OPTIMIZER="mma")
+    t = topology(NUM_ITER=None, CHG_STOP="0.01", OPTIMIZER="mma",
+                 FILTER="density")
+    assert t.chgstop == 0.01
@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+"""Test the multi-resolution (coarse-to-fine) continuation (MULTIRES)."""
+
+# Import required modules:
+from __future__ import print_function
+
+import numpy as np
+import pytest
+
+import topy
+from topy.multires import coarse_topydict, prolongate, stage_factors
+
+
+@pytest.mark.parametrize(
+    "factor, factors",
+    ((2, [2]), (4, [4, 2]), (3, ValueError), (8, ValueError)),
+)
+def test_stage_factors(factor, factors, topology):
+    # type: (int, object, callable) -> None
+    """MULTIRES is split into stages halving the coarsening factor. It must
+    be a power of 2 that divides the number of elements (60 x 20)."""
+    t = topology(MULTIRES=factor)
+    if factors is ValueError:
+        with pytest.raises(ValueError):
+            stage_factors(t.topydict)
+    else:
+        assert stage_factors(t.topydict) == factors
+
+
+def test_coarse_topydict(topology):
+    # type: (callable) -> None
+    """The fixed and loaded nodes are moved to the nearest coarse nodes,
+    loads on the same coarse node added, and coarse elements that are at
+    least half passive are passive."""
+    # Loads on the top three nodes of the left edge, the top left element
+    # and its neighbours passive, one element active:
+    t = topology(LOAD_NODE_Y="1|3", LOAD_VALU_Y="-1@3",
+                 PASV_ELEM="1; 2; 21; 22", ACTV_ELEM="41", MULTIRES=2)
+    d = coarse_topydict(t, 2)
+    # The beam of 30 x 10 elements, fixed at the same (coarse) nodes:
+    ref = topology(NUM_ELEM_X=30, NUM_ELEM_Y=10, FXTR_NODE_X="1|11",
+                   FXTR_NODE_Y="341")
+    assert (d["NUM_ELEM_X"], d["NUM_ELEM_Y"]) == (30, 10)
+    assert np.array_equal(d["FIX_DOF"], ref.topydict["FIX_DOF"])
+    # Nodes 2 and 3 are both nearest to coarse node 2:
+    assert list(d["LOAD_DOF"]) == [1, 3]
+    assert list(d["LOAD_VAL"]) == [-1, -2]
+    assert d["LOAD_VAL"].sum() == t.loadval.sum()
+    assert list(d["PASV_ELEM"]) == [0]
+    assert d["ACTV_ELEM"].size == 0
+    assert d["NUM_ITER"] == t.numiter // 2
+    coarse = topy.Topology(topydict=d)
+    coarse.set_top_params()
+
+
+def test_prolongate(topology):
+    # type: (callable) -> None
+    """Prolongation doubles the shape of the design and repeats every
+    coarse value over the fine elements in it, so a constant design stays
+    constant."""
+    fine = topology(MULTIRES=2)
+    coarse = topy.Topology(topydict=coarse_topydict(fine, 2))
+    coarse.set_top_params()
+    coarse.desvars = np.full(coarse.desvars.shape, 0.3)
+    prolongate(coarse, fine)
+    assert fine.desvars.shape == (20, 60) == \
+        tuple(2 * n for n in coarse.desvars.shape)
+    assert np.all(fine.desvars == 0.3)
+    np.random.seed(0)
+    coarse.desvars = np.random.rand(*coarse.desvars.shape)
+    prolongate(coarse, fine)
+    for i, j in ((0, 0), (0, 1), (1, 0), (1, 1)):
+        assert np.array_equal(fine.desvars[i::2, j::2], coarse.desvars)
+
+
+def test_beam(optimise):
+    # type: (callable) -> None
+    """The MBB beam optimised on the grid coarsened twice for half of
+    NUM_ITER, then on its own grid, ends at about the compliance of the
+    single grid run, after NUM_ITER iterations in total."""
+    single = optimise(NUM_ITER=60)
+    multi = optimise(NUM_ITER=60, MULTIRES=2)
+    assert multi.itercount == single.itercount == 60
+    assert multi.objfval == pytest.approx(single.objfval, rel=0.02)
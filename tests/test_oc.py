@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+"""Test the optimality criteria (OC) update of the design variables."""
+
+# Import required modules:
+from __future__ import print_function
+
+import numpy as np
+import pytest
+
+from topy import topology as topology_module
+from topy.topology import LAM_MAX, LAM_MIN, LAM_STEP
+
+
+def test_oc_volume(topology, monkeypatch):
+    # type: (callable, ...) -> None
+    """The updated design of the MBB beam meets the volume constraint, and
+    the search of the Lagrange multiplier starts from the previous one."""
+    brackets = []
+    search = topology_module.brentq
+
+    def brentq(f, a, b, **kwargs):
+        brackets.append((a, b))
+        return search(f, a, b, **kwargs)
+
+    monkeypatch.setattr(topology_module, "brentq", brentq)
+    t = topology()
+    for _ in range(3):
+        lam = t.lam
+        t.fea()
+        t.sens_analysis()
+        t.update_desvars_oc()
+        assert abs(t.xphys.sum() - t.volfrac * t.xphys.size) < 1e-5
+        if lam is not None: #  Within a factor 2 of the previous multiplier
+            assert brackets[-1] == pytest.approx((np.log(lam) - LAM_STEP, \
+                np.log(lam) + LAM_STEP))
+    assert len(brackets) == 3
+
+
+@pytest.mark.parametrize(
+    "start, desvars, lam",
+    (
+        (0.2, 0.4, LAM_MIN), #  Constraint inactive, all at the upper bound
+        (0.9, 0.7, LAM_MAX), #  Constraint can't be met, all at the lower one
+    ),
+)
+def test_oc_bounds(start, desvars, lam, topology):
+    # type: (float, float, float, callable) -> None
+    """When no multiplier gives the allowed volume within the move limits
+    (0.2), the search ends at the end of its range and every element moves
+    by the move limit."""
+    t = topology()
+    t.desvars = np.full(t.desvars.shape, start)
+    t.xphys = t._physical(t.desvars)
+    t.fea()
+    t.sens_analysis()
+    t.update_desvars_oc()
+    assert t.lam == pytest.approx(lam)
+    assert np.allclose(t.desvars, desvars)
+    assert np.allclose(t.xphys, desvars)
@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+"""Test the output schedule and the background writer."""
+
+# Import required modules:
+from __future__ import print_function
+
+import os
+import threading
+import time
+
+import numpy as np
+
+import topy
+from topy import optimisation
+from topy.output import POLL, BackgroundWriter, OutputSchedule, remove_files
+
+
+def test_schedule_threshold():
+    # type: () -> None
+    """Threshold snapshots are told apart from the regular ones."""
+    schedule = OutputSchedule(every=2, thresholds=(0.1,))
+    assert schedule.due(1, 0.5) is False
+    assert schedule.due(2, 0.5) == "every"
+    assert schedule.due(3, 0.05) == "threshold"
+    assert schedule.due(4, 0.01) == "every"
+
+
+def test_schedule_retention():
+    # type: () -> None
+    """The files of the oldest written iterations expire, except those of
+    multiples of keep_every; without keep_last and keep_every all are
+    kept."""
+    schedule = OutputSchedule(keep_last=2, keep_every=3)
+    expired = [schedule.written(i) for i in range(1, 9)]
+    assert expired == [[], [], [1], [2], [], [4], [5], []]
+    assert schedule._written == [7, 8]
+    schedule = OutputSchedule(keep_every=3) #  keep_last is 1
+    assert [schedule.written(i) for i in (3, 4, 5)] == [[], [], [4]]
+    schedule = OutputSchedule()
+    assert [schedule.written(i) for i in range(1, 5)] == [[]] * 4
+
+
+def test_optimise_retention(tmpdir, topology, monkeypatch):
+    # type: (..., callable, ...) -> None
+    """optimise leaves the files of the last keep_last written iterations and
+    of multiples of keep_every on disk. A snapshot whose file wasn't written
+    (iteration 3, as if dropped) expires without an error."""
+    def create_2d_imag(x, prefix, iternum, time, filetype, dir):
+        if iternum != 3:
+            open(os.path.join(dir, "%s_%03d.%s" % (prefix, iternum, \
+                filetype)), "w").close()
+
+    monkeypatch.setattr(optimisation, "create_2d_imag", create_2d_imag)
+    t = topology(NUM_ITER=10)
+    topy.optimise(t, dir=str(tmpdir), background=False, keep_last=2, \
+        keep_every=4)
+    assert sorted(os.listdir(str(tmpdir))) == ["%s_%03d.png" % (t.probname, \
+        i) for i in (4, 8, 9, 10)]
+
+
+def test_remove_files(tmpdir):
+    # type: (...) -> None
+    """Files that don't exist (dropped snapshots) are skipped."""
+    fnames = [str(tmpdir.join(name)) for name in ("a.png", "b.png")]
+    open(fnames[1], "w").close()
+    remove_files(fnames)
+    assert tmpdir.listdir() == []
+
+
+def test_writer_blocks():
+    # type: () -> None
+    """By default, a full queue blocks and no snapshot is dropped."""
+    written = []
+    with BackgroundWriter(maxsize=1) as writer:
+        for i in range(5):
+            assert writer.submit(lambda x: (time.sleep(0.01), \
+                written.append(x)), np.array(i))
+    assert writer.stats["dropped"] == 0
+    assert written == list(range(5))
+
+
+def test_writer_drops():
+    # type: () -> None
+    """With policy 'drop', snapshots are dropped (and counted) unless
+    submitted with block=True."""
+    written = []
+    with BackgroundWriter(maxsize=1, policy="drop") as writer:
+        for i in range(5):
+            writer.submit(lambda x: (time.sleep(0.05), written.append(x)), i)
+        assert writer.submit(written.append, -1, block=True)
+    assert writer.stats["dropped"] > 0
+    assert len(written) + writer.stats["dropped"] == 6
+    assert written[-1] == -1
+
+
+def test_writer_process(tmpdir):
+    # type: (...) -> None
+    """A worker process writes (here: removes) the submitted files."""
+    fnames = [str(tmpdir.join("%d.png" % i)) for i in range(3)]
+    for fname in fnames:
+        open(fname, "w").close()
+    with BackgroundWriter(process=True) as writer:
+        for fname in fnames:
+            assert writer.submit(remove_files, [fname])
+    assert writer.stats == {"written": 3, "dropped": 0, "errors": 0}
+    assert not any(os.path.exists(fname) for fname in fnames)
+
+
+def test_writer_process_dead():
+    # type: () -> None
+    """If the worker process dies with a full queue, a blocking submit
+    returns (False) instead of waiting forever, and the snapshots it didn't
+    write are counted as dropped."""
+    writer = BackgroundWriter(maxsize=1, process=True)
+    assert writer.submit(time.sleep, 60) #  Being written ...
+    time.sleep(0.5)
+    assert writer.submit(time.sleep, 0) #  ... and queued when killed
+    writer._worker.terminate()
+    writer._worker.join()
+    results = []
+    thread = threading.Thread(target=lambda: results.append( \
+        writer.submit(time.sleep, 0, block=True)))
+    thread.start()
+    thread.join(10 * POLL)
+    assert not thread.is_alive()
+    assert results == [False]
+    writer.close()
+    assert writer.stats == {"written": 0, "dropped": 3, "errors": 0}
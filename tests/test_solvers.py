@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+"""Test the linear solvers and preconditioners."""
+
+# Import required modules:
+from __future__ import print_function
+
+import numpy as np
+import pytest
+
+import topy
+
+
+@pytest.fixture(scope="module")
+def beam(optimise):
+    # type: (callable) -> topy.Topology
+    """The MBB beam optimised with the direct solver."""
+    return optimise(NUM_ITER=40, SOLVER="splu")
+
+
+@pytest.mark.parametrize(
+    "params",
+    (
+        {"SOLVER": "cg", "PRECON": "bogus"},
+        {"SOLVER": "splu", "PRECON": "jacobi"},
+        {"SOLVER": "mgcg", "PRECON": "jacobi"},
+        {"SOLVER": "matfree", "PRECON": "ilu"},
+    ),
+)
+def test_precon_refused(params, topology):
+    # type: (dict, callable) -> None
+    """An unknown preconditioner, or one given to a solver that doesn't take
+    it, is refused when the parameters are set."""
+    with pytest.raises(ValueError):
+        topology(**params)
+
+
+def test_ilu_symmetric(topology):
+    # type: (callable) -> None
+    """The incomplete Cholesky preconditioner is symmetric."""
+    t = topology()
+    np.random.seed(0)
+    t.desvars = t.xphys = 0.01 + 0.99 * np.random.rand(*t.desvars.shape) ** 3
+    K = t._Kfree.update(t._kscale()).tocsr()
+    M = topy.solvers.ilu(K)
+    a, b = np.random.rand(2, K.shape[0])
+    assert abs(a.dot(M(b)) - b.dot(M(a))) <= 1e-10 * abs(a.dot(M(b)))
+
+
+def test_ilu_cg(beam, optimise):
+    # type: (topy.Topology, callable) -> None
+    """CG with the incomplete Cholesky preconditioner optimises the MBB beam
+    like the direct solver."""
+    t = optimise(NUM_ITER=40, SOLVER="cg", PRECON="ilu")
+    assert t.objfval == pytest.approx(beam.objfval, rel=1e-6)
+    assert np.abs(t.desvars - beam.desvars).max() < 1e-5
+
+
+@pytest.mark.parametrize(
+    "params",
+    (
+        {"SOLVER": "cg", "PRECON": "jacobi", "PRECON_REUSE": 5},
+        {"SOLVER": "cg", "PRECON": "ssor", "PRECON_REUSE": 5},
+        {"SOLVER": "mgcg", "PRECON_REUSE": 3},
+        {"SOLVER": "mgcg", "PRECON_REUSE": 5, "PRECON_DEGRADE": 1.5},
+        {"SOLVER": "cg", "WARM_START": "extrap", "PRECON_REUSE": 2},
+    ),
+)
+def test_precon_reuse(params, beam, optimise):
+    # type: (dict, topy.Topology, callable) -> None
+    """An optimisation with a re-used preconditioner finishes (stale
+    preconditioners are rebuilt) with the same design."""
+    t = optimise(NUM_ITER=40, **params)
+    assert t.itercount == 40
+    assert t.solver.stats["rebuilds"] < 40
+    assert t.objfval == pytest.approx(beam.objfval, rel=1e-6)
+    assert np.abs(t.desvars - beam.desvars).max() < 1e-5
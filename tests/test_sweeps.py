@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+"""Test the parameter sweep (topy.sweep)."""
+
+# Import required modules:
+from __future__ import print_function
+
+import os
+
+import numpy as np
+
+import topy
+from topy import sweeps
+
+
+def test_sweep(tmpdir, example, optimise, monkeypatch):
+    # type: (..., callable, callable, ...) -> None
+    """The variants of a 2 x 2 grid, optimised concurrently, end with the
+    designs of standalone optimisations. They share the mesh data but not
+    the values of their stiffness matrices, and each logs to its own
+    file."""
+    topologies = []
+
+    class Topology(topy.Topology):
+        def __init__(self, *args, **kwargs):
+            topy.Topology.__init__(self, *args, **kwargs)
+            topologies.append(self)
+
+    monkeypatch.setattr(sweeps, "Topology", Topology)
+    outdir = str(tmpdir.join("sweep"))
+    grid = {"ETA": [0.4, 0.5], "FILT_RAD": [1.5, 2.5], "NUM_ITER": [20]}
+    results = topy.sweep(example("mbb_beam/beam_2d_reci.tpd"), grid,
+                         workers=4, outdir=outdir)
+    assert [r["status"] for r in results] == ["ok"] * 4
+    assert [(r["ETA"], r["FILT_RAD"]) for r in results] == \
+        [(0.4, 1.5), (0.4, 2.5), (0.5, 1.5), (0.5, 2.5)]
+    assert len(topologies) == 4
+    for t in topologies:
+        variant = (t.topydict["ETA"], t.filtrad)
+        i = [(str(r["ETA"]), r["FILT_RAD"]) for r in results].index(variant)
+        alone = optimise(NUM_ITER=20, ETA=results[i]["ETA"],
+                         FILT_RAD=results[i]["FILT_RAD"])
+        assert t.itercount == results[i]["iterations"] == 20
+        assert np.array_equal(t.desvars, alone.desvars)
+        assert t.edof is topologies[0].edof
+        assert t.freedof is topologies[0].freedof
+        if t is not topologies[0]:
+            assert not np.shares_memory(t._Kfree.K.data,
+                                        topologies[0]._Kfree.K.data)
+        # The log of the variant has its own parameters only:
+        name = "%03d" % i
+        with open(os.path.join(outdir, name, name + ".log")) as f:
+            log = f.read()
+        assert "(FILT_RAD) = {}".format(t.filtrad) in log
+        assert log.count("(FILT_RAD) =") == 1
+    assert os.path.exists(os.path.join(outdir, sweeps.SUMMARY))
@@ -0,0 +1,46 @@
+#!/usr/bin/env python
+"""Test the reduction of symmetric problems (SYMMETRY)."""
+
+# Import required modules:
+from __future__ import print_function
+
+import numpy as np
+import pytest
+
+import topy
+
+# The whole (symmetric) MBB beam, 120 x 20 elements with a load at the middle
+# of the top and supports at the bottom corners:
+WHOLE = {"NUM_ELEM_X": "120", "FXTR_NODE_X": "21; 2541",
+         "FXTR_NODE_Y": "21; 2541", "LOAD_NODE_Y": "1261", "NUM_ITER": "30"}
+
+
+@pytest.mark.parametrize(
+    "params, tol",
+    (({"OPTIMIZER": "oc"}, 1e-10), ({"OPTIMIZER": "mma"}, 1e-6)),
+)
+def test_symmetric_part(params, tol, optimise):
+    # type: (dict, float, callable) -> None
+    """The half of the beam is optimised like the whole beam."""
+    full = optimise(**dict(WHOLE, **params))
+    half = optimise(SYMMETRY="x", **dict(WHOLE, **params))
+    assert half.desvars.shape[1] == full.desvars.shape[1] // 2
+    assert np.abs(half.full_domain(half.desvars) - full.desvars).max() < tol
+    assert 2 * half.objfval == pytest.approx(full.objfval, rel=tol)
+
+
+@pytest.mark.parametrize(
+    "params",
+    (
+        {"FXTR_NODE_X": "21"},
+        {"LOAD_NODE_X": "1", "LOAD_VALU_X": "1"},
+        {"LOAD_NODE_X": "1261", "LOAD_VALU_X": "1"},
+        {"PASV_ELEM": "1"},
+    ),
+)
+def test_not_symmetric(params, config):
+    # type: (dict, callable) -> None
+    """A problem that isn't symmetric is refused."""
+    topy.Topology(config=config(SYMMETRY="x", PASV_ELEM="1; 2381", **WHOLE))
+    with pytest.raises(ValueError):
+        topy.Topology(config=config(SYMMETRY="x", **dict(WHOLE, **params)))
@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+"""Test the element-wise computations of Topology (sensitivities, passive
+and active elements) and its iteration statistics."""
+
+# Import required modules:
+from __future__ import print_function
+
+import numpy as np
+import pytest
+
+from topy.topology import SOLID, VOID
+
+# A 3D (H8) beam of 4 x 4 x 4 elements, fixed at the corners of the first
+# layer of nodes and loaded at the last node, with passive elements in its
+# first column and active ones in its last:
+BEAM_3D = dict(NUM_ELEM_X=4, NUM_ELEM_Y=4, NUM_ELEM_Z=4,
+               FXTR_NODE_X="1; 5; 21; 25", FXTR_NODE_Y="1; 5; 21; 25",
+               FXTR_NODE_Z="1; 5; 21; 25", LOAD_NODE_Y=125, LOAD_VALU_Y=-1,
+               PASV_ELEM="1|4", ACTV_ELEM="61|64")
+
+
+@pytest.mark.parametrize(
+    "filename",
+    (
+        "mbb_beam/beam_2d_reci.tpd", #  1200 elements
+        "inverter/inverter_2d_eta03.tpd", #  800 elements, u and v differ
+    ),
+)
+def test_sens_chunk(filename, topology):
+    # type: (str, callable) -> None
+    """The sensitivities computed in blocks of SENS_CHUNK elements, the last
+    block shorter, are those computed all at once."""
+    sens = []
+    for chunk in (None, 7):
+        t = topology(filename, SENS_CHUNK=chunk)
+        assert t.desvars.size % 7
+        t.fea()
+        t.sens_analysis()
+        sens.append((t.objfval, t.df))
+    assert sens[1][0] == sens[0][0]
+    assert np.array_equal(sens[1][1], sens[0][1])
+
+
+@pytest.mark.parametrize(
+    "filename, params",
+    (
+        ("t-piece/t-piece_2d_Q4_eta04_gsf.tpd", {}), #  PASV_ELEM
+        ("mbb_beam/beam_3d_exp_gsf.tpd", BEAM_3D),
+    ),
+)
+def test_pasv_actv(filename, params, topology):
+    # type: (str, dict, callable) -> None
+    """The masks select the numbered elements (Y fastest, then X, then Z),
+    and passive elements stay void and active ones solid while the OC method
+    updates the others."""
+    t = topology(filename, **params)
+    nelx, nely = t.nelx, t.nely
+    for elems, mask in ((t.pasv, t._pasvmask), (t.actv, t._actvmask)):
+        ref = np.zeros((max(t.nelz, 1), nely, nelx), dtype=bool)
+        for n in elems:
+            ref[n // (nelx * nely), n % nely, n % (nelx * nely) // nely] = True
+        if mask is None:
+            assert not ref.any()
+        else:
+            assert np.array_equal(mask, ref.reshape(t.desvars.shape))
+    for _ in range(3):
+        t.fea()
+        t.sens_analysis()
+        t.filter_sens_sigmund()
+        t.update_desvars_oc()
+        if t.pasv.size:
+            assert np.all(t.desvars[t._pasvmask] == VOID)
+        if t.actv.size:
+            assert np.all(t.desvars[t._actvmask] == SOLID)
+    free = ~np.isin(t.desvars, (VOID, SOLID))
+    assert free.any()
+
+
+def test_iteration_stats(topology):
+    # type: (callable) -> None
+    """The statistics are those of the last iteration, computed once per
+    iteration, with the solid plus void fraction a true (not floor)
+    division."""
+    t = topology()
+    for _ in range(3):
+        t.fea()
+        t.sens_analysis()
+        t.filter_sens_sigmund()
+        t.update_desvars_oc()
+        stats = t.iteration_stats()
+        assert t.iteration_stats() is stats
+        assert set(stats) == {"iteration", "objfval", "volume", "change", \
+            "p", "q", "eta", "svtfrac"}
+        assert stats["iteration"] == t.itercount
+        assert stats["objfval"] == t.objfval
+        assert stats["volume"] == t.xphys.mean()
+        assert stats["change"] == t.change
+        assert (stats["p"], stats["q"]) == (t.p, t.q)
+        assert stats["eta"] == np.mean(t.eta)
+        nsv = np.isin(t.desvars, (VOID, SOLID)).sum()
+        assert stats["svtfrac"] == t.svtfrac == pytest.approx( \
+            nsv / float(t.desvars.size))
+    assert t.itercount == 3
+    assert 0 < t.svtfrac < 1
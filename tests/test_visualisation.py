@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+"""Test the VTK writers of 3D designs (legacy VTK, VTK XML image data and
+ParaView data files)."""
+
+# Import required modules:
+from __future__ import print_function
+
+import re
+import zlib
+from xml.etree import ElementTree
+
+import numpy as np
+import pytest
+
+import topy
+from topy import visualisation
+from topy.visualisation import create_3d_geom
+
+
+def design():
+    # type: () -> np.ndarray
+    """A random 3 x 4 x 5 design with some voids (below THRESHOLD)."""
+    np.random.seed(0)
+    x = np.random.rand(3, 4, 5)
+    x[x < 0.3] = 0.0001
+    return x
+
+
+def read_legacy(fname):
+    # type: (str) -> tuple
+    """Return the points, cells, cell types and densities of a binary legacy
+    VTK unstructured grid file."""
+    with open(fname, "rb") as f:
+        s = f.read()
+    arrays = []
+    for pattern, dtype, size in ((br"POINTS (\d+) float\n", ">f4", 3),
+                                 (br"CELLS \d+ (\d+)\n", ">i4", 1),
+                                 (br"CELL_TYPES (\d+)\n", ">i4", 1),
+                                 (br"LOOKUP_TABLE default\n", ">f8", None)):
+        m = re.search(pattern, s)
+        count = int(m.group(1)) * size if size else arrays[-1].size
+        arrays.append(np.frombuffer(s, dtype, count, m.end()))
+    points, cells, types, densities = arrays
+    return points.reshape(-1, 3), cells.reshape(-1, 9), types, densities
+
+
+def test_legacy_vtk(tmpdir):
+    # type: (...) -> None
+    """The legacy file has the voxels above THRESHOLD, in the order and with
+    the node order of the former (per voxel) writer, and neighbouring voxels
+    share their nodes."""
+    x = design()
+    fname = str(tmpdir.join("beam_001.vtk"))
+    create_3d_geom(x, prefix="beam", iternum=1, time="none",
+                   dir=str(tmpdir))
+    points, cells, types, densities = read_legacy(fname)
+    mask = x > 0.001
+    assert np.array_equal(densities, x[mask])
+    assert (types == 11).all() and (cells[:, 0] == 8).all()
+    # The corners of the voxels, from (-, -, -) to (+, +, +), first index
+    # fastest, as the former writer wrote them (8 points per voxel):
+    local = 0.5 * np.array([[-1, -1, -1], [1, -1, -1], [-1, 1, -1],
+                            [1, 1, -1], [-1, -1, 1], [1, -1, 1],
+                            [-1, 1, 1], [1, 1, 1]])
+    corners = np.argwhere(mask)[:, None, :] + local
+    assert np.array_equal(points[cells[:, 1:]], corners)
+    # Every corner once:
+    assert len(points) == len(np.unique(corners.reshape(-1, 3), axis=0))
+    assert len(points) < 8 * mask.sum()
+
+
+@pytest.mark.parametrize("compress", (False, True))
+def test_vti(compress, tmpdir, monkeypatch):
+    # type: (bool, ..., ...) -> None
+    """The appended data of the image data file (header and raw or zlib
+    compressed blocks) decode to the densities, X changing fastest."""
+    monkeypatch.setattr(visualisation, "VTK_BLOCK", 64) #  Several blocks
+    x = design()
+    fname = str(tmpdir.join("beam_001.vti"))
+    create_3d_geom(x, prefix="beam", iternum=1, time="none", filetype="vti",
+                   compress=compress, dir=str(tmpdir))
+    with open(fname, "rb") as f:
+        s = f.read()
+    tag = b"<AppendedData encoding=\"raw\">\n   _"
+    start = s.index(tag)
+    appended = s[start + len(tag):s.rindex(b"\n  </AppendedData>")]
+    head = ElementTree.fromstring(s[:start] + b"</VTKFile>")
+    assert head.find("ImageData").get("WholeExtent") == "0 3 0 4 0 5"
+    if compress:
+        assert head.get("compressor") == "vtkZLibDataCompressor"
+        nblocks, block, last = np.frombuffer(appended, "<u8", 3)
+        sizes = np.frombuffer(appended, "<u8", nblocks, 24)
+        assert nblocks > 1 and block == 64
+        offset = 24 + 8 * nblocks
+        data = b""
+        for size in sizes:
+            data += zlib.decompress(appended[offset:offset + size])
+            offset += size
+        assert offset == len(appended)
+        assert len(data) == (nblocks - 1) * block + last
+    else:
+        assert head.get("compressor") is None
+        nbytes = np.frombuffer(appended, "<u8", 1)[0]
+        data = appended[8:]
+        assert nbytes == len(data)
+    values = np.frombuffer(data, "<f4").reshape(x.shape[::-1]).T
+    assert np.array_equal(values, x.astype(np.float32))
+
+
+def test_pvd(tmpdir, topology):
+    # type: (..., callable) -> None
+    """Optimising with 'vti' files writes a PVD file listing the written
+    iterations as timesteps."""
+    t = topology("mbb_beam/beam_3d_exp_gsf.tpd", NUM_ITER=4, SOLVER="mgcg")
+    topy.optimise(t, dir=str(tmpdir), background=False, every=2,
+                  filetype="vti")
+    pvd = ElementTree.parse(str(tmpdir.join(t.probname + ".pvd"))).getroot()
+    datasets = pvd.find("Collection").findall("DataSet")
+    assert [d.get("timestep") for d in datasets] == ["2", "4"]
+    for d in datasets:
+        assert d.get("file") == "%s_%03d.vti" % (t.probname, \
+            int(d.get("timestep")))
+        assert tmpdir.join(d.get("file")).check()
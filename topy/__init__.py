@@ -9,6 +9,8 @@ from .topology import *
 from .visualisation import *
 from .elements import *
 from .optimisation import *
+from .history import *
+from .sweeps import *
 
 __version__ = "0.4.0"
 __author__  = "William Hunter <whunter.za at gmail dot com>"
@@ -17,5 +19,7 @@ __all__ = (
 	topology.__all__ +
 	visualisation.__all__ +
 	elements.__all__ +
-	optimisation.__all__
+	optimisation.__all__ +
+	history.__all__ +
+	sweeps.__all__
 )
@@ -0,0 +1,50 @@
+"""
+# =============================================================================
+# Command line interface of ToPy:
+#
+#     topy batch [-j WORKERS] [--threads THREADS] [--out DIR] PATH [PATH ...]
+#
+# or 'python -m topy batch ...', see batch.py.
+#
+# Author: William Hunter
+# Copyright (C) 2008, 2015, William Hunter.
+# =============================================================================
+"""
+import sys
+import argparse
+
+from .batch import run_batch, find_tpd_files, THREADS
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='topy', description='Topology '
+                                     'optimisation with Python.')
+    commands = parser.add_subparsers(dest='command')
+    batch = commands.add_parser('batch', help='optimise many TPD files in '
+                                'parallel')
+    batch.add_argument('paths', nargs='+', metavar='PATH', help='TPD file, '
+                       'or directory searched recursively for TPD files')
+    batch.add_argument('-j', '--workers', type=int, help='number of worker '
+                       'processes (default: number of CPUs / threads)')
+    batch.add_argument('--threads', type=int, default=THREADS, help='BLAS '
+                       'threads per worker (default: %(default)s)')
+    batch.add_argument('--out', default='./batch', help='output directory '
+                       '(default: %(default)s)')
+    batch.add_argument('--every', type=int, default=0, help='write every Nth '
+                       'iteration (default: final design only)')
+    batch.add_argument('--no-save', action='store_true', help="don't write "
+                       'images or geometry')
+    args = parser.parse_args(argv)
+    if args.command != 'batch':
+        parser.print_help()
+        return 2
+    fnames = find_tpd_files(args.paths)
+    if not fnames:
+        parser.error('no TPD files found')
+    results = run_batch(fnames, workers=args.workers, threads=args.threads, \
+        outdir=args.out, every=args.every, save=not args.no_save)
+    return int(any(r['status'] != 'ok' for r in results))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,235 @@
+"""
+# =============================================================================
+# Assembly of the global stiffness matrix for the structured ToPy mesh.
+#
+# Author: William Hunter
+# Copyright (C) 2008, 2015, William Hunter.
+# =============================================================================
+"""
+from copy import copy
+
+import numpy as np
+from scipy.sparse import csr_matrix
+
+from .utils import get_logger
+
+logger = get_logger(__name__)
+__all__ = ['StiffnessMatrix', 'ElementOperator', 'element_dofs',
+           'spring_triplets']
+
+
+# =====================================
+# === Global stiffness matrix class ===
+# =====================================
+class StiffnessMatrix(object):
+    """
+    The constrained global stiffness matrix (free DOF only) of a structured
+    mesh of identical elements, in SciPy CSR format.
+
+    The mesh doesn't change during an optimisation, so the sparsity pattern
+    of the matrix is computed only once ('symbolic' step), together with a
+    scatter map from each (element, local entry) pair to a position in the
+    CSR data array. Thereafter, an update only rewrites the data array
+    ('numeric' step), see update.
+
+    INPUTS:
+        edof -- (nel x ndof_e) connectivity, see element_dofs.
+        Ke -- (ndof_e x ndof_e) element stiffness matrix.
+        freedof -- free (unconstrained) DOF vector.
+        ndof -- total number of DOF in the structure.
+
+    ADDITIONAL INPUTS (arguments and/or keyword arguments):
+        extra -- constant (values, rows, columns) triplets that are added to
+                 the matrix, e.g., the springs used for mechanism synthesis.
+
+    EXAMPLES:
+        >>> Kfree = StiffnessMatrix(t.edof, t.Ke, t.freedof, t.alldof.size)
+        >>> K = Kfree.update(t.desvars.ravel() ** t.p)
+
+    """
+    def __init__(self, edof, Ke, freedof, ndof, extra=None):
+        nel, ndofe = edof.shape
+        nfree = freedof.size
+        # Map structure DOF to free DOF numbers, -1 for constrained DOF:
+        g2f = - np.ones(ndof, dtype=np.int64)
+        g2f[freedof] = np.arange(nfree)
+        fe = g2f[edof]
+        rows = np.repeat(fe, ndofe, axis=1).ravel()
+        cols = np.tile(fe, (1, ndofe)).ravel()
+        keep = np.flatnonzero((rows >= 0) & (cols >= 0))
+        keys = rows[keep] * nfree + cols[keep]
+        del rows, cols, fe
+        if extra is not None:
+            erows, ecols = g2f[extra[1]], g2f[extra[2]]
+            ekeep = np.flatnonzero((erows >= 0) & (ecols >= 0))
+            keys = np.r_[keys, erows[ekeep] * nfree + ecols[ekeep]]
+        # Symbolic step, the (sorted) nonzero pattern of K:
+        ukeys, scatter = np.unique(keys, return_inverse=True)
+        del keys
+        nnz = ukeys.size
+        indptr = np.r_[0, np.cumsum(np.bincount(ukeys // nfree, \
+            minlength=nfree))]
+        indices = ukeys % nfree
+        # Scatter map (element scale factors to CSR data) as sparse operator:
+        nkeep = keep.size
+        self._scatter = csr_matrix((np.ravel(Ke)[keep % ndofe ** 2], \
+            (scatter[:nkeep], keep // ndofe ** 2)), shape=(nnz, nel))
+        # Constant contributions to the data array:
+        self._data0 = np.zeros(nnz)
+        if extra is not None:
+            self._data0 += np.bincount(scatter[nkeep:], \
+                weights=np.asarray(extra[0])[ekeep], minlength=nnz)
+        self.K = csr_matrix((self._data0.copy(), indices, indptr), \
+            shape=(nfree, nfree))
+        logger.debug('Stiffness matrix pattern: %d free DOF, %d nonzeros' \
+            % (nfree, nnz))
+
+    def update(self, scale):
+        """
+        Rewrite the data array of K, every element's matrix scaled by the
+        corresponding value in 'scale'. Return K.
+
+        """
+        self.K.data[:] = self._scatter.dot(np.ravel(scale))
+        self.K.data += self._data0
+        return self.K
+
+    def copy(self):
+        """
+        Return a copy of the matrix for another problem on the same mesh: the
+        sparsity pattern and scatter map (which aren't changed by update)
+        are shared, the data array is not.
+
+        """
+        other = copy(self)
+        other.K = csr_matrix((self._data0.copy(), self.K.indices, \
+            self.K.indptr), shape=self.K.shape)
+        return other
+
+
+# ======================================
+# === Matrix-free stiffness operator ===
+# ======================================
+class ElementOperator(object):
+    """
+    Matrix-free (element-by-element) version of StiffnessMatrix. The global
+    stiffness matrix is never stored: products K u are computed by gathering
+    the element DOF of u, multiplying by the (shared) element matrix and
+    scattering the scaled results back. Memory scales with the number of DOF
+    instead of the number of nonzeros of K.
+
+    INPUTS and EXAMPLES:
+        See StiffnessMatrix, update returns the operator itself.
+
+    """
+    def __init__(self, edof, Ke, freedof, ndof, extra=None):
+        self.edof = edof
+        self.Ke = np.asarray(Ke)
+        self.freedof = freedof
+        self.ndof = ndof
+        self.shape = (freedof.size, freedof.size)
+        self.dtype = np.dtype(float)
+        self._Kextra = None
+        if extra is not None:
+            self._Kextra = csr_matrix((extra[0], (extra[1], extra[2])), \
+                shape=(ndof, ndof))
+        self._u = np.zeros(ndof)
+        self.scale = np.ones(edof.shape[0])
+
+    def update(self, scale):
+        """
+        Set the element scale factors and the diagonal of K. Return self.
+
+        """
+        self.scale = np.ravel(scale)
+        diag = np.bincount(self.edof.ravel(), weights=(self.scale[:, None] * \
+            np.diag(self.Ke)[None, :]).ravel(), minlength=self.ndof)
+        if self._Kextra is not None:
+            diag += self._Kextra.diagonal()
+        self._diag = diag[self.freedof]
+        return self
+
+    def copy(self):
+        """
+        Return a copy of the operator for another problem on the same mesh,
+        see StiffnessMatrix.copy.
+
+        """
+        other = copy(self)
+        other._u = np.zeros(self.ndof)
+        other.scale = np.ones(self.edof.shape[0])
+        return other
+
+    def diagonal(self):
+        """
+        Return the diagonal of K (free DOF).
+
+        """
+        return self._diag
+
+    def dot(self, x):
+        """
+        Return the product K x (free DOF), of a vector x or of every column
+        of a block x.
+
+        """
+        if np.ndim(x) == 2:
+            return np.column_stack([self.dot(c) for c in x.T])
+        self._u[self.freedof] = x
+        fe = self._u[self.edof].dot(self.Ke) #  Ke is symmetric
+        fe *= self.scale[:, None]
+        y = np.bincount(self.edof.ravel(), weights=fe.ravel(), \
+            minlength=self.ndof)
+        if self._Kextra is not None:
+            y += self._Kextra.dot(self._u)
+        return y[self.freedof]
+
+
+# ========================
+# === Public functions ===
+# ========================
+def element_dofs(e2sdofmapi, dofpn, nelx, nely, nelz=0):
+    """
+    Return the element to structure DOF mapping (connectivity) of the whole
+    design domain as a contiguous (nel x ndof_e) NumPy array of index type
+    (intp), so it can be used for fancy indexing without conversion. Rows are
+    ordered like the flattened design variables array, i.e., row 'e' holds
+    the structure DOF numbers of the element that 'desvars.flat[e]' refers
+    to.
+
+    INPUTS:
+        e2sdofmapi -- initial element to structure DOF mapping, see
+                      parser._e2sdofmapinit.
+        dofpn -- DOF per node.
+        nelx, nely, nelz -- number of elements in X, Y and Z (0 for 2D).
+
+    EXAMPLES:
+        >>> element_dofs(t.e2sdofmapi, t.dofpn, t.nelx, t.nely, t.nelz)
+
+    """
+    if nelz == 0: #  2D problem
+        Y, X = np.indices((nely, nelx))
+        offset = Y + X * (nely + 1)
+    else: #  3D problem
+        Z, Y, X = np.indices((nelz, nely, nelx))
+        offset = Y + X * (nely + 1) + Z * (nelx + 1) * (nely + 1)
+    edof = dofpn * offset.reshape(-1, 1) + np.asarray(e2sdofmapi).reshape(1, -1)
+    return np.ascontiguousarray(edof, dtype=np.intp)
+
+def spring_triplets(dofs, value, weights=None):
+    """
+    Return (values, rows, columns) triplets that couple 'dofs' to ground with
+    springs of stiffness 'value', see Topology.set_top_params. With
+    'weights' (one per DOF) the stiffness of the pair of DOF i and j is
+    scaled by weights[i] * weights[j].
+
+    """
+    dofs = np.asarray(dofs, dtype=int)
+    rows = np.repeat(dofs, dofs.size)
+    cols = np.tile(dofs, dofs.size)
+    vals = np.ones(rows.size) * value
+    if weights is not None:
+        vals *= np.outer(weights, weights).ravel()
+    return vals, rows, cols
+
+# EOF assembly.py
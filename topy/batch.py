@@ -0,0 +1,235 @@
+"""
+# =============================================================================
+# Optimise many problems (TPD files) in parallel on a pool of worker
+# processes, e.g., all the examples:
+#
+#     topy batch examples -j 16
+#
+# Problems are scheduled from the most to the least expensive (estimated as
+# number of DOFs times number of iterations), so that the pool stays busy
+# until the end. Each worker limits the threads of the BLAS (and OpenMP)
+# libraries, so that the workers don't oversubscribe the cores. A summary
+# table of the objective function value, iterations and wall time of every
+# problem is written when all problems are done.
+#
+# Author: William Hunter
+# Copyright (C) 2008, 2015, William Hunter.
+# =============================================================================
+"""
+import os
+import logging
+import multiprocessing
+from time import time
+
+try:
+    from threadpoolctl import threadpool_limits
+except ImportError:
+    threadpool_limits = None
+
+from .utils import get_logger, format_table
+from .parser import tpd_file2dict
+from .topology import Topology, MAX_ITERS
+from .optimisation import optimise
+
+logger = get_logger(__name__)
+__all__ = ['run_batch', 'find_tpd_files']
+
+
+THREADS = 1 #  Default number of BLAS threads per worker
+# Environment variables of the thread pools of BLAS and OpenMP libraries:
+THREAD_VARS = ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS',
+               'BLIS_NUM_THREADS', 'VECLIB_MAXIMUM_THREADS',
+               'NUMEXPR_NUM_THREADS')
+SUMMARY = 'summary.txt' #  File name of the summary table
+
+
+# ========================
+# === Public functions ===
+# ========================
+def find_tpd_files(paths):
+    """
+    Return the TPD files in 'paths', which are files or directories
+    (searched recursively), sorted per directory.
+
+    """
+    fnames = []
+    for p in paths:
+        if os.path.isdir(p):
+            for root, dirs, files in os.walk(p):
+                dirs.sort()
+                fnames += [os.path.join(root, f) for f in sorted(files) \
+                    if f.endswith('.tpd')]
+        else:
+            fnames.append(p)
+    return fnames
+
+def run_batch(fnames, workers=None, threads=THREADS, outdir='./batch',
+              **kwargs):
+    """
+    Optimise the problems of the TPD files in parallel, on 'workers'
+    processes (default: number of CPUs divided by 'threads'), each using
+    'threads' BLAS threads. The output of each problem (see optimise, by
+    default only the final design) and its log go to a directory of its
+    own in 'outdir'. Return a list with the result of every problem (a dict
+    with keys 'fname', 'probname', 'status', 'objfval', 'iterations', 'time',
+    'dofs' and 'cost'), in the order of fnames; the summary table is written
+    to outdir/summary.txt.
+
+    ADDITIONAL INPUTS (keyword arguments):
+        Passed to optimise, e.g., save=False or every=10.
+
+    EXAMPLES:
+        >>> run_batch(find_tpd_files(['examples']), workers=8)
+
+    """
+    if not os.path.exists(outdir):
+        os.makedirs(outdir)
+    kwargs.setdefault('every', 0)
+    kwargs.setdefault('background', False) #  The pool keeps the cores busy
+    jobs = _jobs(fnames, outdir, kwargs)
+
+    if workers is None:
+        workers = max(1, multiprocessing.cpu_count() // threads)
+    workers = min(workers, len(jobs)) or 1
+    logger.info('Batch of %d problems on %d workers (%d BLAS threads each)' \
+        % (len(jobs), workers, threads))
+    # New processes (spawned) read the thread limits of the BLAS libraries
+    # from the environment when NumPy is imported:
+    saved = dict((var, os.environ.get(var)) for var in THREAD_VARS)
+    os.environ.update((var, str(threads)) for var in THREAD_VARS)
+    try:
+        ctx = multiprocessing.get_context('spawn')
+    except AttributeError: #  Python 2, forked processes
+        ctx = multiprocessing
+    ti = time()
+    try:
+        pool = ctx.Pool(workers, initializer=_init_worker, initargs=(threads,))
+    finally:
+        for var, value in saved.items():
+            if value is None:
+                os.environ.pop(var, None)
+            else:
+                os.environ[var] = value
+    results = [None] * len(jobs)
+    try:
+        for i, result in pool.imap_unordered(_run_job, jobs):
+            results[i] = result
+            logger.info('%s: %s (%.1f s)' % (result['fname'], \
+                result['status'], result['time']))
+    finally:
+        pool.close()
+        pool.join()
+
+    table = _summary(results, time() - ti)
+    with open(os.path.join(outdir, SUMMARY), 'w') as f:
+        f.write(table)
+    logger.info('\n' + table)
+    return results
+
+
+# ===================================
+# === Private methods and helpers ===
+# ===================================
+def _jobs(fnames, outdir, kwargs):
+    """
+    Return the jobs (index, file name, output directory, DOFs, cost and
+    kwargs of optimise) of the TPD files, the most expensive first.
+
+    """
+    jobs = []
+    names = set()
+    for i, fname in enumerate(fnames):
+        dofs, cost = _estimate_cost(fname)
+        # Output directory, named after the file (unique):
+        name = os.path.splitext(os.path.basename(fname))[0]
+        while name in names:
+            name += '_'
+        names.add(name)
+        jobs.append((i, fname, os.path.join(outdir, name), dofs, cost, kwargs))
+    # Most expensive first (longest processing time first scheduling):
+    jobs.sort(key=lambda job: -job[4])
+    return jobs
+
+def _estimate_cost(fname):
+    """
+    Return the number of DOFs and the estimated cost (DOFs times iterations)
+    of the problem in the TPD file, or (0, 0) if it can't be read.
+
+    """
+    try:
+        d = tpd_file2dict(fname)
+    except Exception as e:
+        logger.debug('Cost of %s unknown: %s' % (fname, e))
+        return 0, 0
+    nodes = (d['NUM_ELEM_X'] + 1) * (d['NUM_ELEM_Y'] + 1) * \
+        (d['NUM_ELEM_Z'] + 1)
+    dofs = d['DOF_PN'] * nodes
+    return dofs, dofs * d.get('NUM_ITER', MAX_ITERS)
+
+def _init_worker(threads):
+    """
+    Limit the BLAS threads of a forked worker (threadpoolctl, if installed)
+    and keep the workers' log messages off the console, see _run_job.
+
+    """
+    if threadpool_limits is not None:
+        threadpool_limits(threads)
+    for name, lg in logging.Logger.manager.loggerDict.items():
+        if name.startswith('topy') and isinstance(lg, logging.Logger):
+            for handler in lg.handlers:
+                handler.setLevel(logging.WARNING)
+
+def _run_job(job):
+    """
+    Optimise one problem, logging to <dir>/<name>.log. Return the index
+    of the job and its result.
+
+    """
+    i, fname, dir, dofs, cost, kwargs = job
+    result = {'fname': fname, 'probname': '', 'status': 'ok',
+              'objfval': float('nan'), 'iterations': 0, 'time': 0.0,
+              'dofs': dofs, 'cost': cost}
+    if not os.path.exists(dir):
+        os.makedirs(dir)
+    handler = logging.FileHandler(os.path.join(dir, \
+        os.path.basename(dir) + '.log'), 'w')
+    handler.setLevel(logging.INFO)
+    toplogger = logging.getLogger('topy')
+    toplogger.addHandler(handler)
+    ti = time()
+    try:
+        t = Topology()
+        t.load_tpd_file(fname)
+        t.set_top_params()
+        result['probname'] = t.probname
+        optimise(t, dir=dir, **kwargs)
+        result['objfval'] = float(t.objfval)
+        result['iterations'] = t.itercount
+    except Exception as e:
+        result['status'] = 'error: {}'.format(e)
+        logging.getLogger(__name__).exception('%s failed' % fname)
+    finally:
+        result['time'] = time() - ti
+        toplogger.removeHandler(handler)
+        handler.close()
+    return i, result
+
+def _summary(results, walltime):
+    """
+    Return the summary table of the results.
+
+    """
+    header = ('File', 'Problem', 'DOFs', 'Iter', 'Obj. func.', 'Time (s)', \
+        'Status')
+    rows = [(r['fname'], r['probname'], str(r['dofs']), \
+        str(r['iterations']), '%.6e' % r['objfval'], '%.1f' % r['time'], \
+        r['status']) for r in results]
+    lines = [format_table(header, rows)]
+    cputime = sum(r['time'] for r in results)
+    nfailed = sum(r['status'] != 'ok' for r in results)
+    lines.append('')
+    lines.append('%d problems (%d failed), wall time %.1f s, total problem '
+                 'time %.1f s' % (len(results), nfailed, walltime, cputime))
+    return '\n'.join(lines) + '\n'
+
+# EOF batch.py
@@ -0,0 +1,238 @@
+"""
+# =============================================================================
+# Filters for the design sensitivities on the structured ToPy grid.
+#
+# The filter weight of element f for element e is max(0, filtrad - distance
+# between the centres of e and f), a translation invariant (cone) kernel, so
+# the weighted sums of the filter can be computed in different ways, see
+# FILTERS below. Outside the design domain everything is zero (zero padding).
+#
+# Author: William Hunter
+# Copyright (C) 2008, 2015, William Hunter.
+# =============================================================================
+"""
+from collections import OrderedDict
+from threading import Lock
+
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.ndimage import correlate
+from scipy.signal import fftconvolve
+
+from .utils import get_logger, mirror
+
+logger = get_logger(__name__)
+__all__ = ['FILTERS', 'MirroredFilter', 'get_filter', 'filter_kernel']
+
+
+# Use FFTs if the kernel has more nonzero weights than FFT_FACTOR times the
+# base 2 logarithm of the number of elements ('auto' method):
+FFT_FACTOR = 5
+
+CACHE_SIZE = 8 #  Number of filters cached, the least recently used dropped
+
+# Filters, keyed by (nelx, nely, nelz, filtrad, method[, symmetry]), least
+# recently used first:
+_CACHE = OrderedDict()
+_LOCK = Lock()
+
+
+# ========================
+# === Public functions ===
+# ========================
+def get_filter(nelx, nely, nelz, filtrad, method='auto', symmetry=''):
+    """
+    Return the filter of a grid and radius, computed by 'method', which is
+    one of the FILTERS keys or 'auto' (a sparse matrix for small kernels,
+    FFTs for large ones). The CACHE_SIZE most recently used filters are
+    cached, so problems with the same grid and filter radius share them.
+
+    INPUTS:
+        nelx, nely, nelz -- number of elements in X, Y and Z (0 for 2D).
+        filtrad -- filter radius.
+
+    ADDITIONAL INPUTS (arguments and/or keyword arguments):
+        symmetry -- the axes normal to the symmetry planes of a symmetric
+                    domain (see SYMMETRY), of which the grid is the lower
+                    part; the filter of the whole domain is applied to the
+                    mirrored arrays, see MirroredFilter.
+
+    EXAMPLES:
+        >>> filt = get_filter(60, 20, 0, 1.5)
+        >>> df = filt.apply(x * df) / (filt.Hs * x)
+
+    """
+    if symmetry:
+        n = {'x': nelx, 'y': nely, 'z': nelz}
+        for axis in symmetry:
+            n[axis] *= 2
+        return _cached((nelx, nely, nelz, filtrad, method, symmetry), \
+            lambda: MirroredFilter(get_filter(n['x'], n['y'], n['z'], \
+            filtrad, method), symmetry))
+    if method == 'auto':
+        nweights = np.count_nonzero(filter_kernel(filtrad, nelz > 0))
+        nel = nelx * nely * max(nelz, 1)
+        if nweights > FFT_FACTOR * np.log2(nel):
+            method = 'fft'
+        else:
+            method = 'matrix'
+    if method not in FILTERS:
+        raise ValueError('Unknown filter method (FILTER_METHOD): {}. Choose '
+                         'one of: auto, {}'.format(method, \
+                         ', '.join(sorted(FILTERS))))
+    def make():
+        logger.debug('Filter (FILT_RAD = %g) computed by method: %s' \
+            % (filtrad, method))
+        return FILTERS[method](nelx, nely, nelz, filtrad)
+    return _cached((nelx, nely, nelz, filtrad, method), make)
+
+def filter_kernel(filtrad, three_d):
+    """
+    Return the filter weights of all offsets inside the filter radius as a
+    (2D or 3D) array, centred at the middle entry.
+
+    """
+    rmin = int(np.floor(filtrad))
+    span = np.arange(-rmin - 1, rmin + 2)
+    if three_d:
+        k, j, i = np.meshgrid(span, span, span, indexing='ij')
+        dist = np.sqrt(i ** 2 + j ** 2 + k ** 2)
+    else:
+        j, i = np.meshgrid(span, span, indexing='ij')
+        dist = np.sqrt(i ** 2 + j ** 2)
+    return np.maximum(0, filtrad - dist)
+
+
+# ======================
+# === Filter classes ===
+# ======================
+class _Filter(object):
+    """
+    Base class of the filters. The method 'apply' returns the weighted sums
+    (H v) of an array shaped like the design variables array, 'Hs' holds the
+    sums of the weights (H 1).
+
+    """
+    def __init__(self, nelx, nely, nelz, filtrad):
+        if nelz == 0:
+            self.shape = (nely, nelx)
+        else:
+            self.shape = (nelz, nely, nelx)
+        self.kernel = filter_kernel(filtrad, nelz > 0)
+        self._setup(nelx, nely, nelz, filtrad)
+        self.Hs = self.apply(np.ones(self.shape))
+
+    def _setup(self, nelx, nely, nelz, filtrad):
+        pass
+
+    def apply(self, v):
+        raise NotImplementedError
+
+
+class MatrixFilter(_Filter):
+    """
+    Filter weights stored as a sparse (nel x nel) matrix, one sparse
+    matrix-vector product per application.
+
+    """
+    def _setup(self, nelx, nely, nelz, filtrad):
+        nel = int(np.prod(self.shape))
+        idx = np.arange(nel).reshape(self.shape)
+        kernel = self.kernel
+        if nelz == 0:
+            idx = idx[np.newaxis]
+            kernel = kernel[np.newaxis]
+        nz, ny, nx = idx.shape
+        c = kernel.shape[1] // 2
+        rows, cols, vals = [], [], []
+        for k, j, i in np.argwhere(kernel > 0):
+            weight = kernel[k, j, i]
+            k, j, i = k - kernel.shape[0] // 2, j - c, i - c
+            # Elements with a neighbour at offset (k, j, i) inside the grid:
+            e = idx[max(0, -k):nz - max(0, k), max(0, -j):ny - max(0, j), \
+                max(0, -i):nx - max(0, i)]
+            f = idx[max(0, k):nz + min(0, k), max(0, j):ny + min(0, j), \
+                max(0, i):nx + min(0, i)]
+            rows.append(e.ravel())
+            cols.append(f.ravel())
+            vals.append(np.ones(e.size) * weight)
+        self.H = csr_matrix((np.concatenate(vals), (np.concatenate(rows), \
+            np.concatenate(cols))), shape=(nel, nel))
+
+    def apply(self, v):
+        return self.H.dot(np.ravel(v)).reshape(self.shape)
+
+
+class ConvolutionFilter(_Filter):
+    """
+    Direct convolution of the array with the filter kernel (SciPy ndimage),
+    nothing is stored but the kernel.
+
+    """
+    def apply(self, v):
+        return correlate(np.reshape(v, self.shape), self.kernel, \
+            mode='constant', cval=0.0)
+
+
+class FFTFilter(_Filter):
+    """
+    Convolution with the filter kernel by means of FFTs, for large radii.
+
+    """
+    def apply(self, v):
+        return fftconvolve(np.reshape(v, self.shape), self.kernel, \
+            mode='same')
+
+
+class MirroredFilter(object):
+    """
+    The filter of the lower part of a symmetric domain: the filter of the
+    whole domain ('base') is applied to the array mirrored in the symmetry
+    planes normal to the 'symmetry' axes, and the result restricted to the
+    part. This is exact, also near the planes, where a filter of the part
+    alone would miss the weights of the mirrored elements.
+
+    """
+    def __init__(self, base, symmetry):
+        self.base = base
+        # Array axes of the design variables, X last:
+        self.axes = [-1 - 'xyz'.index(axis) for axis in symmetry]
+        self.kernel = base.kernel
+        self._part = [slice(None)] * len(base.shape)
+        for axis in self.axes:
+            self._part[axis] = slice(base.shape[axis] // 2)
+        self._part = tuple(self._part)
+        self.Hs = base.Hs[self._part]
+        self.shape = self.Hs.shape
+
+    def apply(self, v):
+        v = mirror(np.reshape(v, self.shape), self.axes)
+        return self.base.apply(v)[self._part]
+
+
+FILTERS = {'matrix': MatrixFilter, 'convolve': ConvolutionFilter,
+           'fft': FFTFilter}
+
+
+# ===================================
+# === Private methods and helpers ===
+# ===================================
+def _cached(key, make):
+    """
+    Return the cached filter of key, else the filter returned by make(),
+    which is added to the cache (dropping the least recently used filters
+    beyond CACHE_SIZE).
+
+    """
+    with _LOCK:
+        if key in _CACHE:
+            _CACHE[key] = _CACHE.pop(key) #  Most recently used
+            return _CACHE[key]
+    filt = make() #  Not locked, e.g., the base of a MirroredFilter
+    with _LOCK:
+        filt = _CACHE.setdefault(key, filt)
+        while len(_CACHE) > CACHE_SIZE:
+            _CACHE.popitem(last=False)
+    return filt
+
+# EOF filters.py
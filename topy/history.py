@@ -0,0 +1,271 @@
+"""
+# =============================================================================
+# History of an optimisation: the design variables, sensitivities and
+# iteration statistics of every iteration, appended to one chunked and
+# compressed HDF5 file (requires h5py), or to a directory of compressed NumPy
+# (npz) files, one per iteration, if h5py isn't installed. Records are
+# written as they come, so memory use doesn't grow with the number of
+# iterations, and are read on access, see load_history.
+#
+# Author: William Hunter
+# Copyright (C) 2008, 2015, William Hunter.
+# =============================================================================
+"""
+import os
+from glob import glob
+
+import numpy as np
+try:
+    import h5py
+except ImportError:
+    h5py = None
+
+from .utils import get_logger
+
+logger = get_logger(__name__)
+__all__ = ['History', 'HistoryReader', 'load_history']
+
+
+BACKENDS = ('hdf5', 'npz')
+COMPRESSION = 4 #  Default gzip compression level of HDF5 datasets
+STATS_CHUNK = 256 #  Chunk size (iterations) of the HDF5 statistics datasets
+
+
+# =======================
+# === History classes ===
+# =======================
+class History(object):
+    """
+    Append the state of a topology after every iteration to a history file
+    (HDF5 backend) or directory (npz backend). Each record holds the design
+    variables ('desvars'), the (filtered) sensitivities ('df'), the physical
+    densities ('xphys', density filter only) and the values of
+    Topology.iteration_stats ('iteration', 'objfval', 'change', 'p', 'q',
+    'eta', ...).
+
+    INPUTS:
+        fname -- the HDF5 file name, or the npz directory name.
+
+    ADDITIONAL INPUTS (arguments and/or keyword arguments):
+        backend -- 'hdf5' or 'npz'; default is 'hdf5' if h5py is installed.
+                   If the npz backend is used because h5py isn't installed,
+                   a '.h5' or '.hdf5' extension is removed from fname.
+        compression -- gzip compression level of the HDF5 datasets (0 to 9,
+                       None for none).
+        start -- iteration count of a resumed optimisation (see
+                 Topology.resume): the records up to and including this
+                 iteration are kept, later ones discarded, and new records
+                 appended. With 0 (default) an existing history is replaced.
+
+    EXAMPLES:
+        >>> with History('beam.h5') as history:
+        ...     history.append(t)
+
+    """
+    def __init__(self, fname, backend=None, compression=COMPRESSION, start=0):
+        if backend is None:
+            backend = 'hdf5' if h5py else 'npz'
+            root, ext = os.path.splitext(fname)
+            if backend == 'npz' and ext in ('.h5', '.hdf5'):
+                logger.info('h5py is not installed, history written to the '
+                            'directory %s instead' % root)
+                fname = root
+        if backend not in BACKENDS:
+            raise ValueError('Unknown history backend: {}. Choose one of: '
+                             '{}'.format(backend, ', '.join(BACKENDS)))
+        if backend == 'hdf5' and h5py is None:
+            raise ValueError('The hdf5 history backend requires h5py, which '
+                             'is not installed.')
+        self.fname = fname
+        self.backend = backend
+        self.compression = compression
+        self.count = 0
+        if backend == 'hdf5':
+            self._file = h5py.File(fname, 'a' if start else 'w')
+            if 'iteration' in self._file:
+                self.count = int(np.searchsorted(self._file['iteration'][:], \
+                    start, 'right'))
+                for d in self._file.values():
+                    d.resize(self.count, axis=0)
+        else:
+            if not os.path.exists(fname):
+                os.makedirs(fname)
+            # Records after 'start' (or of an earlier run) would be mixed with
+            # this run's:
+            for old in sorted(glob(os.path.join(fname, '*.npz'))):
+                with np.load(old) as record:
+                    keep = record['iteration'] <= start
+                if keep:
+                    self.count += 1
+                else:
+                    os.remove(old)
+
+    def append(self, topology):
+        """
+        Append a record of the current iteration of the topology.
+
+        """
+        t = topology
+        arrays = {'desvars': t.desvars, 'df': t.df}
+        if t.filtertype == 'density':
+            arrays['xphys'] = t.xphys
+        stats = t.iteration_stats()
+        if self.backend == 'hdf5':
+            self._append_hdf5(arrays, stats)
+        else:
+            record = dict(arrays)
+            record.update(stats)
+            np.savez_compressed(os.path.join(self.fname, '%06d.npz' % \
+                self.count), **record)
+        self.count += 1
+
+    def close(self):
+        """
+        Close the history file (HDF5 backend).
+
+        """
+        if self.backend == 'hdf5':
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _append_hdf5(self, arrays, stats):
+        f, n = self._file, self.count
+        for name, value in list(arrays.items()) + list(stats.items()):
+            # The statistics are float64, whatever the type of their first
+            # value (e.g., an integer penalty factor that is continued later):
+            value = np.asarray(value, None if name in arrays else np.float64)
+            if name not in f:
+                shape = value.shape
+                # One chunk per array record, STATS_CHUNK per statistic:
+                chunks = (1,) + shape if shape else (STATS_CHUNK,)
+                kwargs = {}
+                if self.compression:
+                    kwargs = {'compression': 'gzip', 'shuffle': True,
+                              'compression_opts': self.compression}
+                f.create_dataset(name, (0,) + shape, value.dtype, \
+                    maxshape=(None,) + shape, chunks=chunks, **kwargs)
+            d = f[name]
+            d.resize(n + 1, axis=0)
+            d[n] = value
+        f.flush() #  So that the history can be read while optimising
+
+
+class HistoryReader(object):
+    """
+    Read access to a history written by History. Records are read when they
+    are indexed: reader[i] returns a dict with the arrays and statistics of
+    the ith record (negative indices count from the end), reader.stats the
+    statistics of all records as arrays (without reading the arrays).
+
+    INPUTS:
+        fname -- the HDF5 file name, or the npz directory name.
+
+    EXAMPLES:
+        >>> history = load_history('beam.h5')
+        >>> x = history[-1]['desvars']
+        >>> plot(history.stats['iteration'], history.stats['objfval'])
+
+    """
+    def __init__(self, fname):
+        if not os.path.exists(fname):
+            # A history that was written to npz files, see History:
+            root, ext = os.path.splitext(fname)
+            if ext in ('.h5', '.hdf5') and os.path.isdir(root):
+                fname = root
+        self.fname = fname
+        if os.path.isdir(fname):
+            self.backend = 'npz'
+            self._files = sorted(glob(os.path.join(fname, '*.npz')))
+            names = []
+            if self._files:
+                with np.load(self._files[0]) as record:
+                    names = list(record.keys())
+        else:
+            if h5py is None:
+                raise ValueError('Reading an HDF5 history requires h5py, '
+                                 'which is not installed.')
+            self.backend = 'hdf5'
+            self._file = h5py.File(fname, 'r')
+            names = list(self._file.keys())
+        self.names = sorted(names)
+
+    def __len__(self):
+        if self.backend == 'npz':
+            return len(self._files)
+        return len(self._file['iteration']) if self.names else 0
+
+    def __getitem__(self, i):
+        i = range(len(self))[i] #  IndexError if out of range
+        if self.backend == 'npz':
+            with np.load(self._files[i]) as record:
+                return _record(record, self.names)
+        return _record(dict((name, self._file[name][i]) for name in \
+            self.names), self.names)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    @property
+    def stats(self):
+        """
+        The statistics of all records, as a dict of arrays.
+
+        """
+        names = [name for name in self.names if name not in \
+            ('desvars', 'df', 'xphys')]
+        if self.backend == 'hdf5':
+            return dict((name, self._file[name][:]) for name in names)
+        stats = dict((name, []) for name in names)
+        for fname in self._files:
+            with np.load(fname) as record:
+                for name in names:
+                    stats[name].append(record[name])
+        return dict((name, np.array(v)) for name, v in stats.items())
+
+    def close(self):
+        """
+        Close the history file (HDF5 backend).
+
+        """
+        if self.backend == 'hdf5':
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+# ========================
+# === Public functions ===
+# ========================
+def load_history(fname):
+    """
+    Return a HistoryReader of the history file or directory.
+
+    """
+    return HistoryReader(fname)
+
+
+# ===================================
+# === Private methods and helpers ===
+# ===================================
+def _record(record, names):
+    """
+    Return the record as a dict, with the statistics as Python scalars.
+
+    """
+    out = {}
+    for name in names:
+        value = np.asarray(record[name])
+        out[name] = value.item() if value.ndim == 0 else value
+    return out
+
+# EOF history.py
@@ -0,0 +1,229 @@
+"""
+# =============================================================================
+# The Method of Moving Asymptotes (MMA), an alternative to the OC update of
+# the design variables, see Topology.update_desvars_mma.
+#
+# Solves problems of the form
+#
+#     minimise    f0(x) + a0 z + sum(c y + d y^2 / 2)
+#     subject to  fi(x) - a_i z - y_i <= 0,  i = 1, ..., m
+#                 xmin <= x <= xmax,  y >= 0,  z >= 0
+#
+# by a sequence of convex (MMA) approximations, each solved by a primal-dual
+# interior point method. With the default a0 = 1, a = 0, c = 1000 and d = 1
+# this is the ordinary problem: minimise f0(x) such that fi(x) <= 0.
+#
+# Reference: K. Svanberg, "The method of moving asymptotes - a new method for
+# structural optimization", Int. J. Numer. Meth. Engng., 24, 359-373, 1987.
+#
+# Author: William Hunter
+# Copyright (C) 2008, 2015, William Hunter.
+# =============================================================================
+"""
+import numpy as np
+
+from .utils import get_logger
+
+logger = get_logger(__name__)
+__all__ = ['MMA']
+
+
+MOVE = 0.5 #  Move limit, as a fraction of (xmax - xmin)
+ASYINIT = 0.5 #  Initial distance of the asymptotes, fraction of (xmax - xmin)
+ASYINCR, ASYDECR = 1.2, 0.7 #  Widening and narrowing factors of asymptotes
+ALBEFA = 0.1 #  Bounds alfa/beta stay this fraction away from the asymptotes
+RAA0 = 1e-5 #  Regularisation of the approximations
+EPSIMIN = 1e-10 #  Tolerance of the interior point method
+
+
+# =================
+# === MMA class ===
+# =================
+class MMA(object):
+    """
+    MMA optimiser for n variables and m constraints. Keeps the asymptotes
+    and the previous two iterates between calls to update.
+
+    INPUTS:
+        n -- number of design variables.
+        m -- number of constraints.
+        xmin, xmax -- lower and upper bounds of the variables (scalars or
+                      arrays of length n).
+
+    ADDITIONAL INPUTS (arguments and/or keyword arguments):
+        move -- move limit, as a fraction of (xmax - xmin).
+        a0, a, c, d -- constants of the problem, see module docstring.
+
+    EXAMPLES:
+        >>> opt = MMA(x.size, 1, 0.001, 1.0)
+        >>> x = opt.update(x, df0dx, fval, dfdx)
+
+    """
+    def __init__(self, n, m, xmin, xmax, move=MOVE, a0=1., a=None, c=None, \
+    d=None):
+        self.n, self.m = n, m
+        self.xmin = np.ones(n) * xmin
+        self.xmax = np.ones(n) * xmax
+        self.move = move
+        self.a0 = a0
+        self.a = np.zeros(m) if a is None else np.ones(m) * a
+        self.c = 1000 * np.ones(m) if c is None else np.ones(m) * c
+        self.d = np.ones(m) if d is None else np.ones(m) * d
+        self.low = self.upp = None #  Asymptotes
+        self.xold1 = self.xold2 = None #  Previous iterates
+        self.iteration = 0
+        self.y = self.z = self.lam = None #  Solution of the last subproblem
+
+    def update(self, x, df0dx, fval, dfdx):
+        """
+        Return the next iterate, given the current one (x), the gradient of
+        the objective (df0dx, length n), the constraint values (fval, length
+        m) and their gradients (dfdx, m x n).
+
+        """
+        x = np.asarray(x, dtype=float)
+        fval = np.atleast_1d(fval).astype(float)
+        dfdx = np.atleast_2d(dfdx)
+        self.iteration += 1
+        xrange_ = self.xmax - self.xmin
+        # Asymptotes, moved in or out depending on oscillation of x:
+        if self.iteration <= 2:
+            self.low = x - ASYINIT * xrange_
+            self.upp = x + ASYINIT * xrange_
+        else:
+            zzz = (x - self.xold1) * (self.xold1 - self.xold2)
+            factor = np.ones(self.n)
+            factor[zzz > 0] = ASYINCR
+            factor[zzz < 0] = ASYDECR
+            self.low = np.clip(x - factor * (self.xold1 - self.low), \
+                x - 10 * xrange_, x - 0.01 * xrange_)
+            self.upp = np.clip(x + factor * (self.upp - self.xold1), \
+                x + 0.01 * xrange_, x + 10 * xrange_)
+        low, upp = self.low, self.upp
+        # Bounds of the subproblem:
+        alfa = np.maximum.reduce([low + ALBEFA * (x - low), \
+            x - self.move * xrange_, self.xmin])
+        beta = np.minimum.reduce([upp - ALBEFA * (upp - x), \
+            x + self.move * xrange_, self.xmax])
+        # Coefficients of the (convex) approximations:
+        xmamiinv = 1 / np.maximum(xrange_, 1e-5)
+        ux2 = (upp - x) ** 2
+        xl2 = (x - low) ** 2
+        p0 = np.maximum(df0dx, 0)
+        q0 = np.maximum(-df0dx, 0)
+        pq0 = 0.001 * (p0 + q0) + RAA0 * xmamiinv
+        p0 = (p0 + pq0) * ux2
+        q0 = (q0 + pq0) * xl2
+        P = np.maximum(dfdx, 0)
+        Q = np.maximum(-dfdx, 0)
+        PQ = 0.001 * (P + Q) + RAA0 * xmamiinv
+        P = (P + PQ) * ux2
+        Q = (Q + PQ) * xl2
+        b = P.dot(1 / (upp - x)) + Q.dot(1 / (x - low)) - fval
+        xnew, self.y, self.z, self.lam = _subsolv(low, upp, alfa, beta, p0, \
+            q0, P, Q, self.a0, self.a, b, self.c, self.d)
+        self.xold2, self.xold1 = self.xold1, x.copy()
+        return xnew
+
+
+# ===================================
+# === Private methods and helpers ===
+# ===================================
+def _subsolv(low, upp, alfa, beta, p0, q0, P, Q, a0, a, b, c, d):
+    """
+    Solve the MMA subproblem by a primal-dual Newton (interior point) method,
+    with the relaxation parameter epsi reduced from 1 to EPSIMIN. Return the
+    variables x, y, z and the Lagrange multipliers lam of the constraints.
+
+    """
+    m, n = P.shape
+    epsi = 1.
+    x = 0.5 * (alfa + beta)
+    y = np.ones(m)
+    z = 1.
+    lam = np.ones(m)
+    xsi = np.maximum(1 / (x - alfa), 1)
+    eta = np.maximum(1 / (beta - x), 1)
+    mu = np.maximum(1, 0.5 * c)
+    zet = 1.
+    s = np.ones(m)
+    args = (low, upp, alfa, beta, p0, q0, P, Q, a0, a, b, c, d)
+    while epsi > EPSIMIN:
+        residu = _residual(x, y, z, lam, xsi, eta, mu, zet, s, epsi, *args)
+        residunorm = np.linalg.norm(residu)
+        itn = 0
+        while np.abs(residu).max() > 0.9 * epsi and itn < 200:
+            itn += 1
+            # Newton direction, by reducing the system to the multipliers:
+            ux1, xl1 = upp - x, x - low
+            ux2, xl2 = ux1 ** 2, xl1 ** 2
+            plam = p0 + P.T.dot(lam)
+            qlam = q0 + Q.T.dot(lam)
+            gvec = P.dot(1 / ux1) + Q.dot(1 / xl1)
+            GG = P / ux2 - Q / xl2
+            delx = plam / ux2 - qlam / xl2 - epsi / (x - alfa) + \
+                epsi / (beta - x)
+            dely = c + d * y - lam - epsi / y
+            delz = a0 - a.dot(lam) - epsi / z
+            dellam = gvec - a * z - y - b + epsi / lam
+            diagx = 2 * (plam / (ux1 * ux2) + qlam / (xl1 * xl2)) + \
+                xsi / (x - alfa) + eta / (beta - x)
+            diagy = d + mu / y
+            blam = dellam + dely / diagy - GG.dot(delx / diagx)
+            Alam = np.diag(s / lam + 1 / diagy) + (GG / diagx).dot(GG.T)
+            AA = np.zeros((m + 1, m + 1))
+            AA[:m, :m] = Alam
+            AA[:m, m] = AA[m, :m] = a
+            AA[m, m] = - zet / z
+            solut = np.linalg.solve(AA, np.r_[blam, delz])
+            dlam, dz = solut[:m], solut[m]
+            dx = - delx / diagx - GG.T.dot(dlam) / diagx
+            dy = - dely / diagy + dlam / diagy
+            dxsi = - xsi + epsi / (x - alfa) - xsi * dx / (x - alfa)
+            deta = - eta + epsi / (beta - x) + eta * dx / (beta - x)
+            dmu = - mu + epsi / y - mu * dy / y
+            dzet = - zet + epsi / z - zet * dz / z
+            ds = - s + epsi / lam - s * dlam / lam
+            # Step length, keeping all variables feasible:
+            xx = np.r_[y, z, lam, xsi, eta, mu, zet, s]
+            dxx = np.r_[dy, dz, dlam, dxsi, deta, dmu, dzet, ds]
+            stmax = max((- 1.01 * dxx / xx).max(), \
+                (- 1.01 * dx / (x - alfa)).max(), \
+                (1.01 * dx / (beta - x)).max(), 1)
+            steg = 1 / stmax
+            old = (x, y, z, lam, xsi, eta, mu, zet, s)
+            step = (dx, dy, dz, dlam, dxsi, deta, dmu, dzet, ds)
+            # Backtracking until the residual decreases:
+            for itto in range(50):
+                new = [v + steg * dv for v, dv in zip(old, step)]
+                residu = _residual(*(new + [epsi]) + list(args))
+                resinew = np.linalg.norm(residu)
+                if resinew < residunorm:
+                    break
+                steg /= 2
+            x, y, z, lam, xsi, eta, mu, zet, s = new
+            residunorm = resinew
+        epsi *= 0.1
+    return x, y, z, lam
+
+def _residual(x, y, z, lam, xsi, eta, mu, zet, s, epsi, low, upp, alfa, beta, \
+p0, q0, P, Q, a0, a, b, c, d):
+    """
+    Return the residual of the (relaxed) KKT conditions of the subproblem.
+
+    """
+    ux1, xl1 = upp - x, x - low
+    plam = p0 + P.T.dot(lam)
+    qlam = q0 + Q.T.dot(lam)
+    gvec = P.dot(1 / ux1) + Q.dot(1 / xl1)
+    return np.r_[plam / ux1 ** 2 - qlam / xl1 ** 2 - xsi + eta, #  rex
+                 c + d * y - mu - lam, #  rey
+                 a0 - zet - a.dot(lam), #  rez
+                 gvec - a * z - y + s - b, #  relam
+                 xsi * (x - alfa) - epsi, #  rexsi
+                 eta * (beta - x) - epsi, #  reeta
+                 mu * y - epsi, #  remu
+                 zet * z - epsi, #  rezet
+                 lam * s - epsi] #  res
+
+# EOF mma.py
@@ -0,0 +1,174 @@
+"""
+# =============================================================================
+# Multi-resolution (coarse-to-fine) continuation: the problem is optimised on
+# a grid coarsened by a factor of MULTIRES (2, 4 or 8) first, the design is
+# prolongated to a grid twice as fine and optimised further, and so on, down
+# to the grid of the problem. Most of the early iterations, which only
+# settle the layout of the design, are thus done on small grids.
+#
+# The boundary conditions of a coarse grid are those of the problem with
+# every node moved to the nearest coarse node (loads on the same coarse node
+# are added) and the passive and active elements are the coarse elements
+# that are at least half passive or active. See optimisation.optimise for how
+# the stages are run.
+#
+# Author: William Hunter
+# Copyright (C) 2008, 2015, William Hunter.
+# =============================================================================
+"""
+import numpy as np
+
+from .utils import get_logger
+from .parser import _e2sdofmapinit, _dof_coords, _coords_dof
+
+logger = get_logger(__name__)
+__all__ = ['stage_factors', 'coarse_topydict', 'prolongate']
+
+
+MIN_FILT_RAD = 1.5 #  Smallest filter radius on coarse grids (checkerboards)
+
+# Design shaped arrays (see Topology.checkpoint) and scalars that carry over
+# from a coarse grid to the next finer one, see prolongate:
+PROLONG_ATTRS = ('desvars', 'desvarsold', 'df', 'dfold', 'dv', 'a', 'eta')
+CARRY_ATTRS = ('p', 'q', 'beta', 'pcount', 'qcount', 'itercount', 'lam')
+
+
+# ========================
+# === Public functions ===
+# ========================
+def stage_factors(topydict):
+    """
+    Return the coarsening factors of the coarse stages of the problem, from
+    coarse to fine, e.g., [4, 2] for MULTIRES: 4. Raise a ValueError if
+    MULTIRES isn't a power of 2 or doesn't divide the number of elements.
+
+    """
+    factor = topydict['MULTIRES']
+    if factor < 2 or factor & (factor - 1):
+        raise ValueError('MULTIRES must be a power of 2 (2, 4, 8, ...).')
+    nels = [topydict['NUM_ELEM_' + axis] for axis in 'XYZ']
+    if any(nel % factor for nel in nels):
+        raise ValueError('MULTIRES must divide NUM_ELEM_X, NUM_ELEM_Y and '
+                         'NUM_ELEM_Z.')
+    factors = []
+    while factor > 1:
+        factors.append(factor)
+        factor //= 2
+    return factors
+
+def coarse_topydict(topology, factor, start=0):
+    """
+    Return the parameters (see Topology.topydict) of the problem of the
+    topology on a grid coarsened by 'factor', for the coarse stage that
+    starts at iteration 'start'. The topology's parameters must be set.
+
+    The stage runs for MULTIRES_ITER iterations if specified, else until
+    CHG_STOP or, if NUM_ITER is specified, for an equal share of NUM_ITER
+    among the stages.
+
+    """
+    t = topology
+    d = dict(t.topydict)
+    del d['MULTIRES'] #  Not again for the coarse problem
+    d['NUM_ELEM_X'] = t.nelx // factor
+    d['NUM_ELEM_Y'] = t.nely // factor
+    d['NUM_ELEM_Z'] = t.nelz // factor
+    d['E2SDOFMAPI'] = _e2sdofmapinit(d['NUM_ELEM_X'], d['NUM_ELEM_Y'], \
+        t.dofpn)
+    # The same filter radius in physical length, if not too small:
+    d['FILT_RAD'] = max(t.filtrad / factor, min(t.filtrad, MIN_FILT_RAD))
+    # Boundary conditions on the coarse nodes:
+    d['FIX_DOF'] = np.unique(_coarse_dofs(t, t.fixdof, factor))
+    d['LOAD_DOF'], d['LOAD_VAL'] = _coarse_loads(t, t.loaddof, t.loadval, \
+        factor)
+    for k in range(2, t.loadcases + 1):
+        d['LOAD_DOF_%d' % k], d['LOAD_VAL_%d' % k] = _coarse_loads(t, \
+            t.topydict['LOAD_DOF_%d' % k], t.topydict['LOAD_VAL_%d' % k], \
+            factor)
+    if t.probtype == 'mech':
+        d['LOAD_DOF_OUT'], d['LOAD_VAL_OUT'] = _coarse_loads(t, \
+            t.loaddofout, t.loadvalout, factor)
+    d['PASV_ELEM'] = _coarse_elems(t._pasvmask, factor)
+    d['ACTV_ELEM'] = _coarse_elems(t._actvmask, factor)
+    # Length of the stage:
+    stages = len(stage_factors(t.topydict))
+    if 'MULTIRES_ITER' in d:
+        d['NUM_ITER'] = start + d['MULTIRES_ITER']
+    elif 'NUM_ITER' in d:
+        d['NUM_ITER'] = start + d['NUM_ITER'] // (stages + 1)
+    return d
+
+def prolongate(coarse, fine):
+    """
+    Continue the optimisation of the coarse topology on the fine one: set
+    the design variables (each coarse element's value to all the fine
+    elements in it, with the passive and active elements of the fine grid),
+    exponents of the approximation, continuation parameters and iteration
+    count of the fine topology. Both topologies' parameters must be set.
+
+    """
+    factor = fine.nelx // coarse.nelx
+    for name in PROLONG_ATTRS:
+        value = getattr(coarse, name, None)
+        if value is not None:
+            setattr(fine, name, _prolong(value, factor))
+    for name in CARRY_ATTRS:
+        if hasattr(coarse, name):
+            setattr(fine, name, getattr(coarse, name))
+    fine.desvars = fine._pasv_actv(fine.desvars)
+    fine.xphys = fine._physical(fine.desvars)
+    logger.info('Design prolongated from %s to %s elements at iteration %d' \
+        % (' x '.join(map(str, coarse.desvars.shape[::-1])), \
+        ' x '.join(map(str, fine.desvars.shape[::-1])), fine.itercount))
+
+
+# ===================================
+# === Private methods and helpers ===
+# ===================================
+def _prolong(x, factor):
+    """
+    Return x (shaped like the design variables of a coarse grid) with every
+    value repeated 'factor' times along every axis.
+
+    """
+    for axis in range(x.ndim):
+        x = np.repeat(x, factor, axis=axis)
+    return x
+
+def _coarse_dofs(t, dofs, factor):
+    """
+    Return the DOF numbers of the nodes of the coarse grid nearest to the
+    nodes of 'dofs' (of the grid of topology t).
+
+    """
+    x, y, z, comp = _dof_coords(dofs, t.dofpn, t.nelx, t.nely)
+    x, y, z = [np.floor(v / float(factor) + 0.5).astype(int) for v in (x, y, z)]
+    return _coords_dof(x, y, z, comp, t.dofpn, t.nelx // factor, \
+        t.nely // factor)
+
+def _coarse_loads(t, dofs, values, factor):
+    """
+    Return the DOF numbers and values of the loads on the coarse grid, the
+    loads on the same coarse DOF added.
+
+    """
+    cdofs, i = np.unique(_coarse_dofs(t, dofs, factor), return_inverse=True)
+    return cdofs, np.bincount(i, weights=values, minlength=cdofs.size)
+
+def _coarse_elems(mask, factor):
+    """
+    Return the numbers (see Topology._elem_mask) of the coarse elements of
+    which at least half the elements are set in mask (None for no elements).
+
+    """
+    if mask is None:
+        return np.array([], dtype=int)
+    shape = []
+    for n in mask.shape:
+        shape += [n // factor, factor]
+    fraction = mask.reshape(shape).mean(axis=tuple(range(1, 2 * mask.ndim, \
+        2)))
+    # Column-wise numbering, Y fastest:
+    return np.flatnonzero(np.swapaxes(fraction >= 0.5, -1, -2).ravel())
+
+# EOF multires.py
@@ -6,52 +6,156 @@ from numpy import array
 from .utils import get_logger
 from .visualisation import *
 from .topology import *
+from .output import BackgroundWriter, OutputSchedule, remove_files, MAXSIZE
+from .history import History
+from .multires import stage_factors, coarse_topydict, prolongate
 
 logger = get_logger(__name__)
 
 
 __all__ = ['optimise']
 
-def optimise(topology, save=True, dir='./iterations'):
-    # type: (Topology, bool, str) -> None
+def optimise(topology, save=True, dir='./iterations', background=True,
+             queue_size=MAXSIZE, queue_policy='block', every=1, thresholds=(),
+             final=True, keep_last=None, keep_every=None, filetype=None,
+             compress=False, history=None, checkpoint=None, checkpoint_every=10,
+             checkpoint_time=None):
+    # type: (Topology, bool, str, bool, int, str, int, tuple, bool, int, int, str, bool, str, str, int, float) -> None
+    """
+    Optimise the topology and write the images (2D) or geometry (3D) of the
+    design to 'dir'.
+
+    ADDITIONAL INPUTS (arguments and/or keyword arguments):
+        save -- if False, nothing is written.
+        background, queue_size, queue_policy -- write on a background thread
+            (True), process ('process') or not (False), see BackgroundWriter.
+            With queue_policy 'drop' only the regular ('every') snapshots
+            may be dropped, never those of thresholds or the final design.
+        every, thresholds, final -- which iterations are written, and
+        keep_last, keep_every -- which files are kept, see OutputSchedule.
+        filetype -- image type (2D, default 'png') or geometry type (3D,
+            'vtk' or 'vti', default 'vtk'). For 'vti' files a PVD file
+            (<probname>.pvd) of the kept files is written too.
+        compress -- zlib compress 'vti' files.
+        history -- file name of a history (HDF5 file, or npz directory if
+            h5py isn't installed) of all iterations, see History.
+        checkpoint -- file name of checkpoints of the optimisation, written
+            every 'checkpoint_every' iterations and/or 'checkpoint_time'
+            seconds, and at the end, see Topology.checkpoint and resume.
+
+    If MULTIRES is specified, the topology is optimised on coarser grids
+    first (nothing is written for those), see multires.py.
+
+    A resumed topology (see Topology.resume) continues at its iteration
+    count; its history, if any, is appended to.
+
+    EXAMPLES:
+        >>> optimise(t, every=10, keep_last=1) #  Only the final design is kept
+        >>> optimise(t, every=0, thresholds=(0.1, 0.01))
+        >>> optimise(t, filetype='vti', compress=True)
+        >>> optimise(t, save=False, history='beam.h5')
+        >>> optimise(t, checkpoint='beam.ckpt.npz', checkpoint_time=600)
+
+    """
     if not path.exists(dir):
         makedirs(dir)
+    start = topology.itercount #  Non-zero if resumed
+    if topology.topydict.get('MULTIRES') and not start:
+        _multires(topology, dir)
     etas_avg = []
-
-# Optimising function:
-    def _optimise(t):
-        t.fea()
-        t.sens_analysis()
-        t.filter_sens_sigmund()
-        t.update_desvars_oc()
-        # Below this line we print info and create images or geometry:
+    # Which iterations are written and which files are kept, see output.py:
+    schedule = OutputSchedule(every, thresholds, final, keep_last, keep_every)
+    # Images and geometry are written on a background thread (or process if
+    # background is 'process'), see output.py:
+    writer = None
+    if save and background:
+        writer = BackgroundWriter(queue_size, queue_policy, \
+            process=background == 'process')
+    if filetype is None:
+        filetype = 'vtk' if topology.nelz else 'png'
+    written = [] #  Iterations written (or queued) and kept
+    if history is not None:
+        history = History(history, start=start)
+    lastcheckpoint = [topology.itercount, time()] #  Iteration, wall time
+
+    def _fname(t, iternum):
+        return path.join(dir, '%s_%03d.%s' % (t.probname, iternum, filetype))
+
+    def _save(t, block=None):
         if t.nelz:
+            func = create_3d_geom
             params = {
                 'prefix': t.probname,
                 'iternum': t.itercount,
                 'time': 'none',
+                'filetype': filetype,
+                'compress': compress,
                 'dir': dir
             }
-            if save:
-                create_3d_geom(t.desvars, **params)
         else:
+            func = create_2d_imag
             params = {
                 'prefix': t.probname,
                 'iternum': t.itercount,
                 'time': 'none',
-                'filetype': 'png',
+                'filetype': filetype,
                 'dir': dir
             }
-            if save:
-                create_2d_imag(t.desvars, **params)
+        # The whole domain of symmetric problems:
+        x = t.full_domain(t.xphys)
+        if writer is None:
+            func(x, **params)
+        elif not writer.submit(func, x, block=block, **params):
+            return
+        written.append(t.itercount)
+        # Remove the files that are no longer kept (by the writer, after the
+        # files queued before them are written):
+        expired = schedule.written(t.itercount)
+        for i in expired:
+            written.remove(i)
+        fnames = [_fname(t, i) for i in expired]
+        if not fnames:
+            return
+        if writer is None:
+            remove_files(fnames)
+        else:
+            writer.submit(remove_files, fnames, block=True)
+
+# Optimising function:
+    def _optimise(t):
+        t.fea()
+        t.sens_analysis()
+        if t.filtertype == 'density':
+            t.filter_sens_density()
+        else:
+            t.filter_sens_sigmund()
+        if t.optimizer == 'mma':
+            t.update_desvars_mma()
+        else:
+            t.update_desvars_oc()
+        # Below this line we print info and create images or geometry:
+        due = save and schedule.due(t.itercount, t.change)
+        if due:
+            _save(t, block=True if due == 'threshold' else None)
 
-        
+        stats = t.iteration_stats()
         str_ = '%4i  | %3.6e | %3.3f | %3.4e | %3.3f | %3.3f |  %1.3f  |  %3.3f '
-        format_ = (t.itercount, t.objfval, t.desvars.mean(),\
-            t.change, t.p, t.q, t.eta.mean(), t.svtfrac)
+        format_ = (stats['iteration'], stats['objfval'], stats['volume'],\
+            stats['change'], stats['p'], stats['q'], stats['eta'], \
+            stats['svtfrac'])
         logger.info(str_ % format_)
         # Build a list of average etas:
-        etas_avg.append(t.eta.mean())
+        etas_avg.append(stats['eta'])
+        if history is not None:
+            history.append(t)
+        if checkpoint is not None:
+            due = checkpoint_every and \
+                t.itercount - lastcheckpoint[0] >= checkpoint_every
+            if checkpoint_time is not None:
+                due = due or time() - lastcheckpoint[1] >= checkpoint_time
+            if due:
+                t.checkpoint(checkpoint)
+                lastcheckpoint[:] = [t.itercount, time()]
 
 
     # Create (plot) initial design domain:
@@ -66,11 +170,27 @@ def optimise(topology, save=True, dir='./iterations'):
 
     # Try CHG_STOP criteria, if not defined (error), use NUM_ITER for iterations:
     try:
-        while topology.change > topology.chgstop:
-            _optimise(topology)
-    except AttributeError:
-        for i in range(topology.numiter):
-            _optimise(topology)
+        try:
+            while topology.change > topology.chgstop:
+                _optimise(topology)
+        except AttributeError:
+            for i in range(topology.itercount, topology.numiter):
+                _optimise(topology)
+        if checkpoint is not None and lastcheckpoint[0] != topology.itercount:
+            topology.checkpoint(checkpoint)
+        # The final design, if it wasn't written (or was dropped):
+        if save and schedule.final and written[-1:] != [topology.itercount]:
+            _save(topology, block=True)
+    finally:
+        # Write the queued output, also if the optimisation failed:
+        if writer is not None:
+            writer.close()
+        if history is not None:
+            history.close()
+        # Collect the iterations in a ParaView data file:
+        if save and filetype == 'vti' and written:
+            create_pvd([_fname(topology, i) for i in written], \
+                path.join(dir, topology.probname + '.pvd'), written)
     te = time()
 
     # Print solid-void ratio info:
@@ -82,6 +202,31 @@ def optimise(topology, save=True, dir='./iterations'):
         %(topology.itercount, (te - ti) / 60, (te - ti) / topology.itercount))
     logger.info('Average of all ETA\'s = %3.3f (average of all a\'s = %3.3f)' \
         % (array(etas_avg).mean(), 1/array(etas_avg).mean() - 1))
-
-
-
+    # Print linear solver info:
+    logger.info('Linear solver (%s): %d iterations in total, %d '
+        'factorisations or preconditioner builds' % (topology.solver.name, \
+        topology.solver.stats['total_iterations'], \
+        topology.solver.stats['rebuilds']))
+
+
+def _multires(topology, dir):
+    """
+    Optimise the problem of the topology on coarser grids, and continue
+    with the prolongated design on the topology's grid, see multires.py.
+
+    """
+    coarse = None
+    factors = stage_factors(topology.topydict)
+    for i, factor in enumerate(factors):
+        t = Topology(topydict=coarse_topydict(topology, factor, \
+            coarse.itercount if coarse else 0))
+        logger.info('\nMulti-resolution stage %d of %d (grid coarsened %d '
+            'times):' % (i + 1, len(factors) + 1, factor))
+        t.set_top_params()
+        if coarse is not None:
+            prolongate(coarse, t)
+        optimise(t, save=False, dir=dir, background=False)
+        coarse = t
+    logger.info('\nMulti-resolution stage %d of %d (problem grid):' % \
+        (len(factors) + 1, len(factors) + 1))
+    prolongate(coarse, topology)
@@ -0,0 +1,267 @@
+"""
+# =============================================================================
+# Output of the per-iteration images and geometry files of an optimisation:
+# when to write them and which to keep (OutputSchedule), written on a
+# background thread so that slow file I/O doesn't stall the optimisation
+# (BackgroundWriter), see optimise.
+#
+# Author: William Hunter
+# Copyright (C) 2008, 2015, William Hunter.
+# =============================================================================
+"""
+import os
+import threading
+import multiprocessing
+try:
+    import queue
+except ImportError: #  Python 2
+    import Queue as queue
+
+import numpy as np
+
+from .utils import get_logger
+
+logger = get_logger(__name__)
+__all__ = ['OutputSchedule', 'BackgroundWriter', 'remove_files']
+
+
+MAXSIZE = 8 #  Default maximum number of snapshots waiting to be written
+POLICIES = ('block', 'drop') #  What to do with a snapshot if the queue is full
+POLL = 0.5 #  Seconds between checks that the worker is alive, full queue
+
+
+# =============================
+# === Output schedule class ===
+# =============================
+class OutputSchedule(object):
+    """
+    When to write the output of an optimisation, and which of the written
+    files to keep (retention). An iteration is written if it is a multiple of
+    'every', or if it is the first at which the change of the design
+    variables drops below one of the 'thresholds'. Only the files of the
+    last 'keep_last' written iterations are kept, plus those of iterations
+    that are multiples of 'keep_every'.
+
+    ADDITIONAL INPUTS (arguments and/or keyword arguments):
+        every -- write every Nth iteration (0 or None: no regular output).
+        thresholds -- change values, see above.
+        final -- if True, the final design is always written.
+        keep_last -- number of written iterations to keep (None: all, or 1
+                     if keep_every is given).
+        keep_every -- also keep the files of every Mth iteration.
+
+    EXAMPLES:
+        >>> schedule = OutputSchedule(every=10, thresholds=(0.1, 0.01))
+        >>> schedule = OutputSchedule(every=0) #  Final design only
+        >>> schedule = OutputSchedule(keep_last=3, keep_every=50)
+
+    """
+    def __init__(self, every=1, thresholds=(), final=True, keep_last=None, \
+    keep_every=None):
+        if every and every < 0 or keep_every and keep_every < 0:
+            raise ValueError('Output intervals (every, keep_every) must be '
+                             'positive.')
+        if keep_last is None and keep_every:
+            keep_last = 1
+        if keep_last is not None and keep_last < 1:
+            raise ValueError('At least one written iteration must be kept '
+                             '(keep_last).')
+        self.every = every
+        self.thresholds = sorted(thresholds, reverse=True)
+        self.final = final
+        self.keep_last = keep_last
+        self.keep_every = keep_every
+        self._pending = list(self.thresholds) #  Thresholds not crossed yet
+        self._written = [] #  Iterations that may expire, oldest first
+
+    def due(self, iteration, change):
+        """
+        Return whether the output of the iteration is to be written: False,
+        'threshold' (a threshold was crossed) or 'every'.
+
+        """
+        due = 'every' if self.every and iteration % self.every == 0 else False
+        while self._pending and change < self._pending[0]:
+            self._pending.pop(0)
+            due = 'threshold'
+        return due
+
+    def written(self, iteration):
+        """
+        Record that the output of the iteration was written. Return the
+        (earlier) iterations whose files are no longer kept.
+
+        """
+        if self.keep_last is None:
+            return []
+        self._written.append(iteration)
+        expired = []
+        while len(self._written) > self.keep_last:
+            i = self._written.pop(0)
+            if not (self.keep_every and i % self.keep_every == 0):
+                expired.append(i)
+        return expired
+
+
+# ===============================
+# === Background writer class ===
+# ===============================
+class BackgroundWriter(object):
+    """
+    Write output files on a background thread (or process). Each call to
+    submit puts a snapshot (a copy) of an array into a bounded queue, the
+    worker then calls the writer function, e.g., create_2d_imag, with it.
+    A worker process doesn't compete with the optimisation for Python's
+    global interpreter lock (Matplotlib is mostly Python code), but the
+    writer function and its arguments must be picklable. If the queue is full,
+    submit waits for space (policy 'block', the default) or the snapshot is
+    dropped (policy 'drop', so that the optimisation is never blocked by slow
+    disks; the number dropped is logged by close). Errors of the writer
+    function are logged and counted, they don't stop the optimisation. If
+    the worker dies (e.g., a worker process is killed), the snapshots it
+    didn't write are counted as dropped, and submit never waits for it. Call
+    close (or use a with statement) to write all queued snapshots.
+
+    ADDITIONAL INPUTS (arguments and/or keyword arguments):
+        maxsize -- maximum number of queued snapshots.
+        policy -- one of 'block' or 'drop', see above.
+        process -- if True, use a worker process instead of a thread.
+
+    EXAMPLES:
+        >>> with BackgroundWriter() as writer:
+        ...     writer.submit(create_2d_imag, t.xphys, prefix='mbb_beam')
+
+    """
+    def __init__(self, maxsize=MAXSIZE, policy='block', process=False):
+        if policy not in POLICIES:
+            raise ValueError('Unknown output queue policy: {}. Choose one of: '
+                             '{}'.format(policy, ', '.join(POLICIES)))
+        self.policy = policy
+        self._dropped = 0
+        self._submitted = 0
+        self._process = process
+        if process:
+            self._queue = multiprocessing.Queue(maxsize)
+            self._counts = multiprocessing.Array('i', 2)
+            self._worker = multiprocessing.Process(target=_work, \
+                args=(self._queue, self._counts), name='topy-writer')
+        else:
+            self._queue = queue.Queue(maxsize)
+            self._counts = [0, 0]
+            self._worker = threading.Thread(target=_work, \
+                args=(self._queue, self._counts), name='topy-writer')
+        self._worker.daemon = True #  Don't keep the interpreter alive
+        self._worker.start()
+
+    @property
+    def stats(self):
+        """
+        Numbers of snapshots written (including removals of files, see
+        remove_files), snapshots dropped and errors.
+
+        """
+        return {'written': self._counts[0], 'dropped': self._dropped,
+                'errors': self._counts[1]}
+
+    def submit(self, func, x, block=None, **kwargs):
+        """
+        Queue func(x, **kwargs), with a copy of x if it is an array. Return
+        True if queued, False if dropped. 'block' overrides the policy, e.g.,
+        block=True for a snapshot (or removal of files) that mustn't be
+        dropped.
+
+        """
+        if block is None:
+            block = self.policy == 'block'
+        if isinstance(x, np.ndarray):
+            x = x.copy()
+        if not self._put((func, x, kwargs), block):
+            self._dropped += 1
+            logger.debug('Output queue full or worker dead, snapshot dropped')
+            return False
+        self._submitted += 1
+        return True
+
+    def close(self):
+        """
+        Write all queued snapshots and stop the worker.
+
+        """
+        if self._put(None, True): #  Sentinel, always after all snapshots
+            self._worker.join()
+        if self._process and self._worker.exitcode:
+            logger.error('Output worker process died (exit code %d)' % \
+                self._worker.exitcode)
+        # Snapshots queued but neither written nor failed (the worker died):
+        self._dropped += self._submitted - sum(self._counts[:2])
+        self._submitted = sum(self._counts[:2])
+        stats = self.stats
+        if stats['dropped']:
+            logger.warning('Output: %d snapshots dropped' % stats['dropped'])
+        if stats['dropped'] or stats['errors']:
+            logger.info('Output: %d files written, %d snapshots dropped, %d '
+                'errors' % (stats['written'], stats['dropped'], \
+                stats['errors']))
+
+    def _put(self, item, block):
+        """
+        Put item into the queue, waiting for space if block is True. Return
+        False if the queue is full (and block is False) or the worker is
+        dead.
+
+        """
+        while self._worker.is_alive():
+            try:
+                self._queue.put(item, block, POLL)
+                return True
+            except queue.Full:
+                if not block:
+                    return False
+        if self._process:
+            # Don't wait at exit to flush data the dead worker won't read:
+            self._queue.cancel_join_thread()
+        return False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+
+# ========================
+# === Public functions ===
+# ========================
+def remove_files(fnames):
+    """
+    Remove the files, if they exist (a snapshot might have been dropped).
+
+    """
+    for fname in fnames:
+        if os.path.exists(fname):
+            os.remove(fname)
+
+
+# ===================================
+# === Private methods and helpers ===
+# ===================================
+def _work(q, counts):
+    """
+    Worker loop, write the queued snapshots until the sentinel (None).
+    Counts the files written (counts[0]) and errors (counts[1]).
+
+    """
+    while True:
+        item = q.get()
+        if item is None:
+            break
+        func, x, kwargs = item
+        try:
+            func(x, **kwargs)
+            counts[0] += 1
+        except Exception as e:
+            counts[1] += 1
+            logger.error('Output could not be written: {}'.format(e))
+
+# EOF output.py
@@ -8,7 +8,6 @@
 """
 
 import numpy as np
-from pysparse import spmatrix
 
 from .utils import get_logger
 from .elements import *
@@ -58,6 +57,31 @@ def tpd_file2dict(fname):
     return d
 
 
+def tpd_file2config(fname):
+    """
+    Read in the parameters from a TPD file without converting them, i.e.,
+    return a config dictionary of strings (see config2dict), e.g., to change
+    some parameters before the dictionary is made.
+
+    INPUTS:
+        fname -- file name of tpd file.
+
+    OUTPUTS:
+        A dictionary.
+
+    EXAMPLES:
+        >>> config = tpd_file2config('2d_beam.tpd')
+        >>> config['FILT_RAD'] = 2.0
+        >>> d = config2dict(config)
+
+    """
+    with open(fname, 'r') as f:
+        s = f.read()
+    if not s.startswith('[ToPy Problem Definition File v2007]'):
+        raise Exception('Input file or format not recognised')
+    return _splitv2007file(s)
+
+
 def config2dict(config):
     """
     Read in *all* the parameters from config and return a dictionary.
@@ -91,6 +115,14 @@ def _parsev2007file(s):
     """
     Parse a version 2007 ToPy problem definition file to a dictionary.
 
+    """
+    return _parse_dict(_splitv2007file(s))
+
+def _splitv2007file(s):
+    """
+    Split a version 2007 ToPy problem definition file into a dictionary of
+    (unconverted) strings.
+
     """
     snew = s.splitlines()[1:]
     snew = [line.split('#')[0] for line in snew] # Get rid of all comments
@@ -99,7 +131,7 @@ def _parsev2007file(s):
     snew = list(filter(len, snew))
 
     d = dict([line.split(':') for line in snew]) 
-    return _parse_dict(d)
+    return d
 
 
  
@@ -176,6 +208,79 @@ def _parse_dict(d):
     except KeyError:
         pass
 
+    # Check for optimiser (update method of the design variables):
+    try:
+        d['OPTIMIZER'] = d['OPTIMIZER'].lower()
+    except KeyError:
+        pass
+    try:
+        d['MMA_MOVE'] = float(d['MMA_MOVE'])
+    except KeyError:
+        pass
+
+    # Check for filter type and Heaviside projection parameters:
+    try:
+        d['FILTER'] = d['FILTER'].lower()
+    except KeyError:
+        pass
+    for key, dtype in (('HEAVISIDE', float), ('HEAVISIDE_ETA', float), \
+    ('BETA_MAX', float), ('BETA_HOLD', int), ('BETA_CON', int)):
+        try:
+            d[key] = dtype(d[key])
+        except KeyError:
+            pass
+
+    # Check for sensitivity filter method (see filters.py):
+    try:
+        d['FILTER_METHOD'] = d['FILTER_METHOD'].lower()
+    except KeyError:
+        pass
+
+    # Check for linear solver and preconditioner (see solvers.py):
+    try:
+        d['SOLVER'] = d['SOLVER'].lower()
+    except KeyError:
+        pass
+    try:
+        d['PRECON'] = d['PRECON'].lower()
+    except KeyError:
+        pass
+    try:
+        d['SOLVER_TOL'] = float(d['SOLVER_TOL'])
+    except KeyError:
+        pass
+    try:
+        d['SOLVER_MAXITER'] = int(d['SOLVER_MAXITER'])
+    except KeyError:
+        pass
+
+    # Check for block size of the sensitivity analysis:
+    try:
+        d['SENS_CHUNK'] = int(d['SENS_CHUNK'])
+    except KeyError:
+        pass
+
+    # Check for warm start and preconditioner re-use settings:
+    try:
+        d['WARM_START'] = d['WARM_START'].lower()
+    except KeyError:
+        pass
+    try:
+        d['PRECON_REUSE'] = int(d['PRECON_REUSE'])
+    except KeyError:
+        pass
+    try:
+        d['PRECON_DEGRADE'] = float(d['PRECON_DEGRADE'])
+    except KeyError:
+        pass
+
+    # Check for multi-resolution continuation (see multires.py):
+    for key in ('MULTIRES', 'MULTIRES_ITER'):
+        try:
+            d[key] = int(d[key])
+        except KeyError:
+            pass
+
     # How to do the following compactly (perhaps loop through keys)? Check for
     # keys and create fixed DOF vector, loaded DOF vector and load values
     # vector.
@@ -206,15 +311,40 @@ def _parse_dict(d):
     z = d.get('LOAD_VALU_Z_OUT', '')
     d['LOAD_VAL_OUT'] = _valvec(x, y, z)
 
+    # Further load cases (the loads above are load case 1), e.g.,
+    # LOAD_NODE_Y_2 and LOAD_VALU_Y_2, to LOAD_DOF_2 and LOAD_VAL_2:
+    ncases = 1
+    while _load_case_keys(d, ncases + 1):
+        ncases += 1
+        x = d.get('LOAD_NODE_X_%d' % ncases, '')
+        y = d.get('LOAD_NODE_Y_%d' % ncases, '')
+        z = d.get('LOAD_NODE_Z_%d' % ncases, '')
+        d['LOAD_DOF_%d' % ncases] = _dofvec(x, y, z, dofpn)
+
+        x = d.get('LOAD_VALU_X_%d' % ncases, '')
+        y = d.get('LOAD_VALU_Y_%d' % ncases, '')
+        z = d.get('LOAD_VALU_Z_%d' % ncases, '')
+        d['LOAD_VAL_%d' % ncases] = _valvec(x, y, z)
+    d['LOAD_CASES'] = ncases
+    # Weights of the load cases' objective function values (default 1):
+    try:
+        d['LOAD_WEIGHT'] = _tpd2vec(d['LOAD_WEIGHT'])
+    except KeyError:
+        d['LOAD_WEIGHT'] = np.ones(ncases)
+    except AttributeError:
+        pass
+
 
     # The following entries are created and added to the dictionary,
     # they are not specified in the ToPy problem definition file:
-    Ksize = d['DOF_PN'] * (d['NUM_ELEM_X'] + 1) * (d['NUM_ELEM_Y'] + 1) * \
-    (d['NUM_ELEM_Z'] + 1) #  Memory allocation hint for PySparse
-    d['K'] = spmatrix.ll_mat_sym(Ksize, Ksize) #  Global stiffness matrix
     d['E2SDOFMAPI'] =  _e2sdofmapinit(d['NUM_ELEM_X'], d['NUM_ELEM_Y'], \
     d['DOF_PN']) #  Initial element to structure DOF mapping
 
+    # Symmetric problems are reduced to the part on one side of the symmetry
+    # plane(s):
+    if 'SYMMETRY' in d:
+        d = _symmetric_part(d)
+
     return d
 
 def _tpd2vec(seq, dtype=float):
@@ -278,6 +408,146 @@ def _dofvec(x, y, z, dofpn):
         dofz = (vec_z - 1) * dofpn + 2
     return np.r_[dofx, dofy, dofz].astype(int)
 
+def _dof_coords(dofs, dofpn, nelx, nely):
+    """
+    Return the X, Y and Z node coordinates (in elements) and the component
+    (0, 1 or 2) of the structure DOF numbers 'dofs'.
+
+    """
+    node, comp = np.divmod(np.asarray(dofs, dtype=int), dofpn)
+    y = node % (nely + 1)
+    x = node // (nely + 1) % (nelx + 1)
+    z = node // ((nelx + 1) * (nely + 1))
+    return x, y, z, comp
+
+def _coords_dof(x, y, z, comp, dofpn, nelx, nely):
+    """
+    Return the structure DOF numbers of node coordinates and components, see
+    _dof_coords.
+
+    """
+    return dofpn * (y + x * (nely + 1) + z * (nelx + 1) * (nely + 1)) + comp
+
+def _symmetric_part(d):
+    """
+    Reduce the problem to the part of the domain on the lower side of its
+    symmetry plane(s), i.e., the planes through the middle of the domain
+    normal to the SYMMETRY axes: halve the number of elements along these
+    axes, add the symmetry boundary conditions (no displacement normal to a
+    plane; nothing for heat problems, i.e., no flux), keep the constraints,
+    loads and passive and active elements of the part, and halve the loads
+    on a plane (once for every plane the node is on). Raise ValueError if the
+    constraints, loads or passive and active elements of the whole domain
+    aren't symmetric, i.e., if those on the upper side of a plane don't
+    mirror those on the lower side (loads normal to the plane change sign).
+
+    """
+    sym = ''.join(sorted(set(str(d['SYMMETRY']).lower()) - set('|, ')))
+    nel = {'x': d['NUM_ELEM_X'], 'y': d['NUM_ELEM_Y'], 'z': d['NUM_ELEM_Z']}
+    if not sym or set(sym) - set('xyz') or ('z' in sym and not nel['z']):
+        raise ValueError('SYMMETRY must be one or more of x, y and z (3D).')
+    if any(nel[axis] % 2 for axis in sym):
+        raise ValueError('The number of elements must be even along the '
+                         'SYMMETRY axes.')
+    half = dict((axis, nel[axis] // 2 if axis in sym else nel[axis]) for \
+        axis in 'xyz')
+    dofpn = d['DOF_PN']
+    ndof = dofpn * (nel['x'] + 1) * (nel['y'] + 1) * (nel['z'] + 1)
+
+    def check(key, dofs, values=None):
+        dofs = np.asarray(dofs, dtype=int)
+        x, y, z, comp = _dof_coords(dofs, dofpn, nel['x'], nel['y'])
+        for axis in sym:
+            coords = {'x': x, 'y': y, 'z': z}
+            coords[axis] = nel[axis] - coords[axis]
+            mirror = _coords_dof(coords['x'], coords['y'], coords['z'], \
+                comp, dofpn, nel['x'], nel['y'])
+            if values is None:
+                symmetric = np.array_equal(np.unique(dofs), np.unique(mirror))
+            else:
+                sign = 1
+                if dofpn > 1:
+                    sign = np.where(comp == 'xyz'.index(axis), -1, 1)
+                symmetric = np.allclose(np.bincount(dofs, values, ndof), \
+                    np.bincount(mirror, sign * values, ndof), 1e-9, 0)
+            if not symmetric:
+                raise ValueError('The problem is not symmetric about the '
+                                 'SYMMETRY plane normal to the {} axis: {} '
+                                 'differs on either side.'.format(axis, key))
+
+    check('FIX_DOF', d['FIX_DOF'])
+    check('LOAD_DOF', d['LOAD_DOF'], d['LOAD_VAL'])
+    for k in range(2, d.get('LOAD_CASES', 1) + 1):
+        check('LOAD_DOF_%d' % k, d['LOAD_DOF_%d' % k], d['LOAD_VAL_%d' % k])
+    check('LOAD_DOF_OUT', d['LOAD_DOF_OUT'], d['LOAD_VAL_OUT'])
+
+    def part(dofs, values=None):
+        x, y, z, comp = _dof_coords(dofs, dofpn, nel['x'], nel['y'])
+        coords = {'x': x, 'y': y, 'z': z}
+        keep = np.ones(x.size, dtype=bool)
+        weights = np.ones(x.size)
+        for axis in sym:
+            keep &= coords[axis] <= half[axis]
+            weights[coords[axis] == half[axis]] /= 2
+        dofs = _coords_dof(x, y, z, comp, dofpn, half['x'], half['y'])[keep]
+        if values is None:
+            return dofs
+        return dofs, (np.asarray(values) * weights)[keep]
+
+    d = d.copy()
+    fixdof = [part(d['FIX_DOF'])]
+    if dofpn > 1:
+        # Symmetry boundary conditions, the nodes on a plane can't move
+        # normal to it:
+        z, y, x = np.indices((half['z'] + 1, half['y'] + 1, half['x'] + 1))
+        coords = {'x': x, 'y': y, 'z': z}
+        for axis in sym:
+            plane = coords[axis] == half[axis]
+            fixdof.append(_coords_dof(x[plane], y[plane], z[plane], \
+                'xyz'.index(axis), dofpn, half['x'], half['y']))
+    d['FIX_DOF'] = np.unique(np.concatenate(fixdof)).astype(int)
+    d['LOAD_DOF'], d['LOAD_VAL'] = part(d['LOAD_DOF'], d['LOAD_VAL'])
+    for k in range(2, d.get('LOAD_CASES', 1) + 1):
+        d['LOAD_DOF_%d' % k], d['LOAD_VAL_%d' % k] = part( \
+            d['LOAD_DOF_%d' % k], d['LOAD_VAL_%d' % k])
+    d['LOAD_DOF_OUT'], d['LOAD_VAL_OUT'] = part(d['LOAD_DOF_OUT'], \
+        d['LOAD_VAL_OUT'])
+    # Elements, numbered column-wise (Y fastest), then in Z:
+    for key in ('PASV_ELEM', 'ACTV_ELEM'):
+        e = np.asarray(d[key], dtype=int)
+        coords = {'y': e % nel['y'], 'x': e // nel['y'] % nel['x'], \
+            'z': e // (nel['x'] * nel['y'])}
+        for axis in sym:
+            mirror = dict(coords)
+            mirror[axis] = nel[axis] - 1 - coords[axis]
+            if not np.array_equal(np.unique(e), np.unique(mirror['y'] + \
+                mirror['x'] * nel['y'] + mirror['z'] * nel['x'] * nel['y'])):
+                raise ValueError('The problem is not symmetric about the '
+                                 'SYMMETRY plane normal to the {} axis: {} '
+                                 'differs on either side.'.format(axis, key))
+        keep = np.ones(e.size, dtype=bool)
+        for axis in sym:
+            keep &= coords[axis] < half[axis]
+        d[key] = (coords['y'] + coords['x'] * half['y'] + coords['z'] * \
+            half['x'] * half['y'])[keep]
+    d['NUM_ELEM_X'], d['NUM_ELEM_Y'], d['NUM_ELEM_Z'] = half['x'], \
+        half['y'], half['z']
+    d['E2SDOFMAPI'] = _e2sdofmapinit(half['x'], half['y'], dofpn)
+    d['SYMMETRY'] = sym
+    logger.info('Symmetric problem (SYMMETRY = %s), reduced to %s elements' \
+        % (sym, ' x '.join(str(half[axis]) for axis in 'xyz' if axis != 'z' \
+        or nel['z'])))
+    return d
+
+def _load_case_keys(d, k):
+    """
+    Return True if any of the load keys of load case k (k > 1), e.g.,
+    LOAD_NODE_X_2, is in d.
+
+    """
+    return any('LOAD_%s_%s_%d' % (kind, axis, k) in d for kind in \
+        ('NODE', 'VALU') for axis in 'XYZ')
+
 def _valvec(x, y, z):
     """
     Values (e.g., of loads) vector.
@@ -342,13 +612,23 @@ def _checkparams(d):
         raise ValueError('Load vector and load value vector lengths not equal.')
     if d['LOAD_VAL'].size + d['LOAD_DOF'].size == 0:
         raise ValueError('No load(s) or no loaded node(s) specified.')
+    ncases = d.get('LOAD_CASES', 1)
+    for k in range(2, ncases + 1):
+        if d['LOAD_DOF_%d' % k].size != d['LOAD_VAL_%d' % k].size:
+            raise ValueError('Load vector and load value vector lengths not '
+                             'equal (load case %d).' % k)
+    if ncases > 1 and d['PROB_TYPE'] == 'mech':
+        raise ValueError('Multiple load cases are not supported for '
+                         'mechanism synthesis.')
+    if 'LOAD_WEIGHT' in d and len(d['LOAD_WEIGHT']) != ncases:
+        raise ValueError('LOAD_WEIGHT must have one weight per load case.')
     # Check for rigid body motion and warn user:
     if d['DOF_PN'] == 2:
         if 'FXTR_NODE_X' not in d or 'FXTR_NODE_Y' not in d:
             logger.info('\n\tToPy warning: Rigid body motion in 2D is possible!\n')
     if d['DOF_PN'] == 3:
-        if not d.has_key('FXTR_NODE_X') or not d.has_key('FXTR_NODE_Y')\
-        or not d.has_key('FXTR_NODE_Z'):
+        if 'FXTR_NODE_X' not in d or 'FXTR_NODE_Y' not in d \
+        or 'FXTR_NODE_Z' not in d:
             logger.info('\n\tToPy warning: Rigid body motion in 3D is possible!\n')
 
 # EOF parser.py
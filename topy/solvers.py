@@ -0,0 +1,823 @@
+"""
+# =============================================================================
+# Linear solvers (backends) for the finite element analysis in ToPy.
+#
+# A solver is selected by name with the SOLVER keyword in the TPD file (or
+# config dictionary), see 'SOLVERS' below for the available names. Every
+# solver reports the same statistics, see LinearSolver.
+#
+# Author: William Hunter
+# Copyright (C) 2008, 2015, William Hunter.
+# =============================================================================
+"""
+from time import time
+
+import numpy as np
+import scipy
+from scipy.sparse import tril, diags, identity as speye, kron, csr_matrix
+from scipy.sparse.linalg import splu, spilu, minres, LinearOperator
+from scipy.sparse.csgraph import reverse_cuthill_mckee
+
+from .utils import get_logger
+
+# Optional backends, only available if installed:
+try:
+    from pysparse import spmatrix, superlu, itsolvers, precon
+except ImportError:
+    spmatrix = None
+try:
+    import pyamg
+except ImportError:
+    pyamg = None
+try:
+    from sksparse.cholmod import cholesky
+except ImportError:
+    cholesky = None
+
+logger = get_logger(__name__)
+__all__ = ['SOLVERS', 'PRECONS', 'LinearSolver', 'get_solver',
+           'default_solver', 'register_solver', 'pcg', 'block_pcg']
+
+
+TOL = 1e-8 #  Default relative residual tolerance of iterative solvers
+MAXITER = 8000 #  Default maximum number of iterations of iterative solvers
+STALE_ITERS = 4 #  Iterations of a re-used preconditioner, see LinearSolver
+BLOCK_MIN = 3 #  Smallest block of right hand sides solved at once (CG)
+
+SOLVERS = {} #  Registry of solver classes, filled by register_solver
+
+# Geometric multigrid parameters:
+MG_SMOOTH = 2 #  Number of (damped Jacobi) pre- and post-smoothing sweeps
+MG_OMEGA = 0.6 #  Jacobi damping factor
+MG_COARSE = 2000 #  Coarsest grid size (DOF), solved directly
+
+# SciPy renamed the tolerance keyword argument of its iterative solvers:
+_TOLKW = 'rtol' if tuple(map(int, scipy.__version__.split('.')[:2])) >= \
+    (1, 12) else 'tol'
+
+
+# ========================
+# === Public functions ===
+# ========================
+def register_solver(name):
+    """
+    Class decorator that adds a LinearSolver subclass to the registry of
+    solvers under 'name' (the value of the SOLVER keyword).
+
+    EXAMPLES:
+        >>> @register_solver('mysolver')
+        ... class MySolver(LinearSolver):
+        ...     pass
+
+    """
+    def decorator(cls):
+        cls.name = name
+        SOLVERS[name] = cls
+        return cls
+    return decorator
+
+def get_solver(name, **kwargs):
+    """
+    Return an instance of the linear solver registered as 'name'. Keyword
+    arguments are passed to the solver, see LinearSolver.
+
+    EXAMPLES:
+        >>> solver = get_solver('cg', precon='jacobi', tol=1e-6)
+
+    """
+    try:
+        cls = SOLVERS[name]
+    except KeyError:
+        raise ValueError('Unknown linear solver (SOLVER): {}. Choose one of: '
+                         '{}'.format(name, ', '.join(sorted(SOLVERS))))
+    return cls(**kwargs)
+
+def default_solver(direct):
+    """
+    Return the name of the default solver, a direct solver if 'direct' is
+    True (2D problems) or an iterative one otherwise (3D problems). PySparse
+    is used if installed, else SciPy.
+
+    """
+    if direct:
+        return 'superlu' if spmatrix else 'splu'
+    return 'pysparse-pcg' if spmatrix else 'cg'
+
+
+# ================================
+# === Base linear solver class ===
+# ================================
+class LinearSolver(object):
+    """
+    Base class of all linear solvers. A solver is set up once per stiffness
+    matrix (factorisation or preconditioner), whereafter any number of right
+    hand sides can be solved, one at a time or as a block (the columns of a
+    2D array, e.g., of several load cases).
+
+    INPUTS (keyword arguments):
+        tol -- relative residual tolerance (iterative solvers).
+        maxiter -- maximum number of iterations (iterative solvers).
+        precon -- name of the preconditioner, see PRECONS (iterative solvers).
+                  A ValueError is raised if the solver doesn't take it.
+        reuse -- re-use the preconditioner for this many setups, i.e., design
+                 iterations (iterative solvers, default 1).
+        degrade -- rebuild the preconditioner before 'reuse' setups have
+                   passed if a solve takes more than 'degrade' times the
+                   iterations of the first solve after the last rebuild
+                   (iterative solvers, default None).
+
+    A re-used preconditioner is rebuilt, and the solve repeated, if a solve
+    with it doesn't converge within 'degrade' (default STALE_ITERS) times the
+    iterations of the first solve after the last rebuild. Re-use is a
+    trade-off: it saves setups but costs iterations, as a preconditioner of
+    an earlier design is a worse one; it pays off only if the setup is
+    expensive compared to the solves (e.g., 'ilu' or 'amg' of large 3D
+    problems, not 'mgcg').
+
+    After every call to setup and solve, the 'stats' dictionary holds:
+        iterations -- number of iterations of the last solve (0 if direct),
+                      of a block those of its slowest column if solved at
+                      once, else of all its columns.
+        residual -- relative residual norm of the last solve.
+        setup_time -- wall time of the last setup, in seconds.
+        solve_time -- wall time of the last solve, in seconds.
+        total_iterations -- number of iterations of all solves.
+        rebuilds -- number of factorisations or preconditioner rebuilds.
+
+    EXAMPLES:
+        >>> solver = get_solver('splu')
+        >>> solver.setup(K)
+        >>> solver.solve(b, x)
+        >>> solver.stats['solve_time']
+
+    """
+    name = None
+    direct = False
+    matrix_free = False #  True if K is an assembly.ElementOperator
+    default_precon = None
+    precons = () #  Preconditioners taken, None for any of PRECONS
+
+    def __init__(self, tol=TOL, maxiter=MAXITER, precon=None, reuse=1,
+                 degrade=None):
+        if precon is not None:
+            if self.precons is None:
+                _get_precon(precon)
+            elif not self.precons:
+                raise ValueError('SOLVER = {} takes no preconditioner '
+                                 '(PRECON).'.format(self.name))
+            elif precon not in self.precons:
+                raise ValueError('SOLVER = {} only supports PRECON = '
+                                 '{}.'.format(self.name, \
+                                 ' or '.join(self.precons)))
+        self.tol = tol
+        self.maxiter = maxiter
+        self.precon = precon or self.default_precon
+        self.reuse = reuse
+        self.degrade = degrade
+        self.K = None
+        self._age = 0 #  Number of setups since the last rebuild
+        self._refitr = None #  Iterations of first solve after last rebuild
+        self.stats = {'iterations': 0, 'residual': 0.0, 'setup_time': 0.0,
+                      'solve_time': 0.0, 'total_iterations': 0, 'rebuilds': 0}
+
+    def setup(self, K):
+        """
+        Factorise K or build its preconditioner (K in SciPy CSR format). An
+        iterative solver may keep its previous preconditioner, see 'reuse'
+        and 'degrade' above.
+
+        """
+        ti = time()
+        self.K = K
+        self._update(K)
+        if self.direct or self._rebuild():
+            self._setup(K)
+            self._age = 0
+            self._refitr = None
+            self.stats['rebuilds'] += 1
+        self._age += 1
+        self.stats['setup_time'] = time() - ti
+
+    def solve(self, b, x):
+        """
+        Solve K x = b, for a vector b or a block of vectors (the columns of
+        b). On entry x holds the initial guess (iterative solvers), on exit
+        the solution; x is updated in place.
+
+        """
+        ti = time()
+        reused = not self.direct and self._age > 1
+        try:
+            numitr, relerr = self._attempt(b, x, reused)
+        except _NotConverged as e:
+            if not reused:
+                self._fail(e)
+            # Rebuild the (too stale) preconditioner and solve again, from
+            # where the first attempt got to:
+            logger.debug('Rebuilding preconditioner, solve did not converge '
+                         'in {} iterations'.format(e.numitr))
+            ts = time()
+            self._setup(self.K)
+            self._age = 1
+            self._refitr = None
+            self.stats['rebuilds'] += 1
+            self.stats['setup_time'] += time() - ts
+            self.stats['total_iterations'] += e.numitr
+            try:
+                numitr, relerr = self._attempt(b, x, False)
+            except _NotConverged as e:
+                self._fail(e)
+        self.stats['solve_time'] = time() - ti
+        self.stats['iterations'] = numitr
+        self.stats['residual'] = relerr
+        self.stats['total_iterations'] += numitr
+        if self._refitr is None:
+            self._refitr = numitr
+
+    def set_grid(self, nelx, nely, nelz, dofpn, freedof):
+        """
+        Inform the solver of the structured grid the matrices stem from (not
+        required by all solvers).
+
+        """
+        pass
+
+    def state(self):
+        """
+        Return the state of the solver that carries over between setups (the
+        age of the preconditioner and the statistics) as a dictionary, see
+        restore.
+
+        """
+        state = dict(self.stats)
+        state['age'] = self._age
+        if self._refitr is not None:
+            state['refitr'] = self._refitr
+        return state
+
+    def restore(self, state, K=None):
+        """
+        Restore the state returned by state. If the (iterative) solver would
+        re-use its preconditioner at the next setup, the preconditioner is
+        rebuilt from K, which must be the matrix it was built from.
+
+        """
+        self._age = int(state['age'])
+        self._refitr = int(state['refitr']) if 'refitr' in state else None
+        for key in self.stats:
+            self.stats[key] = state[key]
+        if K is not None and not self.direct and 0 < self._age < self.reuse:
+            self.K = K
+            self._update(K)
+            self._setup(K)
+
+    def _rebuild(self):
+        if self._age == 0 or self._age >= self.reuse:
+            return True
+        if self.degrade and self._refitr and \
+            self.stats['iterations'] > self.degrade * self._refitr:
+            logger.debug('Rebuilding preconditioner, {} iterations (was '
+                         '{})'.format(self.stats['iterations'], self._refitr))
+            return True
+        return False
+
+    def _update(self, K):
+        pass
+
+    def _setup(self, K):
+        raise NotImplementedError
+
+    def _solve(self, b, x):
+        raise NotImplementedError
+
+    def _solve_block(self, b, x):
+        # One column at a time, all with the same factorisation or
+        # preconditioner; solvers that solve blocks at once override this:
+        numitr, relerr = 0, 0.0
+        for k in range(b.shape[1]):
+            xk = x[:, k].copy()
+            n, err = self._solve(b[:, k].copy(), xk)
+            x[:, k] = xk
+            numitr, relerr = numitr + n, max(relerr, err)
+        return numitr, relerr
+
+    def _attempt(self, b, x, reused):
+        # Solve, with at most 'degrade' times the iterations of the first
+        # solve after the last rebuild if the preconditioner is re-used:
+        maxiter = self.maxiter
+        if reused and self._refitr is not None:
+            self.maxiter = min(maxiter, max(1, int((self.degrade or \
+                STALE_ITERS) * self._refitr)))
+        try:
+            if np.ndim(b) == 2:
+                return self._solve_block(b, x)
+            return self._solve(b, x)
+        finally:
+            self.maxiter = maxiter
+
+    def _not_converged(self, numitr, relerr):
+        raise _NotConverged(numitr, relerr)
+
+    def _fail(self, e):
+        logger.error('{} error: residual {:.3e} at {} iterations'.format(
+            self.name, e.relerr, e.numitr))
+        raise Exception('Solution for FEA did not converge.')
+
+    def _residual(self, b, x):
+        if np.ndim(b) == 2: #  Largest of the columns
+            return max(self._residual(b[:, k], x[:, k]) for k in \
+                range(b.shape[1]))
+        bnorm = np.linalg.norm(b)
+        if bnorm == 0:
+            return np.linalg.norm(self.K.dot(x))
+        return np.linalg.norm(b - self.K.dot(x)) / bnorm
+
+
+# ======================
+# === Direct solvers ===
+# ======================
+@register_solver('splu')
+class SpluSolver(LinearSolver):
+    """
+    SciPy (SuperLU) sparse LU factorisation.
+
+    """
+    direct = True
+
+    def _setup(self, K):
+        self._lu = splu(K.tocsc())
+
+    def _solve(self, b, x):
+        x[:] = self._lu.solve(b)
+        return 0, self._residual(b, x)
+
+    _solve_block = _solve #  SuperLU solves blocks at once
+
+
+@register_solver('cholesky')
+class CholeskySolver(LinearSolver):
+    """
+    Sparse Cholesky factorisation by CHOLMOD (requires scikit-sparse).
+
+    """
+    direct = True
+
+    def __init__(self, **kwargs):
+        if cholesky is None:
+            raise ValueError('SOLVER = cholesky requires scikit-sparse, which '
+                             'is not installed.')
+        LinearSolver.__init__(self, **kwargs)
+
+    def _setup(self, K):
+        self._factor = cholesky(K.tocsc())
+
+    def _solve(self, b, x):
+        x[:] = self._factor(b)
+        return 0, self._residual(b, x)
+
+    _solve_block = _solve #  CHOLMOD solves blocks at once
+
+
+@register_solver('superlu')
+class PySparseLUSolver(LinearSolver):
+    """
+    PySparse SuperLU factorisation (requires PySparse).
+
+    """
+    direct = True
+
+    def __init__(self, **kwargs):
+        if spmatrix is None:
+            raise ValueError('SOLVER = superlu requires PySparse, which is '
+                             'not installed.')
+        LinearSolver.__init__(self, **kwargs)
+
+    def _setup(self, K):
+        self._lu = superlu.factorize(_ll_mat_sym(K).to_csr())
+
+    def _solve(self, b, x):
+        self._lu.solve(b, x)
+        return 0, self._residual(b, x)
+
+
+# =========================
+# === Iterative solvers ===
+# =========================
+@register_solver('cg')
+class CGSolver(LinearSolver):
+    """
+    Preconditioned conjugate gradient method, see PRECONS for the available
+    preconditioners (PRECON keyword, default 'jacobi').
+
+    """
+    default_precon = 'jacobi'
+    precons = None
+
+    def _setup(self, K):
+        self._M = _get_precon(self.precon)(K)
+
+    def _solve(self, b, x):
+        numitr, relerr = pcg(self.K, b, x, self._M, self.tol, self.maxiter)
+        if not relerr <= self.tol:
+            self._not_converged(numitr, relerr)
+        return numitr, relerr
+
+    def _solve_block(self, b, x):
+        # SciPy's sparse products of small blocks are no faster than one
+        # product per vector:
+        if b.shape[1] < BLOCK_MIN:
+            return LinearSolver._solve_block(self, b, x)
+        numitr, relerr = block_pcg(self.K, b, x, self._M, self.tol, \
+            self.maxiter)
+        if not relerr <= self.tol:
+            self._not_converged(numitr, relerr)
+        return numitr, relerr
+
+
+@register_solver('minres')
+class MinresSolver(CGSolver):
+    """
+    SciPy's MINRES method, preconditioned as for 'cg'.
+
+    """
+    _solve_block = LinearSolver._solve_block #  One column at a time
+
+    def _solve(self, b, x):
+        numitr = [0]
+        def callback(xk):
+            numitr[0] += 1
+        M = LinearOperator(self.K.shape, matvec=self._M, dtype=float)
+        # Tighten SciPy's tolerance (and restart) until the relative residual
+        # norm meets the tolerance:
+        tol = self.tol
+        while True:
+            kwargs = {_TOLKW: tol}
+            x[:], info = minres(self.K, b, x0=x, maxiter=self.maxiter - \
+                numitr[0], M=M, callback=callback, **kwargs)
+            relerr = self._residual(b, x)
+            if relerr <= self.tol:
+                return numitr[0], relerr
+            if numitr[0] >= self.maxiter or tol < 1e-16:
+                self._not_converged(numitr[0], relerr)
+            tol *= self.tol / relerr
+
+
+@register_solver('amg')
+class AMGSolver(CGSolver):
+    """
+    Conjugate gradient method preconditioned by a smoothed aggregation
+    algebraic multigrid V-cycle (requires pyamg).
+
+    """
+    default_precon = 'amg'
+
+
+@register_solver('matfree')
+class MatrixFreeCGSolver(CGSolver):
+    """
+    Conjugate gradient method with a matrix-free (element-by-element)
+    stiffness operator, see assembly.ElementOperator. Only the 'jacobi'
+    (default) and 'none' preconditioners are available.
+
+    """
+    matrix_free = True
+    precons = ('jacobi', 'none')
+    # Element-by-element products are no faster for blocks:
+    _solve_block = LinearSolver._solve_block
+
+
+@register_solver('mgcg')
+class MGCGSolver(LinearSolver):
+    """
+    Conjugate gradient method preconditioned by a geometric multigrid
+    V-cycle on the structured ToPy grid. The grid is coarsened by 2 in every
+    direction with an even number of elements (trilinear prolongation), the
+    coarse operators are Galerkin projections (P^T K P) of the constrained
+    matrix and the coarsest one is factorised. Smoothing is by damped Jacobi
+    sweeps, see MG_SMOOTH, MG_OMEGA and MG_COARSE. The V-cycle is its only
+    preconditioner (PRECON = mg).
+
+    """
+    default_precon = 'mg'
+    precons = ('mg',)
+
+    def set_grid(self, nelx, nely, nelz, dofpn, freedof):
+        self._P = _prolongators(nelx, nely, nelz, dofpn, freedof, MG_COARSE)
+        logger.info('Multigrid levels (DOF): {}'.format(', '.join( \
+            [str(freedof.size)] + [str(P.shape[1]) for P in self._P])))
+
+    def _setup(self, K):
+        self._A = [K]
+        for P in self._P:
+            self._A.append((P.T.dot(self._A[-1]).dot(P)).tocsr())
+        self._dinv = [MG_OMEGA / A.diagonal() for A in self._A[:-1]]
+        self._lu = splu(self._A[-1].tocsc())
+
+    def _solve(self, b, x):
+        numitr, relerr = pcg(self.K, b, x, self._vcycle, self.tol, \
+            self.maxiter)
+        if not relerr <= self.tol:
+            self._not_converged(numitr, relerr)
+        return numitr, relerr
+
+    def _solve_block(self, b, x):
+        if b.shape[1] < BLOCK_MIN:
+            return LinearSolver._solve_block(self, b, x)
+        numitr, relerr = block_pcg(self.K, b, x, self._vcycle, self.tol, \
+            self.maxiter)
+        if not relerr <= self.tol:
+            self._not_converged(numitr, relerr)
+        return numitr, relerr
+
+    def _vcycle(self, r, level=0):
+        """
+        Apply one (symmetric) V-cycle to r (a vector or a block of vectors),
+        starting at 'level'.
+
+        """
+        if level == len(self._P):
+            return self._lu.solve(r)
+        A, dinv, P = self._A[level], self._dinv[level], self._P[level]
+        if r.ndim == 2:
+            dinv = dinv[:, np.newaxis]
+        x = dinv * r
+        for i in range(MG_SMOOTH - 1):
+            x += dinv * (r - A.dot(x))
+        x += P.dot(self._vcycle(P.T.dot(r - A.dot(x)), level + 1))
+        for i in range(MG_SMOOTH):
+            x += dinv * (r - A.dot(x))
+        return x
+
+
+@register_solver('pysparse-pcg')
+class PySparsePCGSolver(LinearSolver):
+    """
+    PySparse's SSOR preconditioned conjugate gradient method (requires
+    PySparse).
+
+    """
+    default_precon = 'ssor'
+    precons = ('ssor',)
+
+    def __init__(self, **kwargs):
+        if spmatrix is None:
+            raise ValueError('SOLVER = pysparse-pcg requires PySparse, which '
+                             'is not installed.')
+        LinearSolver.__init__(self, **kwargs)
+
+    def _update(self, K):
+        self._K = _ll_mat_sym(K).to_sss()
+
+    def _setup(self, K):
+        self._M = precon.ssor(self._K) #  Preconditioned K
+
+    def _solve(self, b, x):
+        (info, numitr, relerr) = \
+        itsolvers.pcg(self._K, b, x, self.tol, self.maxiter, self._M)
+        if info < 0:
+            logger.debug('PySparse error: Type: {}, '
+                         'at {} iterations'.format(info, numitr))
+            self._not_converged(numitr, relerr)
+        return numitr, relerr
+
+
+def pcg(A, b, x, M, tol=TOL, maxiter=MAXITER):
+    """
+    Preconditioned conjugate gradient method. Solve A x = b, with x the
+    initial guess on entry (updated in place) and M a function that applies
+    the preconditioner to a vector. Return the number of iterations and the
+    relative residual norm.
+
+    """
+    bnorm = np.linalg.norm(b)
+    if bnorm == 0:
+        x[:] = 0
+        return 0, 0.0
+    r = b - A.dot(x)
+    relerr = np.linalg.norm(r) / bnorm
+    numitr = 0
+    if relerr <= tol:
+        return numitr, relerr
+    z = M(r)
+    p = z.copy()
+    rz = r.dot(z)
+    while numitr < maxiter:
+        numitr += 1
+        q = A.dot(p)
+        alpha = rz / p.dot(q)
+        x += alpha * p
+        r -= alpha * q
+        relerr = np.linalg.norm(r) / bnorm
+        if relerr <= tol:
+            break
+        z = M(r)
+        rz, rzold = r.dot(z), rz
+        p *= rz / rzold
+        p += z
+    return numitr, relerr
+
+def block_pcg(A, b, x, M, tol=TOL, maxiter=MAXITER):
+    """
+    Preconditioned conjugate gradient method for a block of right hand
+    sides, the columns of b, see pcg. The columns are solved simultaneously,
+    so every iteration multiplies A (and applies M) to a block of vectors at
+    once instead of one vector at a time; a column that has converged is
+    dropped from the block. Return the number of iterations (of the slowest
+    column) and the largest relative residual norm.
+
+    """
+    # The vectors are the (contiguous) rows of the arrays below, so that
+    # scaling them by a factor each is fast; A and M take columns:
+    def block(v):
+        return np.ascontiguousarray(v.T)
+    def matmul(v):
+        return block(A.dot(block(v)))
+    def dots(u, v):
+        return np.einsum('ij,ij->i', u, v)
+    bnorm = np.sqrt(dots(b.T, b.T))
+    x[:, bnorm == 0] = 0
+    bnorm[bnorm == 0] = 1
+    r = block(b) - matmul(block(x))
+    relerr = np.sqrt(dots(r, r)) / bnorm
+    numitr = 0
+    act = np.flatnonzero(relerr > tol) #  Vectors not converged
+    if not act.size:
+        return numitr, relerr.max()
+    xa, r, bnorm = block(x[:, act]), r[act], bnorm[act]
+    z = block(M(r.T))
+    p = z.copy()
+    rz = dots(r, z)
+    while numitr < maxiter:
+        numitr += 1
+        q = matmul(p)
+        alpha = (rz / dots(p, q))[:, np.newaxis]
+        xa += alpha * p
+        r -= alpha * q
+        err = np.sqrt(dots(r, r)) / bnorm
+        relerr[act] = err
+        keep = err > tol
+        if not keep.all():
+            x[:, act] = xa.T
+            if not keep.any():
+                break
+            act, xa, r, p = act[keep], xa[keep], r[keep], p[keep]
+            bnorm, rz = bnorm[keep], rz[keep]
+        z = block(M(r.T))
+        rz, rzold = dots(r, z), rz
+        p *= (rz / rzold)[:, np.newaxis]
+        p += z
+    else:
+        x[:, act] = xa.T
+    return numitr, relerr.max()
+
+
+# =======================
+# === Preconditioners ===
+# =======================
+# A preconditioner is applied to a vector or to a block of vectors (columns).
+def jacobi(K):
+    """
+    Diagonal (Jacobi) preconditioner.
+
+    """
+    dinv = 1 / K.diagonal()
+    dinvs = dinv[:, np.newaxis] #  Of a block
+    return lambda r: (dinvs if r.ndim == 2 else dinv) * r
+
+def ssor(K, omega=1.0):
+    """
+    Symmetric successive over-relaxation (SSOR) preconditioner, one sweep.
+    The triangular solves are done by SuperLU (no fill-in, no pivoting).
+
+    """
+    d = K.diagonal()
+    T = (tril(K, -1) * omega + diags(d)).tocsc()
+    lu = splu(T, permc_spec='NATURAL', diag_pivot_thresh=0.0, \
+        options={'SymmetricMode': True})
+    ds = d[:, np.newaxis] #  Of a block
+    fac = omega * (2 - omega)
+    def apply(r):
+        y = lu.solve(r) * (ds if r.ndim == 2 else d)
+        return fac * lu.solve(y, trans='T')
+    return apply
+
+def ilu(K):
+    """
+    Incomplete Cholesky preconditioner, M = (L D L^T)^-1. SciPy doesn't offer
+    incomplete Cholesky, so L (unit lower) and D (the diagonal of U) are
+    taken from SuperLU's threshold ILU of K without pivoting, in reverse
+    Cuthill-McKee order; U itself is discarded, so M is symmetric (and,
+    with |D|, positive definite) as CG requires.
+
+    """
+    q = reverse_cuthill_mckee(K.tocsr(), symmetric_mode=True)
+    fac = spilu(K.tocsr()[q][:, q].tocsc(), drop_tol=1e-3, fill_factor=10, \
+        diag_pivot_thresh=0.0, permc_spec='NATURAL', \
+        options={'SymmetricMode': True})
+    d = np.abs(fac.U.diagonal())
+    # Triangular solves with L and L^T (no fill-in, see ssor):
+    lu = splu(fac.L.tocsc(), permc_spec='NATURAL', diag_pivot_thresh=0.0, \
+        options={'SymmetricMode': True})
+    ds = d[:, np.newaxis] #  Of a block
+    def apply(r):
+        y = np.empty_like(r)
+        y[q] = lu.solve(lu.solve(r[q]) / (ds if r.ndim == 2 else d), \
+            trans='T')
+        return y
+    return apply
+
+def amg(K):
+    """
+    Smoothed aggregation algebraic multigrid V-cycle (requires pyamg).
+
+    """
+    if pyamg is None:
+        raise ValueError('PRECON = amg requires pyamg, which is not installed.')
+    ml = pyamg.smoothed_aggregation_solver(K.tocsr())
+    M = ml.aspreconditioner(cycle='V')
+    return M.dot #  matvec, or matmat for blocks
+
+def identity(K):
+    """
+    No preconditioning.
+
+    """
+    return lambda r: r.copy()
+
+PRECONS = {'jacobi': jacobi, 'ssor': ssor, 'ilu': ilu, 'amg': amg,
+           'none': identity}
+
+
+# =====================================
+# === Private functions and helpers ===
+# =====================================
+class _NotConverged(Exception):
+    """
+    Raised by a solver if a solve didn't converge, see LinearSolver.solve.
+
+    """
+    def __init__(self, numitr, relerr):
+        Exception.__init__(self, numitr, relerr)
+        self.numitr = numitr
+        self.relerr = relerr
+
+def _get_precon(name):
+    try:
+        return PRECONS[name]
+    except KeyError:
+        raise ValueError('Unknown preconditioner (PRECON): {}. Choose one of: '
+                         '{}'.format(name, ', '.join(sorted(PRECONS))))
+
+def _prolongators(nelx, nely, nelz, dofpn, freedof, minsize):
+    """
+    Return the list of prolongation matrices (fine to coarse) of the grid
+    hierarchy. Rows of the finest one are restricted to the free DOF, and
+    coarse DOF that don't interpolate to any (free) fine DOF are dropped.
+
+    """
+    Ps = []
+    keep = freedof
+    shape = (nelx, nely, nelz)
+    while keep.size > minsize:
+        coarse = tuple(n // 2 if n % 2 == 0 else n for n in shape)
+        if coarse == shape:
+            break
+        Px, Py, Pz = [_prolongation_1d(n, nc) for n, nc in zip(shape, coarse)]
+        # Node numbering: Y first, then X, then Z (see parser._e2sdofmapinit):
+        P = kron(Px, Py)
+        if nelz:
+            P = kron(Pz, P)
+        P = kron(P, speye(dofpn)).tocsr()[keep]
+        cols = np.flatnonzero(np.diff(P.tocsc().indptr))
+        P = P[:, cols].tocsr()
+        Ps.append(P)
+        keep = cols
+        shape = coarse
+    return Ps
+
+def _prolongation_1d(n, nc):
+    """
+    Linear interpolation from nc to n elements (n + 1 nodes), n = 2 * nc, or
+    the identity if n == nc.
+
+    """
+    if n == nc:
+        return speye(n + 1, format='csr')
+    rows = np.r_[np.arange(0, n + 1, 2), np.arange(1, n, 2), \
+        np.arange(1, n, 2)]
+    cols = np.r_[np.arange(nc + 1), np.arange(nc), np.arange(1, nc + 1)]
+    vals = np.r_[np.ones(nc + 1), 0.5 * np.ones(2 * nc)]
+    return csr_matrix((vals, (rows, cols)), shape=(n + 1, nc + 1))
+
+def _ll_mat_sym(K):
+    """
+    Convert a symmetric SciPy sparse matrix to a PySparse 'll_mat_sym' matrix
+    (only the lower triangle is stored), as required by the PySparse solvers.
+
+    """
+    Kl = tril(K, format='coo')
+    L = spmatrix.ll_mat_sym(K.shape[0], Kl.nnz)
+    L.put(Kl.data, Kl.row.astype(int), Kl.col.astype(int))
+    return L
+
+# EOF solvers.py
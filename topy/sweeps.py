@@ -0,0 +1,212 @@
+"""
+# =============================================================================
+# Optimise the variants of a problem given by a grid of parameter values,
+# e.g., a damping factor and filter radius study of the MBB beam:
+#
+#     sweep('beam_2d_reci.tpd', {'ETA': [0.4, 0.5], 'FILT_RAD': [1.5, 3]})
+#
+# The TPD file is read once and the variants share everything that doesn't
+# depend on the swept parameters: the element matrix, mesh connectivity and
+# sparsity pattern of the stiffness matrix (see Topology.set_top_params) and
+# the filters (see filters.get_filter). The variants are optimised
+# concurrently on a pool of threads, NumPy and SciPy release the GIL in their
+# kernels, and a table of the results is written when all are done.
+#
+# Author: William Hunter
+# Copyright (C) 2008, 2015, William Hunter.
+# =============================================================================
+"""
+import os
+import logging
+import threading
+import multiprocessing
+from itertools import product
+from multiprocessing.pool import ThreadPool
+from time import time
+
+from .utils import get_logger, format_table
+from .parser import tpd_file2config
+from .topology import Topology
+from .optimisation import optimise
+
+logger = get_logger(__name__)
+__all__ = ['sweep']
+
+
+SUMMARY = 'sweep.txt' #  File name of the table of results
+
+
+# ========================
+# === Public functions ===
+# ========================
+def sweep(fname, params, workers=None, outdir='./sweep', **kwargs):
+    """
+    Optimise every variant of the problem in the TPD file given by 'params',
+    a dictionary of TPD keys and lists of values: each combination of values
+    is a variant. The variants are optimised on 'workers' threads (default:
+    number of CPUs). The output of each variant (see optimise, by default
+    nothing is written) and its log go to a directory of its own in 'outdir'
+    (named after the variant number). Return a list with the result of every
+    variant (a dict with the parameter values and the keys 'variant',
+    'status', 'objfval', 'volume', 'iterations' and 'time'), in grid order;
+    the table of results is written to outdir/sweep.txt.
+
+    ADDITIONAL INPUTS (keyword arguments):
+        Passed to optimise, e.g., save=True or history='history.h5' (file
+        names are taken relative to the directory of each variant).
+
+    EXAMPLES:
+        >>> sweep('beam_2d_reci.tpd', {'ETA': [0.4, 0.5], 'P_FAC': [2, 3]})
+
+    """
+    if not os.path.exists(outdir):
+        os.makedirs(outdir)
+    kwargs.setdefault('save', False)
+    kwargs.setdefault('every', 0)
+    kwargs.setdefault('background', False) #  The pool keeps the cores busy
+    config = tpd_file2config(fname)
+    names = list(params)
+    jobs = []
+    for i, values in enumerate(product(*[params[name] for name in names])):
+        variant = dict(zip(names, values))
+        jobs.append((i, config, variant, os.path.join(outdir, '%03d' % i), \
+            kwargs))
+
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+    workers = min(workers, len(jobs)) or 1
+    logger.info('Sweep of %d variants of %s on %d threads' % (len(jobs), \
+        fname, workers))
+    shared = _Shared()
+    levels = _quiet()
+    ti = time()
+    results = [None] * len(jobs)
+    pool = ThreadPool(workers)
+    try:
+        for i, result in pool.imap_unordered(lambda job: _run_variant(job, \
+            shared), jobs):
+            results[i] = result
+    finally:
+        pool.close()
+        pool.join()
+        for handler, level in levels:
+            handler.setLevel(level)
+
+    table = _summary(names, results, time() - ti)
+    with open(os.path.join(outdir, SUMMARY), 'w') as f:
+        f.write(table)
+    logger.info('\n' + table)
+    return results
+
+
+# ===================================
+# === Private methods and helpers ===
+# ===================================
+class _Shared(object):
+    """
+    The set-up topologies of the sweep, one per mesh, whose invariant data
+    the other variants share.
+
+    """
+    def __init__(self):
+        self.topologies = []
+        self.lock = threading.Lock()
+
+    def set_top_params(self, t):
+        with self.lock:
+            for other in self.topologies:
+                if t._same_mesh(other):
+                    t.set_top_params(shared=other)
+                    return
+            t.set_top_params()
+            self.topologies.append(t)
+
+
+class _ThreadFilter(logging.Filter):
+    """
+    Pass the log records of one thread only.
+
+    """
+    def __init__(self):
+        logging.Filter.__init__(self)
+        self.ident = threading.current_thread().ident
+
+    def filter(self, record):
+        return record.thread == self.ident
+
+
+def _quiet():
+    """
+    Keep the log messages of the variants off the console: raise the level
+    of the handlers of the ToPy loggers to WARNING, return the old levels.
+
+    """
+    levels = []
+    for name, lg in list(logging.Logger.manager.loggerDict.items()):
+        if name.startswith('topy') and name != __name__ and \
+        isinstance(lg, logging.Logger):
+            for handler in lg.handlers:
+                levels.append((handler, handler.level))
+                handler.setLevel(logging.WARNING)
+    return levels
+
+def _run_variant(job, shared):
+    """
+    Optimise one variant, logging to <dir>/<dir>.log. Return the index of
+    the job and its result.
+
+    """
+    i, config, variant, dir, kwargs = job
+    result = dict(variant)
+    result.update({'variant': i, 'status': 'ok', 'objfval': float('nan'),
+                   'volume': float('nan'), 'iterations': 0, 'time': 0.0})
+    if not os.path.exists(dir):
+        os.makedirs(dir)
+    handler = logging.FileHandler(os.path.join(dir, \
+        os.path.basename(dir) + '.log'), 'w')
+    handler.setLevel(logging.INFO)
+    handler.addFilter(_ThreadFilter())
+    toplogger = logging.getLogger('topy')
+    toplogger.addHandler(handler)
+    kwargs = dict(kwargs, dir=dir)
+    for key in ('history', 'checkpoint'):
+        if kwargs.get(key):
+            kwargs[key] = os.path.join(dir, kwargs[key])
+    ti = time()
+    try:
+        config = dict(config)
+        config.update(variant)
+        t = Topology(config=config)
+        shared.set_top_params(t)
+        optimise(t, **kwargs)
+        stats = t.iteration_stats()
+        result['objfval'] = float(stats['objfval'])
+        result['volume'] = float(stats['volume'])
+        result['iterations'] = t.itercount
+    except Exception as e:
+        result['status'] = 'error: {}'.format(e)
+        logging.getLogger(__name__).exception('Variant %d (%s) failed' % (i, \
+            variant))
+    finally:
+        result['time'] = time() - ti
+        toplogger.removeHandler(handler)
+        handler.close()
+    return i, result
+
+def _summary(names, results, walltime):
+    """
+    Return the table of the results.
+
+    """
+    header = tuple(['Variant'] + names + ['Iter', 'Obj. func.', 'Volume', \
+        'Time (s)', 'Status'])
+    rows = [tuple(['%03d' % r['variant']] + [str(r[name]) for name in names] \
+        + [str(r['iterations']), '%.6e' % r['objfval'], '%.4f' % r['volume'], \
+        '%.1f' % r['time'], r['status']]) for r in results]
+    nfailed = sum(r['status'] != 'ok' for r in results)
+    cputime = sum(r['time'] for r in results)
+    return format_table(header, rows) + '\n\n%d variants (%d failed), wall ' \
+        'time %.1f s, total variant time %.1f s\n' % (len(results), nfailed, \
+        walltime, cputime)
+
+# EOF sweeps.py
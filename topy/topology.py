@@ -10,10 +10,15 @@
 import os
 
 import numpy as np
-from pysparse import superlu, itsolvers, precon
+from scipy.optimize import brentq
 
-from .utils import get_logger
-from .parser import tpd_file2dict, config2dict
+from .utils import get_logger, mirror
+from .parser import tpd_file2dict, config2dict, _dof_coords
+from .assembly import StiffnessMatrix, ElementOperator, element_dofs, \
+    spring_triplets
+from .solvers import TOL, MAXITER, get_solver, default_solver
+from .filters import get_filter
+from .mma import MMA, MOVE
 
 logger = get_logger(__name__)
 logger.info("Instantiated.")
@@ -24,11 +29,29 @@ MAX_ITERS = 250
 
 SOLID, VOID = 1.000, 0.001 #  Upper and lower bound value for design variables
 KDATUM = 0.1 #  Reference stiffness value of springs for mechanism synthesis
+# Contraction order of the element energies, (u_e Ke) first, then with v_e:
+EINSUM_PATH = ['einsum_path', (0, 1), (0, 1)]
 
 # Constants for exponential approximation:
 A_LOW = -3 #  Lower restriction on 'a' for exponential approximation
 A_UPP = -1e-5 #  Upper restriction on 'a' for exponential approximation
 
+# Objective function scale for MMA:
+MMA_SCALE = 100
+
+# Search for the Lagrange multiplier (lam) of the OC update:
+LAM_MIN, LAM_MAX = 1e-40, 1e40 #  Search range
+LAM_STEP = np.log(2) #  Initial step (of log(lam)) away from the previous lam
+LAM_TOL = 1e-8 #  Tolerance (of log(lam)), i.e., relative tolerance of lam
+
+# State of an optimisation saved by checkpoint and restored by resume (besides
+# that of the MMA optimiser and the linear solver), if it is set:
+CHECKPOINT_ATTRS = ('desvars', 'xphys', 'desvarsold', 'df', 'dfold', 'dv', \
+    'a', 'eta', 'p', 'q', 'beta', 'pcount', 'qcount', 'itercount', 'change', \
+    'svtfrac', 'objfval', 'lam', 'd', 'dfree', 'dout', 'dfreeout', \
+    '_dfreeprev', '_dfreeoutprev', '_objscale', '_precscale')
+MMA_ATTRS = ('low', 'upp', 'xold1', 'xold2', 'iteration', 'y', 'z', 'lam')
+
 
 # =======================
 # === ToPy base class ===
@@ -46,6 +69,7 @@ class Topology:
         self.itercount = itercount #  Internal counter
         self.change = change
         self.svtfrac = svtfrac
+        self.stats = {} #  Statistics of the last iteration
 
         if config:
             self.topydict = config2dict(config.copy())
@@ -73,11 +97,16 @@ class Topology:
         self.tpdfname = fname
         self.topydict = tpd_file2dict(fname)
 
-    def set_top_params(self):
+    def set_top_params(self, shared=None):
         """
         Set topology optimisation problem parameters (you must already have
         instantiated a Topology object).
 
+        If 'shared' is a topology (with its parameters set) of the same mesh,
+        e.g., another variant of a parameter sweep, its connectivity and the
+        sparsity pattern of its stiffness matrix are used rather than
+        computed again.
+
         EXAMPLES:
             >>> import topy
             >>> t = topy.Topology()
@@ -122,8 +151,15 @@ class Topology:
         self.fixdof = self.topydict['FIX_DOF'] #  Fixed dof vector
         self.loaddof = self.topydict['LOAD_DOF'] #  Loaded dof vector
         self.loadval = self.topydict['LOAD_VAL'] #  Loaded dof values
+        # Number of load cases and the weights of their objective function
+        # values (see LOAD_NODE_X_2 etc.):
+        self.loadcases = self.topydict.get('LOAD_CASES', 1)
+        self.loadweights = np.asarray(self.topydict.get('LOAD_WEIGHT', \
+            np.ones(self.loadcases)), dtype=float)
         self.Ke = self.topydict['ELEM_K'] #  Element stiffness matrix
-        self.K = self.topydict['K'] #  Global stiffness matrix
+        # Axes normal to the symmetry planes, if the problem was reduced to
+        # the part of the domain on one side of them (see SYMMETRY):
+        self.symmetry = self.topydict.get('SYMMETRY', '')
         if self.nelz:
             logger.info('Domain discretisation (NUM_ELEM_X x NUM_ELEM_Y x ' + \
                 'NUM_ELEM_Z) = %d x %d x %d' % (self.nelx, self.nely, self.nelz))
@@ -170,14 +206,37 @@ class Topology:
             self.desvars = np.zeros((self.nelz, self.nely, self.nelx)) + \
                 self.volfrac
         self.df = np.zeros_like(self.desvars) #  Derivatives of obj. func. (array)
-        self.freedof = np.setdiff1d(self.alldof, self.fixdof) #  Free DOF vector
-        self.r = np.zeros_like(self.alldof).astype(float) #  Load vector
-        self.r[self.loaddof] = self.loadval #  Assign load values at loaded dof
+        if shared is not None and not self._same_mesh(shared):
+            logger.info('Mesh differs from the shared topology, not shared')
+            shared = None
+        # Element to structure DOF map of all elements, built once:
+        if shared is not None:
+            self.edof = shared.edof
+        else:
+            self.edof = element_dofs(self.e2sdofmapi, self.dofpn, self.nelx, \
+                self.nely, self.nelz)
+        self._springs = None #  Extra (spring) terms of global K, if any
+        self.senschunk = self.topydict.get('SENS_CHUNK') #  Elements per block
+        # Sensitivity filter (weights), cached per grid and radius:
+        self._filter = get_filter(self.nelx, self.nely, self.nelz, \
+            self.filtrad, self.topydict.get('FILTER_METHOD', 'auto'), \
+            self.symmetry)
+        if shared is not None:
+            self.freedof = shared.freedof
+        else:
+            self.freedof = np.setdiff1d(self.alldof, self.fixdof) #  Free DOF
+        # Load vector, a block of one column per load case if more than one,
+        # so that all load cases are solved at once:
+        self.r = np.zeros((self.alldof.size, self.loadcases))
+        self.r[self.loaddof, 0] = self.loadval #  Load values at loaded dof
+        for k in range(2, self.loadcases + 1):
+            self.r[self.topydict['LOAD_DOF_%d' % k], k - 1] = \
+                self.topydict['LOAD_VAL_%d' % k]
+        if self.loadcases == 1:
+            self.r = self.r.reshape(-1)
         self.rfree = self.r[self.freedof] #  Modified load vector (free dof)
         self.d = np.zeros_like(self.r) #  Displacement vector
         self.dfree = np.zeros_like(self.rfree) #  Modified load vector (free dof)
-        # Determine which rows and columns must be deleted from global K:
-        self._rcfixed = np.where(np.in1d(self.alldof, self.fixdof), 0, 1)
 
         # Print this to screen, just so that the user knows what type of
         # problem is being solved:
@@ -219,18 +278,68 @@ class Topology:
             self.approx = None
         if self.approx == 'dquad':
             logger.info('Using diagonal quadratic approximation (APPROX = dquad)')
+        # (4) Sensitivity or density filter, the latter with optional
+        # Heaviside projection and continuation of its sharpness (beta):
+        self.filtertype = self.topydict.get('FILTER', 'sensitivity')
+        if self.filtertype not in ('sensitivity', 'density'):
+            raise ValueError('FILTER must be one of sensitivity or density.')
+        logger.info('Filter type (FILTER) = {}'.format(self.filtertype))
+        self.beta = self.topydict.get('HEAVISIDE')
+        if self.beta and self.filtertype != 'density':
+            raise ValueError('HEAVISIDE projection requires FILTER: density.')
+        self._betamax = self.topydict.get('BETA_MAX', self.beta)
+        self._betahold = self.topydict.get('BETA_HOLD', 0)
+        self._betacon = self.topydict.get('BETA_CON', 50)
+        self._heta = self.topydict.get('HEAVISIDE_ETA', 0.5)
+        if self.beta:
+            logger.info('Heaviside projection (HEAVISIDE) = %g, threshold = '
+                '%g' % (self.beta, self._heta))
         # (5) Set passive elements:
         self.pasv = self.topydict['PASV_ELEM']
-        if self.pasv.any():
+        if self.pasv.size:
             logger.info('Passive elements (PASV_ELEM) specified')
         else:
             logger.info('No passive elements (PASV_ELEM) specified')
         # (6) Set active elements:
         self.actv = self.topydict['ACTV_ELEM']
-        if self.actv.any():
+        if self.actv.size:
             logger.info('Active elements (ACTV_ELEM) specified')
         else:
             logger.info('No active elements (ACTV_ELEM) specified')
+        # Passive and active elements as masks in the design variables layout:
+        self._pasvmask = self._elem_mask(self.pasv)
+        self._actvmask = self._elem_mask(self.actv)
+        # Physical densities, i.e., the design variables seen by the FEA:
+        self.xphys = self._physical(self.desvars)
+        self.dv = np.ones_like(self.desvars) #  Derivatives of volume
+        self.lam = None #  Lagrange multiplier of the volume constraint
+        self._ocbuf = np.empty_like(self.desvars) #  Work array, OC update
+
+        # (7) Optimiser, one of 'oc' (optimality criteria, default) or 'mma'
+        # (method of moving asymptotes):
+        self.optimizer = self.topydict.get('OPTIMIZER', 'oc')
+        if self.optimizer not in ('oc', 'mma'):
+            raise ValueError('OPTIMIZER must be one of oc or mma.')
+        logger.info('Optimiser (OPTIMIZER) = {}'.format(self.optimizer))
+        if self.optimizer == 'mma':
+            # The sensitivity filter's sensitivities aren't exact derivatives,
+            # so MMA's change may never settle below CHG_STOP:
+            if self.filtertype != 'density' and \
+            'NUM_ITER' not in self.topydict:
+                raise ValueError('OPTIMIZER: mma needs NUM_ITER unless used '
+                                 'with FILTER: density.')
+            # Passive and active elements aren't design variables of MMA:
+            self._free = np.ones(self.desvars.shape, dtype=bool)
+            for mask in (self._pasvmask, self._actvmask):
+                if mask is not None:
+                    self._free &= ~mask
+            # Smaller move limit for compliant mechanism synthesis, see OC:
+            move = self.topydict.get('MMA_MOVE', \
+                0.1 if self.probtype == 'mech' else MOVE)
+            self._mma = MMA(int(self._free.sum()), 1, VOID, SOLID, move=move)
+            if self._qmax != 1:
+                logger.info('Grey-scale filter (Q_FAC) not used by MMA')
+            self._objscale = None
 
         # Set parameters for compliant mechanism synthesis, if they exist:
         if self.probtype == 'mech':
@@ -247,16 +356,53 @@ class Topology:
             self.rfreeout = self.rout[self.freedof]
             self.dout = np.zeros_like(self.rout)
             self.dfreeout = np.zeros_like(self.rfreeout)
-            ksin = np.ones(self.loaddof.shape, dtype='int') * KDATUM
-            ksout = np.ones(self.loaddofout.shape, dtype='int') * KDATUM
-            maskin = np.ones(self.loaddof.shape, dtype='int')
-            maskout = np.ones(self.loaddofout.shape, dtype='int')
-            if len(ksin) > 1:
-                self.K.update_add_mask_sym([ksin, ksin], self.loaddof, maskin)
-                self.K.update_add_mask_sym([ksout, ksout], self.loaddofout, maskout)
-            else:
-                self.K.update_add_mask_sym([ksin], self.loaddof, maskin)
-                self.K.update_add_mask_sym([ksout], self.loaddofout, maskout)
+            # Springs (of stiffness KDATUM) at the input and output nodes,
+            # those of the part of a symmetric domain (see _plane_weights):
+            scale = 2 ** len(self.symmetry)
+            ksin = spring_triplets(self.loaddof, KDATUM * scale, \
+                self._plane_weights(self.loaddof))
+            ksout = spring_triplets(self.loaddofout, KDATUM * scale, \
+                self._plane_weights(self.loaddofout))
+            self._springs = [np.r_[ksin[i], ksout[i]] for i in range(3)]
+
+        # Linear solver for the FEA, direct for 2D and iterative for 3D
+        # problems, unless specified:
+        solver = self.topydict.get('SOLVER', \
+            default_solver(self.dofpn < 3 and self.nelz == 0))
+        self.solver = get_solver(solver, \
+            tol=self.topydict.get('SOLVER_TOL', TOL), \
+            maxiter=self.topydict.get('SOLVER_MAXITER', MAXITER), \
+            precon=self.topydict.get('PRECON'), \
+            reuse=self.topydict.get('PRECON_REUSE', 1), \
+            degrade=self.topydict.get('PRECON_DEGRADE'))
+        self.solver.set_grid(self.nelx, self.nely, self.nelz, self.dofpn, \
+            self.freedof)
+        logger.info('Linear solver (SOLVER) = {}'.format(solver))
+        if self.solver.precon:
+            logger.info('Preconditioner (PRECON) = {}'.format( \
+                self.solver.precon))
+
+        # Sparsity pattern of the constrained global K, computed only once,
+        # or the matrix-free operator:
+        if shared is not None and isinstance(shared._Kfree, ElementOperator) \
+        == self.solver.matrix_free:
+            self._Kfree = shared._Kfree.copy()
+        elif self.solver.matrix_free:
+            self._Kfree = ElementOperator(self.edof, self.Ke, self.freedof, \
+                self.alldof.size, self._springs)
+        else:
+            self._Kfree = StiffnessMatrix(self.edof, self.Ke, self.freedof, \
+                self.alldof.size, self._springs)
+
+        # Initial guess for iterative solvers, one of 'none' (zero), 'last'
+        # (previous displacements) or 'extrap' (linear extrapolation of the
+        # previous two displacements):
+        self.warmstart = self.topydict.get('WARM_START', 'last')
+        if self.warmstart not in ('none', 'last', 'extrap'):
+            raise ValueError('WARM_START must be one of none, last or extrap.')
+        self._dfreeprev = None
+        self._dfreeoutprev = None
+        self._precscale = None #  Element scale factors of the preconditioner
 
     def fea(self):
         """
@@ -277,35 +423,29 @@ class Topology:
         if self.itercount >= MAX_ITERS:
             raise Exception('Maximum internal number of iterations exceeded!')
 
-        Kfree = self._updateK(self.K.copy())
-
-        if self.dofpn < 3 and self.nelz == 0: #  Direct solver
-            Kfree = Kfree.to_csr() #  Need CSR for SuperLU factorisation
-            lu = superlu.factorize(Kfree)
-            lu.solve(self.rfree, self.dfree)
+        scale = self._kscale()
+        rebuilds = self.solver.stats['rebuilds']
+        self.solver.setup(self._Kfree.update(scale))
+        if not self.solver.direct: #  Initial guesses
+            self._dfreeprev = self._warmstart(self.dfree, self._dfreeprev)
             if self.probtype == 'mech':
-                lu.solve(self.rfreeout, self.dfreeout)  # mechanism synthesis
-        else: #  Iterative solver for 3D problems
-            Kfree = Kfree.to_sss()
-            preK = precon.ssor(Kfree) #  Preconditioned Kfree
-            (info, numitr, relerr) = \
-            itsolvers.pcg(Kfree, self.rfree, self.dfree, 1e-8, 8000, preK)
-            if info < 0:
-                logger.error('PySparse error: Type: {}, '
-                             'at {} iterations'.format(info, numitr))
-                raise Exception('Solution for FEA did not converge.')
-            else:
-                logger.debug('ToPy: Solution for FEA converged after '
-                             '{} iterations'.format(numitr))
-            if self.probtype == 'mech':  # mechanism synthesis
-                (info, numitr, relerr) = \
-                itsolvers.pcg(Kfree, self.rfreeout, self.dfreeout, 1e-8, \
-                    8000, preK)
-                if info < 0:
-                    logger.error('PySparse error: Type: {}, '
-                                 'at {} iterations'.format(info, numitr))
-                    raise Exception('Solution for FEA of adjoint load '
-                                    'case did not converge.')
+                self._dfreeoutprev = self._warmstart(self.dfreeout, \
+                    self._dfreeoutprev)
+        if self.probtype == 'mech':  # mechanism synthesis
+            # The input and output (adjoint) loads as one block of right hand
+            # sides:
+            x = np.column_stack((self.dfree, self.dfreeout))
+            self.solver.solve(np.column_stack((self.rfree, self.rfreeout)), x)
+            self.dfree[:], self.dfreeout[:] = x.T
+        else:
+            self.solver.solve(self.rfree, self.dfree)
+        # A preconditioner rebuilt by setup or by a solve is of this
+        # iteration's matrix:
+        if self.solver.stats['rebuilds'] > rebuilds and not self.solver.direct:
+            self._precscale = scale #  To rebuild it on resume, see checkpoint
+        logger.debug('ToPy: Solution for FEA converged after {} iterations '
+                     '(residual {:.3e})'.format(self.solver.stats['iterations'],
+                     self.solver.stats['residual']))
 
         # Update displacement vectors:
         self.d[self.freedof] = self.dfree
@@ -317,7 +457,8 @@ class Topology:
     def filter_sens_sigmund(self):
         """
         Filter the design sensitivities using Sigmund's heuristic approach.
-        Return the filtered sensitivities.
+        Return the filtered sensitivities. The filter weights are computed
+        only once, see filters.py.
 
         EXAMPLES:
             >>> t.filter_sens_sigmund()
@@ -327,47 +468,34 @@ class Topology:
         """
         if not self.topydict:
             raise Exception('You must first load a TPD file!')
-        tmp = np.zeros_like(self.df)
-        rmin = int(np.floor(self.filtrad))
-        if self.nelz == 0:
-            U, V = np.indices((self.nelx, self.nely))
-            for i in range(self.nelx):
-                umin = np.maximum(i - rmin - 1, 0)
-                umax = np.minimum(i + rmin + 2, self.nelx + 1)
-                for j in range(self.nely):
-                    vmin = np.maximum(j - rmin - 1, 0)
-                    vmax = np.minimum(j + rmin + 2, self.nely + 1)
-                    u = U[umin: umax, vmin: vmax]
-                    v = V[umin: umax, vmin: vmax]
-                    dist = self.filtrad - np.sqrt((i - u) ** 2 + (j - v) ** 2)
-                    sumnumr = (np.maximum(0, dist) * self.desvars[v, u] *\
-                               self.df[v, u]).sum()
-                    sumconv = np.maximum(0, dist).sum()
-                    tmp[j, i] = sumnumr / (sumconv * self.desvars[j, i])
-        else:
-            rmin3 = rmin
-            U, V, W = np.indices((self.nelx, self.nely, self.nelz))
-            for i in xrange(self.nelx):
-                umin, umax = np.maximum(i - rmin - 1, 0),\
-                             np.minimum(i + rmin + 2, self.nelx + 1)
-                for j in xrange(self.nely):
-                    vmin, vmax = np.maximum(j - rmin - 1, 0),\
-                                 np.minimum(j + rmin + 2, self.nely + 1)
-                    for k in xrange(self.nelz):
-                        wmin, wmax = np.maximum(k - rmin3 - 1, 0),\
-                                     np.minimum(k + rmin3 + 2, self.nelz + 1)
-                        u = U[umin:umax, vmin:vmax, wmin:wmax]
-                        v = V[umin:umax, vmin:vmax, wmin:wmax]
-                        w = W[umin:umax, vmin:vmax, wmin:wmax]
-                        dist = self.filtrad - np.sqrt((i - u) ** 2 + (j - v) **\
-                               2 + (k - w) ** 2)
-                        sumnumr = (np.maximum(0, dist) * self.desvars[w, v, u] *\
-                                  self.df[w, v, u]).sum()
-                        sumconv = np.maximum(0, dist).sum()
-                        tmp[k, j, i] = sumnumr/(sumconv *\
-                        self.desvars[k, j, i])
+        self.df = self._filter.apply(self.desvars * self.df) / \
+            (self._filter.Hs * self.desvars)
 
-        self.df = tmp
+    def filter_sens_density(self):
+        """
+        Apply the chain rule to the design sensitivities (with respect to the
+        physical densities) when the density filter and Heaviside projection
+        are used, see FILTER and HEAVISIDE. The derivatives of the volume are
+        stored in dv. Uses the same filter weights as filter_sens_sigmund.
+
+        EXAMPLES:
+            >>> t.filter_sens_density()
+
+        See also: sens_analysis
+
+        """
+        if not self.topydict:
+            raise Exception('You must first load a TPD file!')
+        Hs = self._filter.Hs
+        xtilde = self._filter.apply(self.desvars) / Hs
+        dx = np.ones_like(xtilde) #  Derivatives of projection
+        if self.beta:
+            b, h = self.beta, self._heta
+            dx = (1 - VOID) * b * (1 - np.tanh(b * (xtilde - h)) ** 2) / \
+                (np.tanh(b * h) + np.tanh(b * (1 - h)))
+        dx = self._pasv_actv(dx, 0, 0)
+        self.df = self._filter.apply(self.df * dx / Hs)
+        self.dv = self._filter.apply(dx / Hs)
 
     def sens_analysis(self):
         """
@@ -382,56 +510,29 @@ class Topology:
         """
         if not self.topydict:
             raise Exception('You must first load a TPD file!')
-        tmp = self.df.copy()
         self.objfval  = 0.0 #  Objective function value
-        
-        # Prepare Supporting Variables
-        if self.nelz == 0: #  2D problem
-    
-            Y, X = np.indices((self.nely, self.nelx))
-            e2sdofmap = np.expand_dims(self.e2sdofmapi.reshape(-1,1), axis=1)
-            e2sdofmap = np.add(e2sdofmap, self.dofpn * (Y + X * (self.nely + 1)))
-            Qe = self.d[e2sdofmap]
-            QeK = np.tensordot(Qe, self.Ke, axes=(0,0))
-            Qe_T = np.swapaxes(Qe, 2, 1).T
-            QeKQe = np.einsum('mnk,mnk->mn', QeK, Qe_T)
-            
-        else: #  3D problem
-            
-            Z, Y, X = np.indices((self.nelz, self.nely, self.nelx))
-            X *= (self.nely + 1)
-            Z *= (self.nelx + 1) * (self.nely + 1)
-            e2sdofmap = np.expand_dims(self.e2sdofmapi.reshape(-1, 1, 1), axis=1)
-            e2sdofmap = np.add(e2sdofmap, self.dofpn * (X + Y + Z))
-            Qe = self.d[e2sdofmap]
-            QeK = np.tensordot(Qe, self.Ke, axes=(0,0))
-            Qe_T = np.swapaxes(Qe.T, 2, 0)
-            QeKQe = np.einsum('klmn,klmn->klm', QeK, Qe_T)
-        
+        # Element energies (mutual energies for mechanisms) from the cached
+        # connectivity:
+        if self.probtype == 'mech':
+            QeKQe = self._element_energies(self.d, self.dout)
+        else:
+            QeKQe = self._element_energies(self.d, self.d)
+
         # Update TMP
         if self.probtype == 'comp':
-            self.objfval += ((self.desvars ** self.p) * QeKQe).sum()
-            tmp = - self.p * self.desvars ** (self.p - 1) * QeKQe
+            self.objfval += ((self.xphys ** self.p) * QeKQe).sum()
+            tmp = - self.p * self.xphys ** (self.p - 1) * QeKQe
 
         elif self.probtype == 'heat':
-            obj = (VOID + (1 - VOID) * self.desvars ** self.p)
+            obj = (VOID + (1 - VOID) * self.xphys ** self.p)
             self.objfval += (obj * QeKQe).sum()
-            fac1 = - (1 - VOID) * self.p * self.desvars ** (self.p - 1)
+            fac1 = - (1 - VOID) * self.p * self.xphys ** (self.p - 1)
             tmp = fac1 * QeKQe
 
         elif self.probtype == 'mech':
             self.objfval = self.d[self.loaddofout].sum()
-            tmp = self.p * self.desvars ** (self.p - 1)
-            
-            if self.nelz == 0:
-                QeOut_T = np.swapaxes(self.dout[e2sdofmap], 2, 1).T
-                op = np.einsum('mnk,mnk->mn', QeK, QeOut_T)
-            else:
-                QeOut_T = np.swapaxes(self.dout[e2sdofmap].T, 2, 0)
-                op = np.einsum('klmn,klmn->klm', QeK, QeOut_T)
-            tmp *= op
-            
-            
+            tmp = self.p * self.xphys ** (self.p - 1) * QeKQe
+
         self.df = tmp
 
 
@@ -449,22 +550,7 @@ class Topology:
         """
         if not self.topydict:
             raise Exception('You must first load a TPD file!')
-        # 'p' stays constant for a specified number of iterations from start.
-        # 'p' is incremented, but not more than the maximum allowable value.
-        # If continuation parameters are not specified in the input file, 'p'
-        # will stay constant:
-        if self.pcount >= self._phold:
-            if (self.p + self._pincr) < self._pmax:
-                if (self.pcount - self._phold) % self._pcon == 0:
-                    self.p += self._pincr
-
-        if self.qcount >= self._qhold:
-            if (self.q + self._qincr) < self._qmax:
-                if (self.qcount - self._qhold) % self._qcon == 0:
-                    self.q += self._qincr
-
-        self.pcount += 1
-        self.qcount += 1
+        self._continuation()
 
         # Exponential approximation of eta (damping factor):
         if self.itercount > 1:
@@ -478,129 +564,445 @@ class Topology:
 
         self.dfold = self.df.copy()
         self.desvarsold = self.desvars.copy()
+        # Sensitivities scaled by the volume derivatives (density filter):
+        if self.filtertype == 'density':
+            df = self.df / np.maximum(self.dv, 1e-12)
+        else:
+            df = self.df
 
         # Change move limit for compliant mechanism synthesis:
         if self.probtype == 'mech':
             move = 0.1
         else:
             move = 0.2
-        lam1, lam2 = 0, 100e3
-        dims = self.desvars.shape
-        while (lam2 - lam1) / (lam2 + lam1) > 1e-8 and lam2 > 1e-40:
-            lammid = 0.5 * (lam1 + lam2)
-            if self.probtype == 'mech':
-                if self.approx == 'dquad':
-                    curv = - 1 / (self.eta * self.desvars) * self.df
-                    beta = np.maximum(self.desvars-(self.df + lammid)/curv, VOID)
-                    move_upper = np.minimum(move, self.desvars / 3)
-                    desvars = np.maximum(VOID, np.maximum((self.desvars - move),\
-                    np.minimum(SOLID,  np.minimum((self.desvars + move), \
-                    (self.desvars * np.maximum(1e-10, \
-                    (-self.df / lammid))**self.eta)**self.q))))
-                else:  # reciprocal or exponential
-                    desvars = np.maximum(VOID, np.maximum((self.desvars - move),\
-                    np.minimum(SOLID,  np.minimum((self.desvars + move), \
-                    (self.desvars * np.maximum(1e-10, \
-                    (-self.df / lammid))**self.eta)**self.q))))
-            else:  # compliance or heat
-                if self.approx == 'dquad':
-                    curv = - 1 / (self.eta * self.desvars) * self.df
-                    beta = np.maximum(self.desvars-(self.df + lammid)/curv, VOID)
-                    move_upper = np.minimum(move, self.desvars / 3)
-                    desvars = np.maximum(VOID, np.maximum((self.desvars - move),\
-                    np.minimum(SOLID,  np.minimum((self.desvars + move_upper), \
-                    beta**self.q))))
-                else:  # reciprocal or exponential
-                    desvars = np.maximum(VOID, np.maximum((self.desvars - move),\
-                    np.minimum(SOLID,  np.minimum((self.desvars + move), \
-                    (self.desvars * (-self.df / lammid)**self.eta)**self.q))))
-
+        # Bounds (move limits) of the updated design variables:
+        x = self.desvars
+        dquad = self.approx == 'dquad' and self.probtype != 'mech'
+        lower = np.maximum(VOID, x - move)
+        if dquad:
+            upper = np.minimum(SOLID, x + np.minimum(move, x / 3))
+            curv = - df / (self.eta * x)
+        else:
+            upper = np.minimum(SOLID, x + move)
+
+        def update(lam, out):
+            # Updated design variables for Lagrange multiplier lam, in 'out':
+            if dquad:
+                np.add(df, lam, out=out)
+                out /= curv
+                np.subtract(x, out, out=out)
+                np.maximum(out, VOID, out=out)
+            else:  # reciprocal or exponential
+                np.divide(df, -lam, out=out)
+                if self.probtype == 'mech':
+                    np.maximum(out, 1e-10, out=out)
+                out **= self.eta
+                out *= x
+            out **= self.q
+            np.clip(out, lower, upper, out=out)
             # Check for passive and active elements, modify updated x:
-            if self.pasv.any() or self.actv.any():
-                flatx = desvars.flatten()
-                idx = []
-                if self.nelz == 0:
-                    y, x = dims
-                    for j in range(x):
-                        for k in range(y):
-                            idx.append(k*x + j)
-                else:
-                    z, y, x = dims
-                    for i in range(z):
-                        for j in range(x):
-                            for k in range(y):
-                                idx.append(k*x + j + i*x*y)
-                if self.pasv.any():
-                    pasv = np.take(idx, self.pasv) #  new indices
-                    np.put(flatx, pasv, VOID) #  = zero density
-                if self.actv.any():
-                    actv = np.take(idx, self.actv) #  new indices
-                    np.put(flatx, actv, SOLID) #  = solid
-                desvars = flatx.reshape(dims)
-
-            if self.nelz == 0:
-                if desvars.sum() - self.nelx * self.nely * self.volfrac > 0:
-                    lam1 = lammid
-                else:
-                    lam2 = lammid
-            else:
-                if desvars.sum() - self.nelx * self.nely * self.nelz *\
-                self.volfrac > 0:
-                    lam1 = lammid
-                else:
-                    lam2 = lammid
-        self.lam = lammid
+            return self._pasv_actv(out)
+
+        def excess(t):
+            # Volume (of the physical densities) in excess of the allowed
+            # volume, for Lagrange multiplier exp(t), decreases with t:
+            desvars = update(np.exp(t), self._ocbuf)
+            if self.filtertype == 'density':
+                desvars = self._physical(desvars)
+            return desvars.sum() - x.size * self.volfrac
+
+        # Bracket the root of the (monotone) volume function, starting from
+        # the previous multiplier, and find it by Brent's method (in log(lam)):
+        tmin, tmax = np.log(LAM_MIN), np.log(LAM_MAX)
+        t = np.log(self.lam) if self.lam else 0.
+        step = LAM_STEP
+        t1, t2 = t - step, t + step
+        g1, g2 = excess(t1), excess(t2)
+        while g1 < 0 and t1 > tmin:
+            t2, g2 = t1, g1
+            step *= 2
+            t1 = max(t1 - step, tmin)
+            g1 = excess(t1)
+        while g2 > 0 and t2 < tmax:
+            t1, g1 = t2, g2
+            step *= 2
+            t2 = min(t2 + step, tmax)
+            g2 = excess(t2)
+        if g1 < 0: #  Volume constraint can't be met, or is inactive
+            t = t1
+        elif g2 > 0:
+            t = t2
+        else:
+            t = brentq(excess, t1, t2, xtol=LAM_TOL)
+        self.lam = np.exp(t)
+        self._set_desvars(update(self.lam, np.empty_like(x)))
 
-        self.desvars = desvars
+    def update_desvars_mma(self):
+        """
+        Update the design variables by means of the Method of Moving
+        Asymptotes (MMA), using the filtered sensitivities and the
+        constraints (see _constraints); return the updated design variables.
+        Passive and active elements are left out of the MMA problem.
 
-        # Change in design variables:
-        self.change = (np.abs(self.desvars - self.desvarsold)).max()
+        EXAMPLES:
+            >>> t.update_desvars_mma()
+
+        See also: sens_analysis, filter_sens_sigmund, update_desvars_oc
+
+        """
+        if not self.topydict:
+            raise Exception('You must first load a TPD file!')
+        self._continuation()
+        self.desvarsold = self.desvars.copy()
+        free = self._free
+        # Scale the objective to be of order MMA_SCALE on the whole domain
+        # (see _constraints), fixed in the first iteration:
+        if self._objscale is None:
+            self._objscale = MMA_SCALE / (self._parts() * \
+                np.abs(self.df * self.desvars).sum())
+        df0dx = self.df[free] * self._objscale
+        fval, dfdx = self._constraints()
+        desvars = self.desvars.copy()
+        desvars[free] = self._mma.update(desvars[free], df0dx, fval, \
+            dfdx[:, free.ravel()])
+        self.lam = self._mma.lam[0]
+        self._set_desvars(desvars)
+
+    def full_domain(self, x):
+        """
+        Return x (shaped like the design variables) on the whole domain of a
+        symmetric problem, i.e., mirrored in the symmetry planes (see
+        SYMMETRY), else x itself.
+
+        EXAMPLES:
+            >>> create_2d_imag(t.full_domain(t.xphys), prefix=t.probname)
+
+        """
+        return mirror(x, [-1 - 'xyz'.index(axis) for axis in self.symmetry])
+
+    def iteration_stats(self):
+        """
+        Return the statistics of the last iteration as a dictionary with
+        keys 'iteration', 'objfval', 'volume' (mean physical density),
+        'change', 'p', 'q', 'eta' (mean) and 'svtfrac' (solid plus void
+        fraction). The record is computed when asked for, once per iteration,
+        and stored in 'stats'.
+
+        EXAMPLES:
+            >>> t.iteration_stats()['svtfrac']
+
+        See also: update_desvars_oc, update_desvars_mma
+
+        """
+        if self.stats.get('iteration') != self.itercount:
+            nsv = np.count_nonzero(self.desvars == SOLID) + \
+                np.count_nonzero(self.desvars == VOID)
+            self.svtfrac = float(nsv) / self.desvars.size
+            self.stats = {'iteration': self.itercount,
+                          'objfval': self.objfval,
+                          'volume': self.xphys.mean(),
+                          'change': self.change,
+                          'p': self.p,
+                          'q': self.q,
+                          'eta': self.eta.mean(),
+                          'svtfrac': self.svtfrac}
+        return self.stats
+
+    def checkpoint(self, fname):
+        """
+        Save the state of the optimisation (design variables, continuation
+        counters, exponents of the approximation, state of the MMA optimiser
+        and of the linear solver, etc.) to a NumPy (npz) file. The file is
+        replaced atomically, so a run killed while writing it leaves the
+        previous checkpoint intact.
+
+        EXAMPLES:
+            >>> t.checkpoint('beam.ckpt.npz')
+
+        See also: resume
+
+        """
+        state = {'_shape': self.desvars.shape, '_probname': self.probname, \
+            '_optimizer': self.optimizer, '_filtertype': self.filtertype}
+        for name in CHECKPOINT_ATTRS:
+            value = getattr(self, name, None)
+            if value is not None:
+                state[name] = value
+        if self.optimizer == 'mma':
+            for name in MMA_ATTRS:
+                value = getattr(self._mma, name)
+                if value is not None:
+                    state['mma.' + name] = value
+        for key, value in self.solver.state().items():
+            state['solver.' + key] = value
+        tmpfname = fname + '.tmp'
+        with open(tmpfname, 'wb') as f:
+            np.savez(f, **state)
+            f.flush()
+            os.fsync(f.fileno())
+        getattr(os, 'replace', os.rename)(tmpfname, fname) #  Python 2: rename
+        logger.debug('Checkpoint of iteration %d written to %s' % \
+            (self.itercount, fname))
+
+    def resume(self, fname):
+        """
+        Restore the state of an optimisation saved by checkpoint, so that
+        optimise continues where it stopped, exactly as if the run was never
+        interrupted. Load and set the same problem (TPD file) first.
+
+        EXAMPLES:
+            >>> t = topy.Topology()
+            >>> t.load_tpd_file('filename.tpd')
+            >>> t.set_top_params()
+            >>> t.resume('beam.ckpt.npz')
+            >>> topy.optimise(t)
+
+        See also: checkpoint
 
-        # Solid-void fraction:
-        nr_s = self.desvars.flatten().tolist().count(SOLID)
-        nr_v = self.desvars.flatten().tolist().count(VOID)
-        self.svtfrac = (nr_s + nr_v) / self.desvars.size
+        """
+        if not self.topydict:
+            raise Exception('You must first load a TPD file!')
+        with np.load(fname) as data:
+            state = dict((key, data[key]) for key in data.files)
+        problem = (tuple(state['_shape']), str(state['_probname']), \
+            str(state['_optimizer']), str(state['_filtertype']))
+        if problem != (self.desvars.shape, self.probname, self.optimizer, \
+            self.filtertype):
+            raise ValueError('Checkpoint {} is of a different problem: '
+                             '{}'.format(fname, problem))
+        for name in CHECKPOINT_ATTRS:
+            if name in state:
+                setattr(self, name, _value(state[name]))
+            elif hasattr(self, name):
+                setattr(self, name, None)
+        if self.optimizer == 'mma':
+            for name in MMA_ATTRS:
+                setattr(self._mma, name, _value(state.get('mma.' + name)))
+        solverstate = dict((key[7:], _value(value)) for key, value in \
+            state.items() if key.startswith('solver.'))
+        K = None
+        if self._precscale is not None:
+            K = self._Kfree.update(self._precscale)
+        self.solver.restore(solverstate, K)
+        logger.info('Resumed from checkpoint %s at iteration %d' % (fname, \
+            self.itercount))
 
     # ===================================
     # === Private methods and helpers ===
     # ===================================
-    def _updateK(self, K):
-        """
-        Update the global stiffness matrix by looking at each element's
-        contribution i.t.o. design domain density and the penalisation factor.
-        Return unconstrained stiffness matrix.
-
-        """
-        if self.nelz == 0: #  2D problem
-            for elx in xrange(self.nelx):
-                for ely in xrange(self.nely):
-                    e2sdofmap = self.e2sdofmapi + self.dofpn *\
-                    (ely + elx * (self.nely + 1))
-                    if self.probtype == 'comp' or self.probtype == 'mech':
-                        updatedKe = self.desvars[ely, elx] ** self.p * self.Ke
-                    elif self.probtype == 'heat':
-                        updatedKe = (VOID + (1 - VOID) * \
-                        self.desvars[ely, elx] ** self.p) * self.Ke
-                    mask = np.ones(e2sdofmap.size, dtype=int)
-                    K.update_add_mask_sym(updatedKe, e2sdofmap, mask)
-        else: #  3D problem
-            for elz in xrange(self.nelz):
-                for elx in xrange(self.nelx):
-                    for ely in xrange(self.nely):
-                        e2sdofmap = self.e2sdofmapi + self.dofpn *\
-                                    (ely + elx * (self.nely + 1) + elz *\
-                                    (self.nelx + 1) * (self.nely + 1))
-                        if self.probtype == 'comp' or self.probtype == 'mech':
-                            updatedKe = self.desvars[elz, ely, elx] ** \
-                            self.p * self.Ke
-                        elif self.probtype == 'heat':
-                            updatedKe = (VOID + (1 - VOID) * \
-                            self.desvars[elz, ely, elx] ** self.p) * self.Ke
-                        mask = np.ones(e2sdofmap.size, dtype=int)
-                        K.update_add_mask_sym(updatedKe, e2sdofmap, mask)
-
-        K.delete_rowcols(self._rcfixed) #  Del constrained rows and columns
-        return K
+    def _continuation(self):
+        """
+        Update the continuation parameters p, q and beta, and their counters.
+
+        """
+        # 'p' stays constant for a specified number of iterations from start.
+        # 'p' is incremented, but not more than the maximum allowable value.
+        # If continuation parameters are not specified in the input file, 'p'
+        # will stay constant:
+        if self.pcount >= self._phold:
+            if (self.p + self._pincr) < self._pmax:
+                if (self.pcount - self._phold) % self._pcon == 0:
+                    self.p += self._pincr
+
+        if self.qcount >= self._qhold:
+            if (self.q + self._qincr) < self._qmax:
+                if (self.qcount - self._qhold) % self._qcon == 0:
+                    self.q += self._qincr
+
+        # Heaviside projection: 'beta' is doubled every BETA_CON iterations
+        # after BETA_HOLD iterations, up to BETA_MAX:
+        if self.beta and self.beta < self._betamax:
+            if self.itercount > self._betahold and \
+            (self.itercount - self._betahold) % self._betacon == 0:
+                self.beta = min(2 * self.beta, self._betamax)
+                logger.info('Heaviside projection beta = %g' % (self.beta))
+
+        self.pcount += 1
+        self.qcount += 1
+
+    def _plane_weights(self, dofs):
+        """
+        Return the weights of the DOF of the part of a symmetric domain, one
+        half for every symmetry plane its node is on (else 1). The part is
+        1 / 2 ** len(symmetry) of the whole domain, so loads and springs on
+        a plane are shared with the mirrored parts.
+
+        """
+        x, y, z, comp = _dof_coords(dofs, self.dofpn, self.nelx, self.nely)
+        coords = {'x': x, 'y': y, 'z': z}
+        nel = {'x': self.nelx, 'y': self.nely, 'z': self.nelz}
+        weights = np.ones(x.size)
+        for axis in self.symmetry:
+            weights[coords[axis] == nel[axis]] /= 2
+        return weights
+
+    def _same_mesh(self, other):
+        """
+        Return True if the other topology has the same mesh, element,
+        constraints and (for mechanism synthesis) springs.
+
+        """
+        keys = ('NUM_ELEM_X', 'NUM_ELEM_Y', 'NUM_ELEM_Z', 'DOF_PN', 'ELEM_K', \
+            'FIX_DOF', 'PROB_TYPE')
+        if self.topydict['PROB_TYPE'] == 'mech':
+            keys += ('LOAD_DOF', 'LOAD_DOF_OUT')
+        return all(np.array_equal(self.topydict[key], other.topydict[key]) \
+            for key in keys)
+
+    def _set_desvars(self, desvars):
+        """
+        Set the updated design variables and the physical densities, and
+        compute the change (the other statistics are computed on request,
+        see iteration_stats).
+
+        """
+        self.desvars = desvars
+        self.xphys = self._physical(desvars)
+
+        # Change in design variables:
+        self._ocbuf = np.subtract(desvars, self.desvarsold, out=self._ocbuf)
+        self.change = np.abs(self._ocbuf, out=self._ocbuf).max()
+
+    def _constraints(self):
+        """
+        Return the values (m) and derivatives (m x nel) of the constraints
+        of the MMA update, all of the form g(x) <= 0. Only the volume (of the
+        physical densities) is constrained, scaled by the allowed volume.
+
+        Of a symmetric problem, the objective and the constraints are divided
+        by the number of parts of the whole domain (see _parts), so that the
+        derivatives are those of the whole domain. The MMA subproblem isn't
+        invariant to scaling (its regularisation and interior point
+        tolerance are absolute), so MMA then optimises the part like the
+        whole domain.
+
+        """
+        volume = self.desvars.size * self.volfrac
+        fval = np.array([self.xphys.sum() / volume - 1]) / self._parts()
+        dfdx = self.dv.reshape(1, -1) / (self._parts() * volume)
+        return fval, dfdx
+
+    def _parts(self):
+        """
+        Return the number of parts (2, 4 or 8) of the whole domain of a
+        symmetric problem, see SYMMETRY, else 1.
+
+        """
+        return 2 ** len(self.symmetry)
+
+    def _element_energies(self, u, v):
+        """
+        Return u_e^T Ke v_e of every element, shaped like the design variables,
+        given the global vectors u and v; of blocks u and v (load cases), the
+        sum of the load cases' energies times their weights. Elements are
+        processed in blocks of SENS_CHUNK elements (all at once by default) to
+        cap peak memory.
+
+        """
+        nel = self.edof.shape[0]
+        chunk = self.senschunk or nel
+        energies = np.empty(nel)
+        for i in range(0, nel, chunk):
+            edof = self.edof[i:i + chunk]
+            ue = u[edof]
+            ve = ue if v is u else v[edof]
+            if u.ndim == 2:
+                energies[i:i + chunk] = np.einsum('eik,ij,ejk->ek', ue, \
+                    self.Ke, ve, optimize=EINSUM_PATH).dot(self.loadweights)
+            else:
+                energies[i:i + chunk] = np.einsum('ei,ij,ej->e', ue, \
+                    self.Ke, ve, optimize=EINSUM_PATH)
+        return energies.reshape(self.desvars.shape)
+
+    def _pasv_actv(self, v, pasv=VOID, actv=SOLID):
+        """
+        Set the values of the passive and active elements of v (shaped like
+        the design variables) to 'pasv' and 'actv', in place, using the masks
+        computed by set_top_params. Return v.
+
+        """
+        if self._pasvmask is not None:
+            v[self._pasvmask] = pasv
+        if self._actvmask is not None:
+            v[self._actvmask] = actv
+        return v
+
+    def _elem_mask(self, elems):
+        """
+        Return a boolean mask (shaped like the design variables) of the
+        elements numbered in 'elems', or None if there are none. Element
+        numbers run column-wise (Y first), then in Z, see template.tpd.
+
+        """
+        if not np.size(elems):
+            return None
+        dims = self.desvars.shape
+        mask = np.zeros(self.desvars.size, dtype=bool)
+        mask[elems] = True
+        # Column-wise numbering is Y fastest, the design variables X fastest:
+        return mask.reshape(dims[:-2] + dims[:-3:-1]).swapaxes(-1, -2).copy()
+
+    def _physical(self, x):
+        """
+        Return the physical densities of design variables x: x itself for the
+        sensitivity filter, else the filtered (and projected) densities, see
+        FILTER and HEAVISIDE.
+
+        """
+        if self.filtertype != 'density':
+            return x
+        xtilde = self._filter.apply(x) / self._filter.Hs
+        if self.beta:
+            b, h = self.beta, self._heta
+            xtilde = VOID + (1 - VOID) * (np.tanh(b * h) + \
+                np.tanh(b * (xtilde - h))) / (np.tanh(b * h) + \
+                np.tanh(b * (1 - h)))
+        return self._pasv_actv(xtilde)
+
+    def _warmstart(self, x, xprev):
+        """
+        Set the initial guess of an iterative solve in place, given x (the
+        last solution) and xprev (the solution before that, or None), as per
+        WARM_START. Return a copy of the last solution.
+
+        """
+        if self.warmstart == 'last':
+            return None
+        xlast = x.copy()
+        if self.warmstart == 'none':
+            x[:] = 0
+        elif xprev is not None: #  extrap
+            x += x - xprev
+        return xlast
+
+    def _kscale(self):
+        """
+        Return the scale factors of the element stiffness matrices, i.e., each
+        element's contribution to the global stiffness matrix i.t.o. design
+        domain density and the penalisation factor. The global matrix is
+        assembled by _Kfree.update (only the values of the precomputed
+        sparsity pattern are updated, see assembly.py).
+
+        """
+        if self.probtype == 'comp' or self.probtype == 'mech':
+            scale = self.xphys.ravel() ** self.p
+        elif self.probtype == 'heat':
+            scale = VOID + (1 - VOID) * self.xphys.ravel() ** self.p
+        return scale
+
+
+# ========================
+# === Module functions ===
+# ========================
+def _value(value):
+    """
+    Return a value loaded from a checkpoint: arrays as arrays, scalars as
+    Python scalars and None as None.
+
+    """
+    if value is None or np.ndim(value):
+        return value
+    return np.asarray(value).item()
 
 
 # EOF topology.py
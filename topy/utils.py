@@ -3,6 +3,8 @@ import logging
 import sys
 import os
 
+import numpy as np
+
 def get_logger(name):
     # type: (str) -> logging.Logger
     """Return a `Logger` instance for `name`."""
@@ -18,3 +20,22 @@ def get_data_file(source_file_name):
     path = list(os.path.split(source_file_name))
     path[-1] = path[-1].split('_')[0] + '.K'
     return os.path.join(*path)
+
+
+def format_table(header, rows):
+    # type: (tuple, list) -> str
+    """Return `rows` of strings as a table with aligned columns."""
+    rows = [header] + list(rows)
+    widths = [max(len(row[j]) for row in rows) for j in range(len(header))]
+    lines = ['  '.join(v.ljust(w) for v, w in zip(row, widths)).rstrip() \
+        for row in rows]
+    lines.insert(1, '-' * len(lines[0]))
+    return '\n'.join(lines)
+
+
+def mirror(x, axes):
+    # type: (np.ndarray, tuple) -> np.ndarray
+    """Return `x` followed by its mirror image along each of `axes`."""
+    for axis in axes:
+        x = np.concatenate((x, np.flip(x, axis)), axis)
+    return x
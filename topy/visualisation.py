@@ -6,22 +6,26 @@
 # Copyright (C) 2008, 2015, 2016, 2017 William Hunter.
 # =============================================================================
 """
-import os
 import sys
+import zlib
 from datetime import datetime
+from os import path
 
-from numpy import arange, asarray, hstack
-from pyvtk import CellData, LookupTable, Scalars, UnstructuredGrid, VtkData
+from numpy import arange, asarray, cumsum, full, hstack, newaxis, prod, \
+    unravel_index, zeros
 
-# Instruct matplotlib to use the 'Agg' if no display was detected, as matplotlib uses a GUI by default.
-#   From: https://stackoverflow.com/a/8258144/9954163.
-if not os.environ.get("DISPLAY"):
-    import matplotlib
-    matplotlib.use('Agg')
-from pylab import axis, close, cm, figure, imshow, savefig, title
+# Figures are drawn with Matplotlib's object-oriented API and the Agg
+# (image) backend, which doesn't need a display and is thread-safe (images
+# can be written on a background thread, see output.py):
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib import cm
 
-__all__ = ['create_2d_imag', 'create_3d_geom', 'node_nums_2d', 'node_nums_3d',
-'create_2d_msh','create_3d_msh']
+__all__ = ['create_2d_imag', 'create_3d_geom', 'create_pvd', 'node_nums_2d',
+'node_nums_3d', 'create_2d_msh','create_3d_msh']
+
+# Size of the blocks (bytes) in which data of VTK XML files is compressed:
+VTK_BLOCK = 2 ** 15
 
 def create_2d_imag(x, **kwargs):
     """
@@ -58,12 +62,13 @@ def create_2d_imag(x, **kwargs):
     # === Start of Matplotlib commands ===
     # ====================================
     # x = flipud(x) #  Check your matplotlibrc file; might plot upside-down...
-    figure() # open a figure
-    if kwargs.has_key('title'):
-        title(kwargs['title'])
-        imshow(-x, cmap=cm.gray, aspect='equal', interpolation='nearest')
-    imshow(-x, cmap=cm.gray, aspect='equal', interpolation='nearest')
-    axis('off')
+    fig = Figure()
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot(111)
+    if 'title' in kwargs:
+        ax.set_title(kwargs['title'])
+    ax.imshow(-x, cmap=cm.gray, aspect='equal', interpolation='nearest')
+    ax.axis('off')
     # ==================================
     # === End of Matplotlib commands ===
     # ==================================
@@ -75,8 +80,7 @@ def create_2d_imag(x, **kwargs):
     # Change the default filename based on keyword arguments, if necessary:
     fname = _change_fname(fname_dict, kwargs)
     # Save the domain as image:
-    savefig(fname, bbox_inches='tight')
-    close() # close the figure
+    fig.savefig(fname, bbox_inches='tight')
 
 def create_3d_geom(x, **kwargs):
     """
@@ -88,8 +92,11 @@ def create_3d_geom(x, **kwargs):
     1.0. Array entries with values below THRESHOLD are culled from the geometry
     (see source for details). A 'dd-mm-yyyy-HHhMM' timestamp is automatically
     added to the filename unless the function is called with the time='none'
-    keyword argument. Default, and only file type, is legacy VTK unstructured
-    grid file ('vtk' extension); it does not have to be specified.
+    keyword argument. Default file type is legacy VTK unstructured grid file
+    ('vtk' extension); it does not have to be specified. The other file type
+    is VTK XML image data ('vti' extension): the whole (regular) grid, with
+    the densities as single precision cell data, nothing is culled. These
+    files are much smaller and faster to write and read.
 
     INPUTS:
         x -- K-by-M-by-N array (depth x rows x columns)
@@ -100,6 +107,7 @@ def create_3d_geom(x, **kwargs):
     OPTIONAL INPUTS (keyword arguments):
         prefix -- A user given prefix for the file name; default is 'topy_3d'.
         filetype -- The visualisation file type, see above.
+        compress -- If True, zlib compress the data ('vti' only).
         iternum -- A number that will be appended after the filename; default
                    is 'nin'.
         time -- If 'none', then NO timestamp will be added.
@@ -108,6 +116,7 @@ def create_3d_geom(x, **kwargs):
         >>> create_3d_geom(x, iternum=12, prefix='mbb_beam')
         >>> create_3d_geom(x)
         >>> create_3d_geom(x, time='none')
+        >>> create_3d_geom(x, filetype='vti', compress=True)
 
     """
     # Set the filename component defaults:
@@ -117,7 +126,42 @@ def create_3d_geom(x, **kwargs):
     # Change the default filename based on keyword arguments, if necessary:
     fname = _change_fname(fname_dict, kwargs)
     # Save the domain as geometry:
-    _write_geom(x, fname)
+    _write_geom(x, fname, kwargs.get('compress', False))
+
+def create_pvd(fnames, fname, timesteps=None):
+    """
+    Create a ParaView data (PVD) file, a collection of VTK XML files, e.g.,
+    the 'vti' files of the iterations of an optimisation, which ParaView
+    loads as a time series.
+
+    INPUTS:
+        fnames -- The file names of the VTK XML files.
+        fname -- The file name of the PVD file.
+
+    OUTPUTS:
+        <filename>.pvd
+
+    OPTIONAL INPUTS (keyword arguments):
+        timesteps -- The time (e.g., iteration number) of each file; default
+                     is 0, 1, 2, ...
+
+    EXAMPLES:
+        >>> create_pvd(['beam_001.vti', 'beam_002.vti'], 'beam.pvd', [1, 2])
+
+    """
+    if timesteps is None:
+        timesteps = range(len(fnames))
+    dirname = path.dirname(path.abspath(fname))
+    lines = ['<?xml version="1.0"?>',
+             '<VTKFile type="Collection" version="0.1">',
+             '  <Collection>']
+    for t, f in zip(timesteps, fnames):
+        # Relative to the PVD file, so that the files can be moved together:
+        f = path.relpath(path.abspath(f), dirname)
+        lines.append('    <DataSet timestep="%s" part="0" file="%s"/>' % (t, f))
+    lines += ['  </Collection>', '</VTKFile>', '']
+    with open(fname, 'w') as f:
+        f.write('\n'.join(lines))
 
 def create_2d_msh(nelx, nely, fname):
     """
@@ -327,55 +371,120 @@ def _change_fname(fd, kwargs):
 
     return filename
 
-def _write_geom(x, fname):
+def _write_geom(x, fname, compress=False):
     '''
     Determines what geometry format (file type) to create.
     '''
     if fname.endswith('vtk', -3):
         _write_legacy_vtu(x, fname)
+    elif fname.endswith('vti', -3):
+        _write_vti(x, fname, compress)
     else:
-        print('Other file formats not implemented, only legacy VTK.')
+        print('Other file formats not implemented, only VTK (vtk and vti).')
         #_write_vrml2(x, fname) # future
 
 def _write_legacy_vtu(x, fname):
     """
-    Write a legacy VTK unstructured grid file.
+    Write a legacy VTK unstructured grid file (binary) of the voxels of x
+    above THRESHOLD. Neighbouring voxels share their nodes.
 
     """
     # Lower bound value used for pixel/voxel culling, any value below this
     # value won't be plotted. Should be same as VOID's value in 'topology.py'.
     THRESHOLD = 0.001
 
-    # Voxel local points relative to its centre of geometry:
-    voxel_local_points = asarray([[-1,-1,-1],[ 1,-1,-1],[-1, 1,-1],[ 1, 1,-1],
-                                [-1,-1, 1],[ 1,-1, 1],[-1, 1, 1],[ 1, 1, 1]])\
-                                  * 0.5 # scaling
-    # Voxel world points:
-    points = []
-    # Culled input array -- as list:
-    xculled = []
+    try:
+        depth, rows, columns = x.shape
+    except ValueError:
+        sys.exit('Array dimensions not equal to 3, possibly 2-dimensional.\n')
+
+    # Voxels above the threshold, and their densities:
+    mask = x > THRESHOLD
+    i, j, k = mask.nonzero()
+    xculled = x[mask]
+    # Node (a, b, c) is the corner at (a - 0.5, b - 0.5, c - 0.5) of the
+    # voxels centred at (i, j, k), numbered like the voxels:
+    nodes = (depth + 1, rows + 1, columns + 1)
+    voxel = (i * nodes[1] + j) * nodes[2] + k
+    # Local node offsets in VTK_VOXEL order (X changes fastest):
+    a, b, c = asarray([[0, 1, 0, 1, 0, 1, 0, 1],
+                       [0, 0, 1, 1, 0, 0, 1, 1],
+                       [0, 0, 0, 0, 1, 1, 1, 1]])
+    voxels = voxel[:, newaxis] + (a * nodes[1] + b) * nodes[2] + c
+    # Keep the nodes of the culled voxels only, and renumber them:
+    used = zeros(prod(nodes), dtype=bool)
+    used[voxels] = True
+    nodenums = cumsum(used) - 1
+    voxels = nodenums[voxels]
+    points = asarray(unravel_index(used.nonzero()[0], nodes)).T - 0.5
+
+    # Legacy VTK binary files are big-endian:
+    ncells = len(xculled)
+    cells = hstack([full((ncells, 1), 8), voxels])
+    with open(fname, 'wb') as f:
+        f.write(('# vtk DataFile Version 2.0\n'
+                 'ToPy data, created %s\n'
+                 'BINARY\n'
+                 'DATASET UNSTRUCTURED_GRID\n'
+                 'POINTS %d float\n' % (str(datetime.now()).rsplit('.')[0], \
+                 len(points))).encode('ascii'))
+        f.write(points.astype('>f4').tobytes())
+        f.write(('\nCELLS %d %d\n' % (ncells, cells.size)).encode('ascii'))
+        f.write(cells.astype('>i4').tobytes())
+        f.write(('\nCELL_TYPES %d\n' % ncells).encode('ascii'))
+        f.write(full(ncells, 11, dtype='>i4').tobytes()) #  VTK_VOXEL
+        f.write(('\nCELL_DATA %d\n'
+                 'SCALARS Densities double 1\n'
+                 'LOOKUP_TABLE default\n' % ncells).encode('ascii'))
+        f.write(xculled.astype('>f8').tobytes())
+        f.write(b'\n')
+
+def _write_vti(x, fname, compress=False):
+    """
+    Write a VTK XML image data file, with the densities as raw appended
+    (binary) cell data, zlib compressed if compress is True.
 
+    """
     try:
         depth, rows, columns = x.shape
     except ValueError:
         sys.exit('Array dimensions not equal to 3, possibly 2-dimensional.\n')
 
-    for i in xrange(depth):
-        for j in xrange(rows):
-            for k in xrange(columns):
-                if x[i,j,k] > THRESHOLD:
-                    xculled.append(x[i,j,k])
-                    points += (voxel_local_points + [i,j,k]).tolist()
-
-    voxels = arange(len(points)).reshape(len(xculled), 8).tolist()
-    topology = UnstructuredGrid(points, voxel = voxels)
-    file_header = \
-    'ToPy data, created '\
-    + str(datetime.now()).rsplit('.')[0]
-    scalars = CellData(Scalars(xculled, name='Densities', lookup_table =\
-    'default'))
-    vtk = VtkData(topology, file_header, scalars)
-    vtk.tofile(fname, 'binary')
+    # Same coordinates as the legacy files (X is depth), X changes fastest:
+    data = asarray(x, dtype='<f4').ravel(order='F').tobytes()
+    if compress:
+        blocks = [data[i:i + VTK_BLOCK] for i in range(0, len(data), \
+            VTK_BLOCK)]
+        blocks = [zlib.compress(b) for b in blocks]
+        # Header: number of blocks, block size, size of the last block and
+        # the compressed block sizes:
+        header = [len(blocks), VTK_BLOCK, len(data) - (len(blocks) - 1) * \
+            VTK_BLOCK if blocks else 0] + [len(b) for b in blocks]
+        data = b''.join(blocks)
+        compressor = ' compressor="vtkZLibDataCompressor"'
+    else:
+        header = [len(data)]
+        compressor = ''
+    extent = '0 %d 0 %d 0 %d' % (depth, rows, columns)
+    xml = ('<?xml version="1.0"?>\n'
+           '<VTKFile type="ImageData" version="1.0" byte_order="LittleEndian" '
+           'header_type="UInt64"%s>\n'
+           '  <ImageData WholeExtent="%s" Origin="-0.5 -0.5 -0.5" '
+           'Spacing="1 1 1">\n'
+           '    <Piece Extent="%s">\n'
+           '      <CellData Scalars="Densities">\n'
+           '        <DataArray type="Float32" Name="Densities" '
+           'format="appended" offset="0"/>\n'
+           '      </CellData>\n'
+           '    </Piece>\n'
+           '  </ImageData>\n'
+           '  <AppendedData encoding="raw">\n'
+           '   _' % (compressor, extent, extent))
+    with open(fname, 'wb') as f:
+        f.write(xml.encode('ascii'))
+        f.write(asarray(header, dtype='<u8').tobytes())
+        f.write(data)
+        f.write(b'\n  </AppendedData>\n</VTKFile>\n')
 
 def _timestamp():
     """